@@ -0,0 +1,73 @@
+"""Measure memory and parse time of sacct job records.
+
+Generates synthetic ``sacct --parsable2`` output and compares the
+dictionaries of :func:`usage_report.slurm.parse_sacct_records` with the
+:class:`usage_report.slurm.JobRecord` tuples of
+:func:`usage_report.slurm.parse_job_records`::
+
+    python benchmarks/job_records.py [--rows 200000]
+
+Memory is the size of all records held in a list as traced by
+``tracemalloc``, divided by the number of records.  The parse time of job
+records includes the conversion to typed fields, which consumers of the
+dictionaries do afterwards.
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from usage_report.slurm import (  # noqa: E402
+    SACCT_FIELDS,
+    parse_job_records,
+    parse_sacct_records,
+)
+
+
+def sacct_output(rows: int) -> str:
+    """Return *rows* lines of synthetic sacct output in ``SACCT_FIELDS`` order."""
+    lines = []
+    for i in range(rows):
+        day = 1 + i % 28
+        lines.append(
+            f"{1000000 + i}|{'lrz-gpu' if i % 3 else 'mcml-cpu'}|{3600 + i % 7200}|"
+            f"{1 + i % 64}|cpu={1 + i % 64},mem={4000 + i % 9000}M,gres/gpu={i % 4}|"
+            f"2025-01-{day:02d}T08:00:00|2025-01-{day:02d}T{9 + i % 12:02d}:30:00"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def measure(name: str, parse, text: str) -> None:
+    gc.collect()
+    tracemalloc.start()
+    begin = time.perf_counter()
+    records = list(parse(text))
+    elapsed = time.perf_counter() - begin
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    count = len(records)
+    print(
+        f"{name:<12} {count:>9} {size / count:>10.0f} {elapsed * 1e6 / count:>10.2f}"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=200000, help="Number of sacct lines")
+    args = parser.parse_args(argv)
+
+    text = sacct_output(args.rows)
+    print(f"{'records':<12} {'rows':>9} {'bytes/rec':>10} {'us/rec':>10}")
+    measure("dict", lambda t: parse_sacct_records(t, SACCT_FIELDS), text)
+    measure("JobRecord", lambda t: parse_job_records(t, SACCT_FIELDS), text)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,101 @@
+"""Measure the cold-start import cost of the ``usage`` command.
+
+Runs each scenario in a fresh interpreter with ``python -X importtime`` and
+reports the total import time, the share spent in ``usage_report`` modules
+and the wall-clock time of the whole invocation::
+
+    python benchmarks/startup.py [--repeat 5] [--max-ms 150]
+
+With ``--max-ms`` the script exits with status 1 if the median import time of
+any scenario exceeds the given budget, which makes it usable as a CI or
+monitoring check.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+
+SCENARIOS = {
+    "usage --help": ["--help"],
+    "usage report list": ["report", "list"],
+}
+
+
+def parse_importtime(stderr: str) -> tuple[float, float, list[str]]:
+    """Return total and ``usage_report`` import time in ms plus module names."""
+    total_us = 0
+    own_us = 0
+    modules: list[str] = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        self_us = int(fields[0])
+        name = fields[2].rstrip()
+        stripped = name.strip()
+        modules.append(stripped)
+        total_us += self_us
+        if stripped.startswith("usage_report"):
+            own_us += self_us
+    return total_us / 1000, own_us / 1000, modules
+
+
+def run_scenario(args: list[str], cwd: str) -> tuple[float, float, float, list[str]]:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        p for p in (str(ROOT), env.get("PYTHONPATH", "")) if p
+    )
+    cmd = [sys.executable, "-X", "importtime", "-m", "usage_report.cli", *args]
+    begin = time.perf_counter()
+    proc = subprocess.run(cmd, capture_output=True, text=True, cwd=cwd, env=env)
+    wall_ms = (time.perf_counter() - begin) * 1000
+    total_ms, own_ms, modules = parse_importtime(proc.stderr)
+    return total_ms, own_ms, wall_ms, modules
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per scenario")
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        help="Fail if the median import time of a scenario exceeds this",
+    )
+    parser.add_argument(
+        "--show-modules",
+        action="store_true",
+        help="List the usage_report modules imported by each scenario",
+    )
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'scenario':<20} {'imports ms':>10} {'own ms':>8} {'wall ms':>8}")
+    with tempfile.TemporaryDirectory() as cwd:
+        for name, cli_args in SCENARIOS.items():
+            results = [run_scenario(cli_args, cwd) for _ in range(args.repeat)]
+            total = statistics.median(r[0] for r in results)
+            own = statistics.median(r[1] for r in results)
+            wall = statistics.median(r[2] for r in results)
+            print(f"{name:<20} {total:>10.1f} {own:>8.1f} {wall:>8.1f}")
+            if args.show_modules:
+                own_modules = sorted(
+                    {m for m in results[-1][3] if m.startswith("usage_report")}
+                )
+                print("    " + ", ".join(own_modules))
+            if args.max_ms is not None and total > args.max_ms:
+                failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,6 +1,9 @@
 from __future__ import annotations
 import sys, pathlib; sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
 
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest import mock
 from urllib import error
 
@@ -61,7 +64,7 @@ def test_fetch_user_request_headers(monkeypatch):
     api = SimAPI()
     captured = {}
 
-    def fake_urlopen(req):
+    def fake_urlopen(req, timeout=None):
         captured["url"] = req.full_url
         captured["auth"] = req.headers.get("Authorization")
         captured["accept"] = req.headers.get("Accept")
@@ -75,3 +78,136 @@ def test_fetch_user_request_headers(monkeypatch):
     assert captured["url"].endswith("testuser")
     assert captured["auth"].startswith("Basic ")
     assert captured["accept"] == "application/json"
+
+
+class _SimHandler(BaseHTTPRequestHandler):
+    body = b'{"kennung": "testuser", "projekt": "proj"}'
+    etag = '"v1"'
+    requests: list = []
+
+    def do_GET(self):
+        self.requests.append(dict(self.headers))
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.send_header("ETag", self.etag)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("ETag", self.etag)
+        self.send_header("Last-Modified", "Mon, 02 Jun 2025 10:00:00 GMT")
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sim_server():
+    _SimHandler.requests = []
+    server = HTTPServer(("127.0.0.1", 0), _SimHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/user/"
+    server.shutdown()
+    server.server_close()
+
+
+def _cached_api(base_url, db, max_age):
+    api = SimAPI(cache_db=db, max_age=max_age)
+    api.BASE_URL = base_url
+    api._auth = ("u", "p")
+    return api
+
+
+def test_fetch_user_revalidates_cached_record(sim_server, tmp_path, caplog):
+    import logging
+
+    from usage_report.database import load_sim_record
+
+    db = tmp_path / "usage.db"
+    api = _cached_api(sim_server, db, max_age=0)
+    assert api.fetch_user("testuser")["projekt"] == "proj"
+    record = load_sim_record("testuser", db_path=db)
+    assert record["etag"] == '"v1"'
+    assert record["last_modified"] == "Mon, 02 Jun 2025 10:00:00 GMT"
+
+    with caplog.at_level(logging.DEBUG, logger="usage_report.api"):
+        assert api.fetch_user("testuser")["projekt"] == "proj"
+    second = _SimHandler.requests[-1]
+    assert second["If-None-Match"] == '"v1"'
+    assert second["If-Modified-Since"] == "Mon, 02 Jun 2025 10:00:00 GMT"
+    assert f"saved {len(_SimHandler.body)} bytes" in caplog.text
+    assert load_sim_record("testuser", db_path=db)["fetched"] >= record["fetched"]
+
+
+def test_fetch_user_uses_fresh_record_without_request(sim_server, tmp_path):
+    db = tmp_path / "usage.db"
+    api = _cached_api(sim_server, db, max_age=3600)
+    api.fetch_user("testuser")
+    api.fetch_user("testuser")
+    assert len(_SimHandler.requests) == 1
+    assert "If-None-Match" not in _SimHandler.requests[0]
+
+
+class _RateLimitedHandler(BaseHTTPRequestHandler):
+    capacity = 4
+    lock = threading.Lock()
+    active = 0
+    accepted = 0
+    rejected = 0
+
+    def do_GET(self):
+        cls = type(self)
+        with cls.lock:
+            overloaded = cls.active >= cls.capacity
+            if overloaded:
+                cls.rejected += 1
+            else:
+                cls.active += 1
+        if overloaded:
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+        try:
+            time.sleep(0.01)
+            body = b'{"kennung": "%s"}' % self.path.rsplit("/", 1)[-1].encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.end_headers()
+            self.wfile.write(body)
+        finally:
+            with cls.lock:
+                cls.active -= 1
+                cls.accepted += 1
+
+    def log_message(self, *args):
+        pass
+
+
+def test_limiter_adapts_to_rate_limited_server():
+    from concurrent.futures import ThreadPoolExecutor
+    from http.server import ThreadingHTTPServer
+
+    from usage_report.limiter import AIMDLimiter
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _RateLimitedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    limiter = AIMDLimiter(initial=1, maximum=16)
+    api = SimAPI(limiter=limiter, retries=20, backoff=0.01)
+    api.BASE_URL = f"http://127.0.0.1:{server.server_port}/user/"
+    api._auth = ("u", "p")
+    users = [f"user{i}" for i in range(80)]
+    try:
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            results = list(pool.map(api.fetch_user, users))
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert [r["kennung"] for r in results] == users
+    assert _RateLimitedHandler.accepted == 80
+    # parallelism was raised until the rate limit was hit and then backed off
+    assert _RateLimitedHandler.rejected > 0
+    assert 1 <= limiter.limit < 16
@@ -26,12 +26,24 @@ def test_report_user_alias():
     assert args.month == "2025-06"
 
 
+def test_report_user_alias_after_global_options():
+    from usage_report.cli import parse_args
+
+    for argv in (
+        ["--format", "json", "report", "u1", "--month", "2024-03"],
+        ["--debug", "--format=json", "report", "u1", "--month", "2024-03"],
+    ):
+        args = parse_args(argv)
+        assert args.report_cmd == "user" and args.user_id == "u1"
+        assert args.output_format == "json" and args.month == "2024-03"
+
+
 def test_report_active_legacy(monkeypatch):
     from usage_report import cli
     legacy = [{"user1": 1.0}]
     monkeypatch.setattr(cli, "load_month", lambda month, partitions=None: legacy)
     called = {}
-    def fake_create(start, end, partitions=None, netrc_file=None):
+    def fake_create(start, end, partitions=None, netrc_file=None, **kwargs):
         called['yes'] = True
         return [{"kennung": "u1"}]
     monkeypatch.setattr(cli, "create_active_reports", fake_create)
@@ -47,7 +59,7 @@ def test_report_active_netrc(monkeypatch):
     monkeypatch.setattr(cli, "load_month", lambda *a, **k: None)
     captured = {}
 
-    def fake_create(start, end, partitions=None, netrc_file=None):
+    def fake_create(start, end, partitions=None, netrc_file=None, **kwargs):
         captured["netrc"] = netrc_file
         return []
 
@@ -256,7 +268,7 @@ def test_report_active_sort(monkeypatch):
     def fake_print(rows, *a, **kw):
         captured.update(kw)
 
-    monkeypatch.setattr(cli, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda m, r, **k: r)
     monkeypatch.setattr(cli, "print_usage_table", fake_print)
 
     cli.main([
@@ -280,7 +292,7 @@ def test_report_active_sort_ignore(monkeypatch):
 
     called = {}
 
-    def fake_create(start, end, partitions=None, netrc_file=None):
+    def fake_create(start, end, partitions=None, netrc_file=None, **kwargs):
         called["created"] = True
         return []
 
@@ -307,6 +319,62 @@ def test_report_active_sort_ignore(monkeypatch):
     assert captured.get("sort_key") is None
 
 
+def test_report_active_user_list_is_the_roster(monkeypatch, capsys):
+    from usage_report import cli
+
+    captured = {}
+
+    def fake_create(start, end, **kwargs):
+        captured.update(kwargs)
+        return []
+
+    monkeypatch.setattr(cli, "create_active_reports", fake_create)
+    monkeypatch.setattr(cli, "print_usage_table", lambda rows, *a, **k: None)
+    cli.main([
+        "report", "active", "-S", "2025-06-01", "--cluster", "c1",
+        "--user-list", "u1,u2", "-u", "u3", "--roster", "list",
+    ])
+    assert captured["users"] == ["u3", "u1", "u2"]
+    assert captured["roster"] == "list"
+
+    # months collected for some users only would be stored as complete
+    assert cli.main(["report", "active", "--month", "2025-06", "-u", "u1"]) == 1
+    assert "--user cannot be used with --month" in capsys.readouterr().err
+    assert cli.main(["report", "active", "-S", "2025-06-01", "--roster", "list"]) == 1
+
+
+def test_report_show_where(monkeypatch, capsys):
+    import pytest
+    from usage_report import cli
+    from usage_report.rows import RowFilter
+
+    args = cli.parse_args([
+        "report", "show", "--month", "2025-06",
+        "--where", "projekt=pn12*", "--where", "gpu_hours>=100",
+    ])
+    assert args.where == [
+        RowFilter("projekt", "=", "pn12*"), RowFilter("gpu_hours", ">=", 100.0)
+    ]
+    captured = {}
+
+    def fake_query(request):
+        captured["request"] = request
+        return None
+
+    def fake_tables(month, **kwargs):
+        captured["where"] = kwargs["where"]
+        return []
+
+    monkeypatch.setattr(cli, "query_daemon", fake_query)
+    monkeypatch.setattr(cli, "load_stored_tables", fake_tables)
+    cli.main(["report", "show", "--month", "2025-06", "--where", "kennung=ab*"])
+    assert captured["request"]["where"] == [["kennung", "=", "ab*"]]
+    assert captured["where"] == [RowFilter("kennung", "=", "ab*")]
+    with pytest.raises(SystemExit):
+        cli.parse_args(["report", "show", "--month", "2025-06", "--where", "email=x"])
+    assert "unknown column" in capsys.readouterr().err
+
+
 def test_parse_multi_month_aggregate():
     from usage_report.cli import parse_args
 
@@ -387,7 +455,7 @@ def test_active_aggregate(monkeypatch):
     monkeypatch.setattr(cli, "load_month", lambda m, partitions=None: months[m])
     monkeypatch.setattr(cli, "create_active_reports", lambda *a, **k: [])
     monkeypatch.setattr(cli, "store_month", lambda *a, **k: None)
-    monkeypatch.setattr(cli, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda m, r, **k: r)
 
     captured = {}
 
@@ -435,7 +503,7 @@ def test_active_aggregate_all(monkeypatch):
     monkeypatch.setattr(cli, "load_month", lambda m, partitions=None: months[m])
     monkeypatch.setattr(cli, "create_active_reports", lambda *a, **k: [])
     monkeypatch.setattr(cli, "store_month", lambda *a, **k: None)
-    monkeypatch.setattr(cli, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda m, r, **k: r)
 
     captured = {}
 
@@ -485,7 +553,7 @@ def test_active_aggregate_group(monkeypatch):
     monkeypatch.setattr(cli, "aggregate_rows", fake_aggregate)
     monkeypatch.setattr(cli, "create_active_reports", lambda *a, **k: [])
     monkeypatch.setattr(cli, "store_month", lambda *a, **k: None)
-    monkeypatch.setattr(cli, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda m, r, **k: r)
     monkeypatch.setattr(cli, "print_usage_table", lambda *a, **k: None)
 
     cli.main(["report", "active", "--month", "2025-06", "--aggregate", "groups"])
@@ -512,7 +580,7 @@ def test_active_aggregate_group_sort(monkeypatch):
     monkeypatch.setattr(cli, "load_month", lambda *a, **k: sample)
     monkeypatch.setattr(cli, "create_active_reports", lambda *a, **k: [])
     monkeypatch.setattr(cli, "store_month", lambda *a, **k: None)
-    monkeypatch.setattr(cli, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda m, r, **k: r)
 
     monkeypatch.setattr(cli, "aggregate_rows", lambda *a, **k: sample)
 
@@ -556,7 +624,7 @@ def test_active_output_partition(monkeypatch):
     monkeypatch.setattr(cli, "load_month", lambda *a, **k: sample)
     monkeypatch.setattr(cli, "create_active_reports", lambda *a, **k: [])
     monkeypatch.setattr(cli, "store_month", lambda *a, **k: None)
-    monkeypatch.setattr(cli, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda m, r, **k: r)
 
     captured = {}
 
@@ -581,7 +649,7 @@ def test_active_output_partition_all(monkeypatch):
     monkeypatch.setattr(cli, "load_month", lambda *a, **k: sample)
     monkeypatch.setattr(cli, "create_active_reports", lambda *a, **k: [])
     monkeypatch.setattr(cli, "store_month", lambda *a, **k: None)
-    monkeypatch.setattr(cli, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda m, r, **k: r)
 
     captured = {}
 
@@ -634,13 +702,13 @@ def test_active_plot_call(monkeypatch):
     monkeypatch.setattr(cli, "load_month", lambda *a, **k: sample)
     monkeypatch.setattr(cli, "create_active_reports", lambda *a, **k: [])
     monkeypatch.setattr(cli, "store_month", lambda *a, **k: None)
-    monkeypatch.setattr(cli, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda m, r, **k: r)
     monkeypatch.setattr(cli, "aggregate_rows", lambda *a, **k: sample)
     monkeypatch.setattr(cli, "print_usage_table", lambda *a, **k: None)
 
     called = {}
 
-    def fake_plot(rows, column, *, start=None, end=None, title=None):
+    def fake_plot(rows, column, *, start=None, end=None, title=None, **kwargs):
         called["column"] = column
         called["start"] = start
         called["end"] = end
@@ -712,7 +780,7 @@ def test_active_aggregate_all_ignore_user(monkeypatch):
     monkeypatch.setattr(cli, "load_month", lambda m, partitions=None: months[m])
     monkeypatch.setattr(cli, "create_active_reports", lambda *a, **k: [])
     monkeypatch.setattr(cli, "store_month", lambda *a, **k: None)
-    monkeypatch.setattr(cli, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda m, r, **k: r)
 
     captured = {}
 
@@ -737,3 +805,313 @@ def test_active_aggregate_all_ignore_user(monkeypatch):
     jun = next(r for r in captured["rows"] if r["month"] == "2025-06")
     assert may["gpu_hours"] == 2.0
     assert jun["gpu_hours"] == 4.0
+
+
+def test_print_usage_table_top(capsys):
+    from usage_report.cli import print_usage_table
+
+    rows = [{"kennung": f"user{i}", "gpu_hours": float(i)} for i in range(50)]
+    rows.append({"kennung": "a-very-long-identifier", "gpu_hours": 0.5})
+
+    print_usage_table(
+        rows,
+        sort_key="gpu_hours",
+        reverse=True,
+        columns=["kennung", "gpu_hours"],
+        top=3,
+    )
+    out = capsys.readouterr().out.splitlines()
+    assert len(out) == 5
+    assert out[2].startswith("user49")
+    assert out[4].startswith("user47")
+    # widths only account for the printed rows
+    assert out[0] == "kennung gpu_hours"
+
+
+def test_sortby_accepts_known_columns_only(capsys):
+    import pytest
+    from usage_report import cli
+
+    with pytest.raises(SystemExit):
+        cli.parse_args(["report", "show", "--month", "2025-06", "--sortby", 'x"'])
+    assert "invalid choice" in capsys.readouterr().err
+
+
+def test_report_show_top(monkeypatch, tmp_path):
+    from usage_report import cli, report
+
+    # the default database of the enrichment and caches is created in tmp_path
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(cli, "query_daemon", lambda *a, **k: None)
+    captured = {}
+
+    def fake_load(month, partitions=None, **kwargs):
+        captured["load"] = kwargs
+        return [{"kennung": "u1", "gpu_hours": 3.0}]
+
+    def fake_print(rows, *a, **kw):
+        captured["top"] = kw.get("top")
+
+    monkeypatch.setattr(report, "list_months", lambda **k: [])
+    monkeypatch.setattr(report, "load_month", fake_load)
+    monkeypatch.setattr(report, "enrich_report_rows", lambda r, **k: r)
+    monkeypatch.setattr(cli, "print_usage_table", fake_print)
+
+    cli.main(["report", "show", "--month", "2025-06", "--top", "20"])
+
+    assert captured["load"]["limit"] == 20
+    assert captured["load"]["sort_key"] == "gpu_hours"
+    assert captured["load"]["reverse"] is True
+    assert captured["top"] == 20
+
+
+def test_report_list_imports_lazily(tmp_path):
+    import subprocess
+
+    root = pathlib.Path(__file__).resolve().parents[1]
+    code = (
+        "import sys; sys.path.insert(0, %r)\n"
+        "from usage_report import cli\n"
+        "cli.main(['report', 'list'])\n"
+        "print(sorted(m for m in sys.modules if m.startswith('usage_report.')))\n"
+    ) % str(root)
+    proc = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        cwd=tmp_path,
+        check=True,
+    )
+    loaded = proc.stdout.strip().splitlines()[-1]
+    assert loaded == "['usage_report.cli', 'usage_report.database']"
+
+
+def test_package_attributes_are_lazy():
+    import usage_report
+
+    assert "create_donut_plot" in dir(usage_report)
+    from usage_report.plotting import create_donut_plot
+
+    assert usage_report.create_donut_plot is create_donut_plot
+
+
+def test_slurm_range_from_daily_buckets(tmp_path, monkeypatch, capsys):
+    from usage_report import cli
+    from usage_report.database import DEFAULT_DB_PATH, store_month
+
+    monkeypatch.chdir(tmp_path)
+    daily = {"2025-06-03": {"cpu": {"cpu_hours": 2.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}}}
+    row = {"kennung": "user1", "partition_usage": daily["2025-06-03"], "daily_usage": daily}
+    store_month("2025-06", "2025-06-01", "2025-06-30", [row], db_path=DEFAULT_DB_PATH)
+
+    def fail_fetch(*args, **kwargs):
+        raise AssertionError("sacct must not be queried")
+
+    monkeypatch.setattr(cli, "fetch_usage", fail_fetch)
+    cli.main(["slurm", "user1", "-S", "2025-06-02", "-E", "2025-06-20"])
+    assert "'cpu_hours': 2.0" in capsys.readouterr().out
+
+
+def test_report_active_collects_missing_months_in_parallel(monkeypatch):
+    from usage_report import cli
+
+    stored = [{"kennung": "u0", "gpu_hours": 1.0}]
+    monkeypatch.setattr(
+        cli, "load_month", lambda month, **k: stored if month == "2025-04" else None
+    )
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda month, rows, **k: rows)
+    captured = {}
+
+    def fake_collect(periods, partitions=None, netrc_file=None, workers=1):
+        captured["periods"] = periods
+        captured["workers"] = workers
+        return {m: [{"kennung": "u1", "gpu_hours": 2.0}] for m in periods}
+
+    monkeypatch.setattr(cli, "collect_active_months", fake_collect)
+    aggregated = {}
+    monkeypatch.setattr(
+        cli, "_print_aggregated", lambda rows, args: aggregated.setdefault("rows", rows)
+    )
+    monkeypatch.setattr(cli, "query_daemon", lambda *a, **k: None)
+    cli.main([
+        "report", "active", "--month", "2025-04,2025-05,2025-06",
+        "--aggregate", "all", "--workers", "3",
+    ])
+    assert captured["periods"] == {
+        "2025-05": ("2025-05-01", "2025-05-31"),
+        "2025-06": ("2025-06-01", "2025-06-30"),
+    }
+    assert captured["workers"] == 3
+    assert [r["month"] for r in aggregated["rows"]] == ["2025-04", "2025-05", "2025-06"]
+
+
+def test_active_trend_plot_collects_missing_months(monkeypatch):
+    from usage_report import cli
+
+    stored = {"2025-05": {"g1": {"cpu_hours": 0.0, "gpu_hours": 1.0, "ram_gb_hours": 0.0}}}
+    trend_calls = []
+
+    def fake_trend(months, **kwargs):
+        trend_calls.append(list(months))
+        return {m: stored[m] for m in months if m in stored}
+
+    def fake_collect(missing, args):
+        assert list(missing) == ["2025-06"]
+        stored["2025-06"] = {"g1": {"cpu_hours": 0.0, "gpu_hours": 2.0, "ram_gb_hours": 0.0}}
+        return {}
+
+    plotted = {}
+
+    def fake_plot(matrix, column, *, kind, **kwargs):
+        plotted.update(matrix=matrix, column=column, kind=kind)
+
+    monkeypatch.setattr(cli, "load_group_trend", fake_trend)
+    monkeypatch.setattr(cli, "_collect_missing_months", fake_collect)
+    monkeypatch.setattr(cli, "create_trend_plot", fake_plot)
+    monkeypatch.setattr(cli, "print_usage_table", lambda *a, **k: None)
+
+    cli.main(["report", "active", "--month", "2025-05,2025-06", "--plot", "stacked,gpu_hours"])
+
+    assert trend_calls == [["2025-05", "2025-06"], ["2025-06"]]
+    assert plotted["kind"] == "stacked" and plotted["column"] == "gpu_hours"
+    assert plotted["matrix"]["2025-06"]["g1"]["gpu_hours"] == 2.0
+
+
+def test_report_active_cluster_selection(monkeypatch):
+    from usage_report import cli
+
+    args = cli.parse_args(["report", "active", "--month", "2025-06", "-M", "a,b", "-M", "a"])
+    assert args.clusters == ["a", "b"]
+
+    stored = [
+        {
+            "kennung": "u1",
+            "gpu_hours": 3.0,
+            "cluster_usage": {
+                "a": {"gpu": {"cpu_hours": 0.0, "gpu_hours": 1.0, "ram_gb_hours": 0.0}},
+                "b": {"gpu": {"cpu_hours": 0.0, "gpu_hours": 2.0, "ram_gb_hours": 0.0}},
+            },
+        }
+    ]
+    monkeypatch.setattr(
+        cli, "load_month", lambda month, **k: stored if month == "2025-05" else None
+    )
+    monkeypatch.setattr(cli, "enrich_stored_month", lambda month, rows, **k: rows)
+    monkeypatch.setattr(cli, "query_daemon", lambda *a, **k: None)
+    collected = {}
+
+    def fake_reports(start, end, **kwargs):
+        collected[start] = kwargs.get("clusters")
+        return []
+
+    monkeypatch.setattr(cli, "create_active_reports", fake_reports)
+    monkeypatch.setattr(cli, "store_month", lambda *a, **k: None)
+    aggregated = {}
+    monkeypatch.setattr(
+        cli, "_print_aggregated", lambda rows, args: aggregated.setdefault("rows", rows)
+    )
+    cli.main([
+        "report", "active", "--month", "2025-05,2025-06", "--cluster", "b",
+        "--aggregate", "clusters", "--workers", "1",
+    ])
+    # the stored month answers the cluster subset, the other one is collected
+    assert collected == {"2025-06-01": ["b"]}
+    assert [(r["cluster"], r["gpu_hours"]) for r in aggregated["rows"]] == [("b", 2.0)]
+
+    # without --cluster the summed usage is not the default cluster's usage
+    collected.clear()
+    cli.main(["report", "active", "--month", "2025-05", "--workers", "1"])
+    assert collected == {"2025-05-01": None}
+
+
+def test_report_active_shard_needs_db(capsys):
+    import pytest
+    from usage_report import cli
+
+    args = cli.parse_args(["report", "active", "--month", "2025-06", "--shard", "2/4"])
+    assert args.shard == (2, 4)
+    with pytest.raises(SystemExit):
+        cli.parse_args(["report", "active", "--month", "2025-06", "--shard", "5/4"])
+    assert cli.main(["report", "active", "--month", "2025-06", "--shard", "1/2"]) == 1
+    assert "--db" in capsys.readouterr().err
+
+
+def test_db_merge_reports_conflicts(tmp_path, capsys):
+    from usage_report import cli
+    from usage_report.database import store_month
+
+    main, shard = tmp_path / "main.db", tmp_path / "shard.db"
+    store_month("2025-06", "2025-06-01", "2025-06-30", [{"kennung": "u1", "cpu_hours": 1.0}], db_path=main)
+    store_month("2025-06", "2025-06-01", "2025-06-30", [{"kennung": "u1", "cpu_hours": 2.0}], db_path=shard)
+    assert cli.main(["db", "merge", str(shard), "--db", str(main)]) == 1
+    assert "user u1 differs" in capsys.readouterr().err
+    assert cli.main(["db", "merge", str(shard), "--db", str(main), "--on-conflict", "keep"]) == 0
+    assert "Conflict (keep)" in capsys.readouterr().out
+
+
+def test_slurm_jsonl_streams_users(monkeypatch, capsys):
+    import json
+    from usage_report import cli
+
+    written = []
+
+    def fake_fetch(user, start, end, partitions=None):
+        # the previous user is already written when the next one is queried
+        written.append(capsys.readouterr().out)
+        return {"cpu_hours": 1.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
+
+    monkeypatch.setattr(cli, "fetch_usage", fake_fetch)
+    cli.main(["--format", "jsonl", "slurm", "user1,user2", "-S", "2025-10-01"])
+    assert written[0] == ""
+    assert json.loads(written[1])["user"] == "user1"
+    assert json.loads(capsys.readouterr().out) == {
+        "user": "user2", "cpu_hours": 1.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0,
+    }
+
+    cli.main(["--format", "json", "slurm", "user1,user2", "-S", "2025-10-01"])
+    assert json.loads(capsys.readouterr().out)["group_usage"]["cpu_hours"] == 2.0
+
+
+def test_report_show_jsonl_streams_stored_rows(tmp_path, monkeypatch, capsys):
+    import json
+    from usage_report import cli, report
+    from usage_report.database import store_month
+
+    db = tmp_path / "usage.db"
+    rows = [
+        {"kennung": f"u{i}", "first_name": "A", "last_name": "B", "email": "e",
+         "projekt": "p", "gpu_hours": float(i)}
+        for i in range(5)
+    ]
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+    original = report.iter_stored_rows
+    monkeypatch.setattr(
+        cli,
+        "iter_stored_rows",
+        lambda month, **k: original(month, db_path=db, chunk_size=2, **k),
+    )
+    monkeypatch.setattr(cli, "query_daemon", lambda *a, **k: None)
+    cli.main(["--format", "jsonl", "report", "show", "--month", "2025-06"])
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert [r["kennung"] for r in lines] == ["u0", "u1", "u2", "u3", "u4"]
+    assert lines[4]["gpu_hours"] == 4.0 and "month" not in lines[4]
+
+
+def test_report_active_jsonl_streams_collected_rows(monkeypatch, capsys):
+    import json
+    from usage_report import cli
+
+    streamed = []
+
+    def fake_reports(start, end, *, on_row, **kwargs):
+        rows = [{"kennung": "u1", "gpu_hours": 1.0}, {"kennung": "u2", "gpu_hours": 2.0}]
+        for row in rows:
+            on_row(row)
+            streamed.append(capsys.readouterr().out)
+        return rows
+
+    monkeypatch.setattr(cli, "create_active_reports", fake_reports)
+    cli.main(["--format", "jsonl", "report", "active", "-S", "2025-06-01"])
+    assert [json.loads(out)["kennung"] for out in streamed] == ["u1", "u2"]
+    assert json.loads(streamed[0])["partition"] == "*"
+    assert capsys.readouterr().out == ""
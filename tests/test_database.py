@@ -45,3 +45,375 @@ def test_load_month_single_row(tmp_path):
 
     result = load_month("2025-07", db_path=db)
     assert result == [row]
+
+
+def test_load_month_top(tmp_path):
+    db = tmp_path / "test.db"
+    usage = [{"kennung": f"u{i}", "gpu_hours": float(i % 7)} for i in range(20)]
+    usage.append({"kennung": "none"})
+    store_month("2025-06", "2025-06-01", "2025-06-30", usage, db_path=db)
+
+    top = load_month("2025-06", db_path=db, sort_key="gpu_hours", reverse=True, limit=3)
+    assert [r["gpu_hours"] for r in top] == [6.0, 6.0, 5.0]
+    bottom = load_month("2025-06", db_path=db, sort_key="gpu_hours", limit=2)
+    assert [r["kennung"] for r in bottom] == ["u0", "u7"]
+    assert load_month("2025-07", db_path=db, limit=3) is None
+    # other columns are sorted in Python, quotes cannot break the query
+    by_name = load_month("2025-06", db_path=db, sort_key='kennung"', limit=2)
+    assert len(by_name) == 2
+    by_name = load_month("2025-06", db_path=db, sort_key="kennung", reverse=True, limit=2)
+    assert [r["kennung"] for r in by_name] == ["u9", "u8"]
+
+
+def test_partition_filter_from_breakdown(tmp_path):
+    db = tmp_path / "test.db"
+    row = {
+        "kennung": "user1",
+        "cpu_hours": 1.0,
+        "gpu_hours": 1.0,
+        "ram_gb_hours": 0.0,
+        "partition_usage": {
+            "lrz-gpu": {"cpu_hours": 4.0, "gpu_hours": 2.0, "ram_gb_hours": 8.0},
+            "mcml-cpu": {"cpu_hours": 16.0, "gpu_hours": 0.0, "ram_gb_hours": 32.0},
+        },
+    }
+    store_month("2025-05", "2025-05-01", "2025-05-31", [{"kennung": "old"}], partitions=["lrz*"], db_path=db)
+    # stored once, whatever filter was used for collecting
+    store_month("2025-05", "2025-05-01", "2025-05-31", [row], partitions=["lrz*"], db_path=db)
+    assert [e["partitions"] for e in list_months(db_path=db)] == [""]
+
+    all_parts = load_month("2025-05", db_path=db)
+    assert all_parts[0]["cpu_hours"] == 20.0
+    lrz = load_month("2025-05", partitions=["lrz*"], db_path=db)
+    assert lrz[0]["cpu_hours"] == 4.0
+    assert lrz[0]["gpu_hours"] == 2.0
+    both = load_month("2025-05", partitions=["lrz*", "mcml-cpu"], db_path=db)
+    assert both[0]["ram_gb_hours"] == 40.0
+    top = load_month("2025-05", partitions=["mcml*"], db_path=db, sort_key="cpu_hours", limit=1)
+    assert top[0]["cpu_hours"] == 16.0
+
+
+def test_partition_filter_without_breakdown(tmp_path):
+    db = tmp_path / "test.db"
+    store_month("2025-05", "2025-05-01", "2025-05-31", [{"kennung": "u"}], db_path=db)
+    assert load_month("2025-05", partitions=["lrz*"], db_path=db) is None
+
+
+def _daily_row(user, daily):
+    breakdown = {}
+    for by_part in daily.values():
+        for part, usage in by_part.items():
+            cur = breakdown.setdefault(part, {"cpu_hours": 0.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0})
+            for key, value in usage.items():
+                cur[key] += value
+    return {"kennung": user, "partition_usage": breakdown, "daily_usage": daily}
+
+
+def _usage(cpu, gpu=0.0):
+    return {"cpu_hours": cpu, "gpu_hours": gpu, "ram_gb_hours": 0.0}
+
+
+def test_load_range_usage_from_daily_buckets(tmp_path):
+    from usage_report.database import load_range_usage
+
+    db = tmp_path / "test.db"
+    june = [
+        _daily_row("u1", {
+            "2025-06-01": {"lrz-gpu": _usage(1.0, 1.0)},
+            "2025-06-15": {"lrz-gpu": _usage(2.0, 2.0), "cpu": _usage(4.0)},
+            "2025-06-30": {"cpu": _usage(8.0)},
+        }),
+        _daily_row("u2", {"2025-06-10": {"cpu": _usage(16.0)}}),
+    ]
+    july = [_daily_row("u1", {"2025-07-01": {"cpu": _usage(32.0)}})]
+    store_month("2025-07", "2025-07-01", "2025-07-31", july, db_path=db)
+    store_month("2025-06", "2025-06-01", "2025-06-30", june, db_path=db)
+
+    # daily buckets are not part of the stored month
+    assert "daily_usage" not in load_month("2025-06", db_path=db)[0]
+    usage = load_range_usage("2025-06-02", "2025-06-30", db_path=db)
+    assert usage["u1"]["cpu_hours"] == 14.0
+    assert usage["u2"]["cpu_hours"] == 16.0
+    # ranges may span several collected months
+    usage = load_range_usage("2025-06-15", "2025-07-05", users=["u1", "u3"], db_path=db)
+    assert usage["u1"]["cpu_hours"] == 46.0
+    assert usage["u3"]["cpu_hours"] == 0.0
+    usage = load_range_usage("2025-06-01", "2025-06-15", partitions=["lrz*"], db_path=db)
+    assert usage["u1"] == {"cpu_hours": 3.0, "gpu_hours": 3.0, "ram_gb_hours": 0.0}
+    assert load_range_usage("2025-05-20", "2025-06-10", db_path=db) is None
+
+
+def test_restoring_month_updates_prefix_sums(tmp_path):
+    from usage_report.database import load_range_usage
+
+    db = tmp_path / "test.db"
+    store_month("2025-06", "2025-06-01", "2025-06-30",
+                [_daily_row("u1", {"2025-06-05": {"cpu": _usage(1.0)}})], db_path=db)
+    store_month("2025-07", "2025-07-01", "2025-07-31",
+                [_daily_row("u1", {"2025-07-05": {"cpu": _usage(2.0)}})], db_path=db)
+    store_month("2025-06", "2025-06-01", "2025-06-30",
+                [_daily_row("u1", {"2025-06-06": {"cpu": _usage(5.0)}})], db_path=db)
+    assert load_range_usage("2025-06-01", "2025-07-31", db_path=db)["u1"]["cpu_hours"] == 7.0
+    assert load_range_usage("2025-07-01", "2025-07-31", db_path=db)["u1"]["cpu_hours"] == 2.0
+
+
+def test_load_range_usage_excludes_incomplete_days(tmp_path):
+    from datetime import date, timedelta
+    from usage_report.database import load_range_usage
+
+    db = tmp_path / "test.db"
+    today = date.today()
+    start = (today - timedelta(days=3)).isoformat()
+    end = (today + timedelta(days=3)).isoformat()
+    store_month("current", start, end, [_daily_row("u1", {start: {"cpu": _usage(1.0)}})], db_path=db)
+    assert load_range_usage(start, (today - timedelta(days=1)).isoformat(), db_path=db) is not None
+    assert load_range_usage(start, today.isoformat(), db_path=db) is None
+
+
+def test_group_rollups_are_dropped_when_month_is_stored_again(tmp_path):
+    from usage_report.database import load_group_matrix, store_group_rollups
+
+    db = tmp_path / "usage.db"
+    store_month("2025-06", "2025-06-01", "2025-06-30", [], db_path=db)
+    for month, hours in (("2025-05", 1.0), ("2025-06", 2.0)):
+        store_group_rollups(
+            month,
+            {"g1": {"gpu_hours": hours}, "g2": {"gpu_hours": 3.0}},
+            ignore_users=["u9"],
+            db_path=db,
+        )
+    matrix = load_group_matrix(["2025-05", "2025-06", "2025-07"], ignore_users=["u9"], db_path=db)
+    assert matrix["2025-06"]["g1"]["gpu_hours"] == 2.0
+    assert set(matrix) == {"2025-05", "2025-06"}
+    # rollups are kept per filter
+    assert load_group_matrix(["2025-05"], db_path=db) == {}
+
+    store_month("2025-06", "2025-06-01", "2025-06-30", [], db_path=db)
+    assert set(load_group_matrix(["2025-05", "2025-06"], ignore_users=["u9"], db_path=db)) == {
+        "2025-05"
+    }
+
+
+def test_merge_shard_databases(tmp_path):
+    import pytest
+    from usage_report.database import (
+        MergeConflictError,
+        load_range_usage,
+        merge_databases,
+    )
+
+    main, first, second = (tmp_path / f"{n}.db" for n in ("main", "s1", "s2"))
+    store_month("2025-06", "2025-06-01", "2025-06-30",
+                [_daily_row("u1", {"2025-06-05": {"cpu": _usage(1.0)}})],
+                db_path=first, shard=(1, 2))
+    store_month("2025-06", "2025-06-01", "2025-06-30",
+                [_daily_row("u2", {"2025-06-07": {"cpu": _usage(2.0)}})],
+                db_path=second, shard=(2, 2))
+    # a shard alone does not cover the period
+    assert load_range_usage("2025-06-01", "2025-06-30", db_path=first) is None
+
+    result = merge_databases([first], db_path=main)
+    assert result["months"] == ["2025-06"] and result["completed"] == []
+    assert load_range_usage("2025-06-01", "2025-06-30", db_path=main) is None
+    result = merge_databases([second], db_path=main)
+    assert result["completed"] == ["2025-06"]
+    assert sorted(r["kennung"] for r in load_month("2025-06", db_path=main)) == ["u1", "u2"]
+    usage = load_range_usage("2025-06-01", "2025-06-30", db_path=main)
+    assert usage["u1"]["cpu_hours"] == 1.0 and usage["u2"]["cpu_hours"] == 2.0
+    # merging the same shard again changes nothing
+    assert merge_databases([first], db_path=main)["months"] == []
+
+    other = tmp_path / "other.db"
+    store_month("2025-06", "2025-06-01", "2025-06-30",
+                [_daily_row("u1", {"2025-06-05": {"cpu": _usage(9.0)}})],
+                db_path=other, shard=(1, 2))
+    with pytest.raises(MergeConflictError) as exc:
+        merge_databases([other], db_path=main)
+    assert len(exc.value.conflicts) == 2
+    assert load_range_usage("2025-06-05", "2025-06-05", db_path=main)["u1"]["cpu_hours"] == 1.0
+    merge_databases([other], db_path=main, on_conflict="replace")
+    assert load_range_usage("2025-06-01", "2025-06-30", db_path=main)["u1"]["cpu_hours"] == 9.0
+
+
+def test_merge_reads_sources_without_changing_them(tmp_path):
+    import json
+    import os
+    import sqlite3
+    from usage_report.database import merge_databases
+
+    # a database of an older version with monthly usage only
+    old = tmp_path / "old.db"
+    rows = [{"kennung": "u1", "cpu_hours": 1.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}]
+    with sqlite3.connect(old) as conn:
+        conn.execute(
+            "CREATE TABLE monthly_usage (month TEXT, start TEXT, end TEXT, "
+            "partitions TEXT, data TEXT)"
+        )
+        conn.execute(
+            "INSERT INTO monthly_usage VALUES (?, ?, ?, ?, ?)",
+            ("2025-06", "2025-06-01", "2025-06-30", "", json.dumps(rows)),
+        )
+    conn.close()
+    before = old.read_bytes()
+    os.chmod(old, 0o444)
+
+    main = tmp_path / "main.db"
+    assert merge_databases([old], db_path=main)["months"] == ["2025-06"]
+    assert [r["kennung"] for r in load_month("2025-06", db_path=main)] == ["u1"]
+    assert old.read_bytes() == before
+
+
+def test_store_enrichment_fills_missing_fields_and_freezes(tmp_path):
+    from usage_report.database import is_month_frozen, store_enrichment
+
+    db = tmp_path / "usage.db"
+    rows = [
+        {"kennung": "u1", "gpu_hours": 1.0, "email": None},
+        {"kennung": "u2", "gpu_hours": 2.0, "projekt": "p2"},
+    ]
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+    fields = {
+        "u1": {"email": "u1@example.com", "projekt": "p1"},
+        "u2": {"projekt": "other"},
+    }
+    assert not store_enrichment("2025-06", fields, db_path=db)
+    stored = {r["kennung"]: r for r in load_month("2025-06", db_path=db)}
+    assert stored["u1"]["email"] == "u1@example.com"
+    assert stored["u1"]["projekt"] == "p1"
+    # stored values are kept
+    assert stored["u2"]["projekt"] == "p2"
+    assert not is_month_frozen("2025-06", db_path=db)
+
+    assert store_enrichment("2025-06", {}, freeze=True, db_path=db)
+    assert is_month_frozen("2025-06", db_path=db)
+    # collecting the month again thaws it
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+    assert not is_month_frozen("2025-06", db_path=db)
+
+
+def test_open_months_are_not_frozen(tmp_path):
+    from datetime import date
+
+    from usage_report.database import is_month_frozen, store_enrichment
+
+    db = tmp_path / "usage.db"
+    today = date.today().isoformat()
+    store_month("2025-06", "2025-06-01", today, [{"kennung": "u1"}], db_path=db)
+    assert not store_enrichment("2025-06", {}, freeze=True, db_path=db)
+    assert not is_month_frozen("2025-06", db_path=db)
+
+
+def test_load_range_users_from_daily_buckets(tmp_path):
+    from usage_report.database import load_range_users
+
+    db = tmp_path / "test.db"
+    june = [
+        _daily_row("u2", {"2025-06-20": {"cpu": _usage(1.0)}}),
+        _daily_row("u1", {"2025-06-02": {"cpu": _usage(1.0)}}),
+    ]
+    store_month("2025-06", "2025-06-01", "2025-06-30", june, db_path=db)
+    assert load_range_users("2025-06-01", "2025-06-30", db_path=db) == ["u1", "u2"]
+    assert load_range_users("2025-06-10", "2025-06-30", db_path=db) == ["u2"]
+    assert load_range_users("2025-06-01", "2025-07-05", db_path=db) is None
+    assert load_range_users("2025-06-01", "2025-06-30", db_path=tmp_path / "none.db") is None
+
+
+def test_load_month_where_uses_row_index(tmp_path):
+    import sqlite3
+
+    from usage_report.database import init_db, store_enrichment
+    from usage_report.rows import parse_filter
+
+    db = tmp_path / "test.db"
+    rows = [
+        {
+            "kennung": f"u{i}",
+            "projekt": "p1" if i % 2 else None,
+            "gpu_hours": float(i),
+            "partition_usage": {"a": {"gpu_hours": float(i)}, "b": {"cpu_hours": 1.0}},
+        }
+        for i in range(6)
+    ]
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+    where = [parse_filter("projekt=p*"), parse_filter("gpu_hours>=3")]
+    # rows without projekt are candidates until they are enriched
+    assert [r["kennung"] for r in load_month("2025-06", where=where, db_path=db)] == [
+        "u3", "u4", "u5"
+    ]
+    store_enrichment("2025-06", {"u4": {"projekt": "q4"}}, db_path=db)
+    assert [r["kennung"] for r in load_month("2025-06", where=where, db_path=db)] == [
+        "u3", "u5"
+    ]
+    # thresholds apply to the totals of the requested partitions
+    assert load_month("2025-06", partitions=["b"], where=where, db_path=db) == []
+    top = load_month(
+        "2025-06", where=[parse_filter("kennung!=u5")], sort_key="gpu_hours",
+        reverse=True, limit=2, db_path=db,
+    )
+    assert [r["kennung"] for r in top] == ["u4", "u3"]
+
+    # databases written before the row index existed are indexed on open
+    conn = sqlite3.connect(db)
+    conn.execute("DROP TABLE usage_rows")
+    conn.commit()
+    conn.close()
+    init_db(db)
+    assert [r["kennung"] for r in load_month("2025-06", where=where, db_path=db)] == [
+        "u3", "u5"
+    ]
+
+
+def test_multi_cluster_months_do_not_store_daily_buckets(tmp_path):
+    from usage_report.database import load_range_usage
+
+    db = tmp_path / "test.db"
+    daily = {"2025-06-05": {"cpu": _usage(10.0)}}
+    row = _daily_row("u1", daily)
+    store_month("2025-06", "2025-06-01", "2025-06-30", [row], db_path=db)
+    assert load_range_usage("2025-06-01", "2025-06-30", db_path=db)["u1"]["cpu_hours"] == 10.0
+
+    # collected from c1 and c2: the summed buckets are not the default cluster's
+    summed = _daily_row("u1", {"2025-06-05": {"cpu": _usage(20.0)}})
+    summed["cluster_usage"] = {"c1": {"cpu": _usage(10.0)}, "c2": {"cpu": _usage(10.0)}}
+    store_month("2025-06", "2025-06-01", "2025-06-30", [summed], db_path=db)
+    assert "daily_usage" not in load_month("2025-06", db_path=db)[0]
+    assert load_range_usage("2025-06-01", "2025-06-30", db_path=db)["u1"]["cpu_hours"] == 10.0
+    other = tmp_path / "other.db"
+    store_month("2025-06", "2025-06-01", "2025-06-30", [dict(summed)], db_path=other)
+    assert load_range_usage("2025-06-01", "2025-06-30", db_path=other) is None
+
+
+def test_cluster_collections_do_not_overwrite_each_other(tmp_path):
+    from usage_report.report import select_clusters
+
+    db = tmp_path / "test.db"
+    period = ("2025-06", "2025-06-01", "2025-06-30")
+
+    def collected(user, cpu, clusters=None):
+        row = {"kennung": user, "partition_usage": {"cpu": _usage(cpu)}}
+        if clusters:
+            row["cluster_usage"] = {c: {"cpu": _usage(v)} for c, v in clusters.items()}
+            row["partition_usage"] = {"cpu": _usage(sum(clusters.values()))}
+        return row
+
+    store_month(*period, [collected("u1", 1.0)], db_path=db)
+    store_month(*period, [collected("u1", 0, {"a": 2.0, "b": 3.0}),
+                          collected("u2", 0, {"a": 4.0, "b": 0.0})], db_path=db)
+    rows = load_month("2025-06", db_path=db)
+    # the default cluster's usage is kept next to the clusters
+    assert {r["kennung"]: r["cpu_hours"] for r in rows} == {"u1": 1.0, "u2": 0.0}
+    default = select_clusters(rows, None)
+    assert [r["cpu_hours"] for r in default] == [1.0, 0.0]
+    assert all("cluster_usage" not in r for r in default)
+    assert [r["cpu_hours"] for r in select_clusters(rows, ["a", "b"])] == [5.0, 4.0]
+
+    # collecting the default cluster again keeps the clusters
+    store_month(*period, [collected("u1", 6.0)], db_path=db)
+    rows = load_month("2025-06", db_path=db)
+    assert [r["cpu_hours"] for r in select_clusters(rows, None)] == [6.0, 0.0]
+    assert [r["cpu_hours"] for r in select_clusters(rows, ["b"])] == [3.0, 0.0]
+
+    # only clusters stored: no usage of the default cluster
+    other = tmp_path / "other.db"
+    store_month(*period, [collected("u1", 0, {"a": 2.0})], db_path=other)
+    assert select_clusters(load_month("2025-06", db_path=other), None) is None
@@ -0,0 +1,88 @@
+from __future__ import annotations
+import sys, pathlib; sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import csv
+
+import pytest
+
+from usage_report import export
+from usage_report.database import store_month, iter_usage_rows
+from usage_report.export import export_usage
+
+
+def _store(db):
+    rows = [
+        {"kennung": f"u{i}", "cpu_hours": float(i), "gpu_hours": 1.0}
+        for i in range(5)
+    ]
+    store_month("2025-05", "2025-05-01", "2025-05-31", rows[:2], db_path=db)
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows[2:], db_path=db)
+
+
+def test_iter_usage_rows_chunks(tmp_path):
+    db = tmp_path / "test.db"
+    _store(db)
+    chunks = list(iter_usage_rows(db_path=db, chunk_size=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert chunks[0][0]["month"] == "2025-05"
+    only_june = [r for c in iter_usage_rows(["2025-06"], db_path=db) for r in c]
+    assert [r["kennung"] for r in only_june] == ["u2", "u3", "u4"]
+
+
+def test_export_csv(tmp_path):
+    db = tmp_path / "test.db"
+    _store(db)
+    path, count = export_usage(
+        tmp_path / "out.csv", fmt="csv", months=["2025-06"], db_path=db
+    )
+    assert count == 3
+    with path.open(newline="") as fh:
+        rows = list(csv.DictReader(fh))
+    assert [r["kennung"] for r in rows] == ["u2", "u3", "u4"]
+    assert rows[0]["cpu_hours"] == "2.0"
+    assert rows[0]["partitions"] == ""
+
+
+def test_export_partition_filter_of_breakdown_months(tmp_path):
+    db = tmp_path / "test.db"
+
+    def usage(cpu):
+        return {"cpu_hours": cpu, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
+
+    rows = [
+        {"kennung": "u1", "partition_usage": {"lrz-cpu": usage(2.0), "mcml": usage(5.0)}},
+        {"kennung": "u2", "partition_usage": {"mcml": usage(1.0)}},
+    ]
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+    store_month("2025-05", "2025-05-01", "2025-05-31",
+                [{"kennung": "u3", "cpu_hours": 4.0}], partitions=["lrz*"], db_path=db)
+    path, count = export_usage(
+        tmp_path / "out.csv", fmt="csv", partitions=["lrz*"], db_path=db
+    )
+    assert count == 3
+    with path.open(newline="") as fh:
+        exported = {r["kennung"]: r for r in csv.DictReader(fh)}
+    assert exported["u1"]["cpu_hours"] == "2.0"
+    assert exported["u2"]["cpu_hours"] == "0.0"
+    assert exported["u3"]["cpu_hours"] == "4.0"
+    assert {r["partitions"] for r in exported.values()} == {"lrz*"}
+
+
+def test_export_falls_back_to_csv(tmp_path, monkeypatch):
+    db = tmp_path / "test.db"
+    _store(db)
+    monkeypatch.setattr(export, "_import_pyarrow", lambda: None)
+    path, count = export_usage(tmp_path / "out.parquet", fmt="parquet", db_path=db)
+    assert path.suffix == ".csv"
+    assert count == 5
+
+
+def test_export_parquet(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    db = tmp_path / "test.db"
+    _store(db)
+    path, count = export_usage(tmp_path / "out.parquet", db_path=db, chunk_size=2)
+    table = pq.read_table(path, columns=["kennung", "gpu_hours"])
+    assert count == 5
+    assert table.num_rows == 5
+    assert table.column_names == ["kennung", "gpu_hours"]
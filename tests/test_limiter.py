@@ -0,0 +1,48 @@
+from __future__ import annotations
+import sys, pathlib; sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import threading
+import time
+
+from usage_report.limiter import AIMDLimiter
+
+
+def test_limit_grows_while_latency_is_stable():
+    limiter = AIMDLimiter(initial=2, maximum=8)
+    for _ in range(20):
+        with limiter.slot():
+            limiter.success(0.1)
+    assert 4 < limiter.limit <= 8
+
+
+def test_limit_does_not_grow_with_rising_latency():
+    limiter = AIMDLimiter(initial=2)
+    limiter.success(0.1)
+    limiter.success(1.0)
+    assert limiter.limit == 2
+
+
+def test_overload_decreases_once_per_round():
+    limiter = AIMDLimiter(initial=8, maximum=8)
+    tickets = [limiter.acquire() for _ in range(8)]
+    for ticket in tickets:
+        limiter.overload(ticket)
+        limiter.release()
+    assert limiter.limit == 4
+    with limiter.slot() as ticket:
+        limiter.overload(ticket)
+    assert limiter.limit == 2
+
+
+def test_acquire_waits_for_free_slot_and_retry_after():
+    limiter = AIMDLimiter(initial=1)
+    ticket = limiter.acquire()
+    limiter.overload(ticket, retry_after=0.2)
+    acquired = []
+    waiter = threading.Thread(target=lambda: acquired.append(limiter.acquire()))
+    waiter.start()
+    time.sleep(0.05)
+    limiter.release()
+    assert not acquired
+    waiter.join(timeout=2)
+    assert acquired
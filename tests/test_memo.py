@@ -0,0 +1,77 @@
+from __future__ import annotations
+import sys, pathlib; sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import threading
+import time
+from unittest import mock
+
+import pytest
+
+from usage_report.memo import Memo, memoized, run_memo
+
+
+def test_memo_coalesces_concurrent_requests():
+    memo = Memo()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        time.sleep(0.1)
+        return "value"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(memo.get("key", slow)))
+        for _ in range(8)
+    ]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == ["value"] * 8
+    assert len(calls) == 1
+    assert memo.get("key", slow) == "value"
+    assert len(calls) == 1
+
+
+def test_memo_remembers_errors():
+    memo = Memo()
+    compute = mock.Mock(side_effect=ValueError("boom"))
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            memo.get("key", compute)
+    assert compute.call_count == 1
+
+
+def test_memoized_only_within_run():
+    compute = mock.Mock(return_value=1)
+    memoized("key", compute)
+    memoized("key", compute)
+    assert compute.call_count == 2
+    with run_memo():
+        memoized("key", compute)
+        memoized("key", compute)
+    assert compute.call_count == 3
+
+
+def test_enrichment_looks_up_each_user_once_per_run(tmp_path):
+    from usage_report.api import SimAPI
+    from usage_report.report import enrich_report_rows
+
+    netrc_file = tmp_path / "netrc"
+    netrc_file.write_text("machine simapi.sim.lrz.de login u password p\n")
+    rows = [{"kennung": "user1"}, {"kennung": "user2"}]
+
+    def fake_fetch(api, user):
+        assert api._get_auth() == ("u", "p")
+        return {"kennung": user}
+
+    with run_memo(), \
+            mock.patch.object(SimAPI, "fetch_user", autospec=True, side_effect=fake_fetch) as fetch, \
+            mock.patch("usage_report.report.list_user_groups", return_value=[]) as groups, \
+            mock.patch("netrc.netrc", wraps=__import__("netrc").netrc) as parse:
+        for _month in range(3):
+            enrich_report_rows(rows, netrc_file=netrc_file)
+    assert sorted(c.args[1] for c in fetch.call_args_list) == ["user1", "user2"]
+    assert groups.call_count == 2
+    assert parse.call_count == 1
@@ -68,3 +68,102 @@ def test_color_order(monkeypatch):
     assert colors[pie_info['labels'].index('g1')] == palette[0]
     assert colors[pie_info['labels'].index('g2')] == palette[1]
     assert colors[pie_info['labels'].index('Others')] == 'gray'
+
+
+def test_unchanged_plot_is_served_from_cache(monkeypatch, tmp_path):
+    palette, pie_info = _setup_matplotlib(monkeypatch)
+    saved = []
+
+    def savefig(path, **kwargs):
+        saved.append(kwargs.get("format"))
+        pathlib.Path(path).write_text("<svg/>")
+
+    monkeypatch.setattr(sys.modules["matplotlib.pyplot"], "savefig", savefig, raising=False)
+    rows = [{"kennung": "g1", "gpu_hours": 10}, {"kennung": "g2", "gpu_hours": 5}]
+    cache = tmp_path / "cache"
+    output = tmp_path / "plot.svg"
+    create_donut_plot(
+        rows, "gpu_hours", output=output, cache_dir=cache, backend="matplotlib"
+    )
+    assert saved == ["svg"]
+    output.unlink()
+
+    # matplotlib is neither imported nor called for an unchanged plot
+    monkeypatch.setitem(sys.modules, "matplotlib", None)
+    create_donut_plot(
+        rows, "gpu_hours", output=output, cache_dir=cache, backend="matplotlib"
+    )
+    assert output.read_text() == "<svg/>"
+    assert saved == ["svg"]
+
+    changed = [{"kennung": "g1", "gpu_hours": 11}, {"kennung": "g2", "gpu_hours": 5}]
+    output.unlink()
+    create_donut_plot(
+        changed, "gpu_hours", output=output, cache_dir=cache, backend="matplotlib"
+    )
+    assert not output.exists()
+
+
+def test_plot_cache_keeps_recently_used_plots(monkeypatch, tmp_path, capsys):
+    import os
+    from usage_report import plotting
+
+    monkeypatch.setitem(sys.modules, "matplotlib", None)
+    monkeypatch.setattr(plotting, "PLOT_CACHE_ENTRIES", 2)
+    cache = tmp_path / "cache"
+    output = tmp_path / "plot.svg"
+    plots = [[{"kennung": "g1", "gpu_hours": n + 1}] for n in range(3)]
+    files = []
+    for n, rows in enumerate(plots[:2]):
+        create_donut_plot(rows, "gpu_hours", output=output, cache_dir=cache)
+        files.append(next(p for p in cache.iterdir() if p not in files))
+        # distinct modification times however coarse the file system clock
+        os.utime(files[-1], (n, n))
+    # reusing the first plot keeps it over the second one
+    create_donut_plot(plots[0], "gpu_hours", output=output, cache_dir=cache)
+    assert "(unchanged)" in capsys.readouterr().out
+    create_donut_plot(plots[2], "gpu_hours", output=output, cache_dir=cache)
+    assert files[0].exists() and not files[1].exists()
+    assert len(list(cache.iterdir())) == 2
+
+
+def test_svg_backend_renders_without_matplotlib(monkeypatch, tmp_path, capsys):
+    monkeypatch.setitem(sys.modules, "matplotlib", None)
+    rows = [
+        {"kennung": "g1", "gpu_hours": 100},
+        {"kennung": "g<2>", "gpu_hours": 70},
+        {"kennung": "g3", "gpu_hours": 5},
+        {"kennung": "g4", "gpu_hours": 60},
+    ]
+    create_donut_plot(rows, "gpu_hours", output=tmp_path / "plot.png", cache_dir=None)
+
+    output = tmp_path / "plot.svg"
+    svg = output.read_text()
+    assert svg.startswith("<svg")
+    assert "g1" in svg and "g&lt;2&gt;" in svg and "Others" in svg
+    assert "42.6%" in svg  # 100 of 235 hours
+    assert svg.count("<path") == 3
+    assert 'fill="#1f77b4"' in svg and 'fill="#aec7e8"' in svg and 'fill="gray"' in svg
+    assert f"Plot saved to {output}" in capsys.readouterr().out
+
+
+def test_stacked_trend_svg(monkeypatch, tmp_path):
+    from usage_report.plotting import create_trend_plot
+
+    monkeypatch.setitem(sys.modules, "matplotlib", None)
+    matrix = {
+        "2025-06": {"g2-ai-c": {"gpu_hours": 5.0}, "g1-ai-c": {"gpu_hours": 10.0}},
+        "2025-05": {"g1-ai-c": {"gpu_hours": 8.0}},
+    }
+    output = tmp_path / "trend.svg"
+    create_trend_plot(matrix, "gpu_hours", kind="stacked", output=output, cache_dir=None)
+
+    svg = output.read_text()
+    assert svg.count("<polygon") == 2
+    assert svg.index(">g1<") < svg.index(">g2<")  # legend ordered by total usage
+    assert svg.index("2025-05") < svg.index("2025-06")
+    assert 'fill="#1f77b4"' in svg
+
+    create_trend_plot(matrix, "gpu_hours", kind="line", output=output, cache_dir=None)
+    svg = output.read_text()
+    assert svg.count("<polyline") == 2 and "<polygon" not in svg
@@ -3,6 +3,8 @@ import sys, pathlib; sys.path.insert(0, str(pathlib.Path(__file__).resolve().par
 
 from unittest import mock
 
+import pytest
+
 from usage_report.report import (
     create_report,
     create_active_reports,
@@ -114,6 +116,7 @@ def test_create_active_reports():
     assert {call.args[0] for call in cr.call_args_list} == {"user1", "user2"}
     assert all("timestamp" in r for r in rows)
     assert all(r["period_start"] == "2025-06-01" for r in rows)
+    assert all(call.kwargs["by_partition"] for call in cr.call_args_list)
 
 
 def test_enrich_report_rows():
@@ -145,7 +148,7 @@ def test_enrich_report_rows():
 def test_create_active_reports_skip_error():
     sample_active = {"partitions": [], "user1": 5.0, "bad": 3.0, "user2": 2.0}
 
-    def fake_create(user, start, end, partitions=None, netrc_file=None):
+    def fake_create(user, start, end, partitions=None, netrc_file=None, **kwargs):
         if user == "bad":
             raise SimAPIError("fail")
         return {"kennung": user}
@@ -162,3 +165,354 @@ def test_create_active_reports_skip_error():
     fa.assert_called_once_with("2025-06-01", "2025-06-30")
     assert {call.args[0] for call in cr.call_args_list} == {"user1", "bad", "user2"}
     assert {r["kennung"] for r in rows} == {"user1", "user2"}
+
+
+def test_collect_active_months_fetches_users_once(tmp_path):
+    import threading
+
+    from usage_report.database import load_month, load_staged_collection
+    from usage_report.report import collect_active_months
+
+    rosters = {
+        "2025-05-01": {"partitions": [], "user1": 1.0, "user2": 1.0},
+        "2025-06-01": {"partitions": [], "user1": 1.0, "bad": 1.0},
+    }
+    # both months must be in flight at the same time to pass the barrier
+    barrier = threading.Barrier(2, timeout=5)
+
+    def fake_active(start, end):
+        barrier.wait()
+        return rosters[start]
+
+    def fake_fetch_user(user):
+        if user == "bad":
+            raise SimAPIError("fail")
+        return {"kennung": user, "vorname": user.upper()}
+
+    usage = {"cpu": {"cpu_hours": 1.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}}
+    db = tmp_path / "usage.db"
+    with mock.patch("usage_report.report.fetch_active_usage", side_effect=fake_active), \
+            mock.patch("usage_report.report.SimAPI") as MockAPI, \
+            mock.patch("usage_report.report.list_user_groups", return_value=[]), \
+            mock.patch("usage_report.report.fetch_daily_usage", return_value=(usage, {})):
+        MockAPI.return_value.fetch_user.side_effect = fake_fetch_user
+        result = collect_active_months(
+            {"2025-05": ("2025-05-01", "2025-05-31"), "2025-06": ("2025-06-01", "2025-06-30")},
+            workers=2,
+            db_path=db,
+        )
+    calls = [c.args[0] for c in MockAPI.return_value.fetch_user.call_args_list]
+    assert sorted(calls) == ["bad", "user1", "user2"]
+    assert [r["kennung"] for r in result["2025-06"]] == ["user1"]
+    assert result["2025-05"][0]["first_name"] == "USER1"
+    assert {r["kennung"] for r in load_month("2025-05", db_path=db)} == {"user1", "user2"}
+    # the month with a failed lookup stays staged with its full roster
+    assert load_month("2025-06", db_path=db) is None
+    users, staged = load_staged_collection("2025-06-01", "2025-06-30", db_path=db)
+    assert users == ["user1", "bad"] and set(staged) == {"user1"}
+
+    with mock.patch("usage_report.report.fetch_active_usage") as fa, \
+            mock.patch("usage_report.report.SimAPI") as MockAPI, \
+            mock.patch("usage_report.report.list_user_groups", return_value=[]), \
+            mock.patch("usage_report.report.fetch_daily_usage", return_value=(usage, {})) as fd:
+        MockAPI.return_value.fetch_user.side_effect = lambda user: {"kennung": user}
+        result = collect_active_months({"2025-06": ("2025-06-01", "2025-06-30")}, db_path=db)
+    fa.assert_not_called()
+    assert [c.args[0] for c in MockAPI.return_value.fetch_user.call_args_list] == ["bad"]
+    assert [c.args[0] for c in fd.call_args_list] == ["bad"]
+    assert [r["kennung"] for r in result["2025-06"]] == ["user1", "bad"]
+    assert {r["kennung"] for r in load_month("2025-06", db_path=db)} == {"user1", "bad"}
+
+
+def test_create_active_reports_resumes_interrupted_collection(tmp_path):
+    import pytest
+
+    from usage_report.database import load_month, load_staged_collection, store_month
+
+    db = tmp_path / "usage.db"
+    sample_active = {"partitions": [], "user1": 5.0, "user2": 3.0, "user3": 2.0}
+    calls = []
+
+    def interrupted(user, start, end, **kwargs):
+        calls.append(user)
+        if user == "user3":
+            raise KeyboardInterrupt
+        return {"kennung": user, "partition_usage": {}}
+
+    with mock.patch("usage_report.report.fetch_active_usage", return_value=sample_active):
+        with mock.patch("usage_report.report.create_report", side_effect=interrupted):
+            with pytest.raises(KeyboardInterrupt):
+                create_active_reports("2025-06-01", "2025-06-30", checkpoint_db=db)
+    users, staged = load_staged_collection("2025-06-01", "2025-06-30", db_path=db)
+    assert users == ["user1", "user2", "user3"]
+    assert set(staged) == {"user1", "user2"}
+
+    calls.clear()
+    with mock.patch("usage_report.report.fetch_active_usage") as fa:
+        with mock.patch(
+            "usage_report.report.create_report",
+            side_effect=lambda user, *a, **k: {"kennung": user, "partition_usage": {}},
+        ) as cr:
+            rows = create_active_reports("2025-06-01", "2025-06-30", checkpoint_db=db)
+    fa.assert_not_called()
+    assert [c.args[0] for c in cr.call_args_list] == ["user3"]
+    assert [r["kennung"] for r in rows] == ["user1", "user2", "user3"]
+
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+    assert len(load_month("2025-06", db_path=db)) == 3
+    assert load_staged_collection("2025-06-01", "2025-06-30", db_path=db) == (None, {})
+
+
+def test_load_group_trend_aggregates_only_new_months(tmp_path):
+    from usage_report import report
+    from usage_report.database import store_month
+
+    db = tmp_path / "usage.db"
+
+    def row(user, group, hours):
+        return {"kennung": user, "ai_c_group": group, "gpu_hours": hours, "cpu_hours": 0.0,
+                "ram_gb_hours": 0.0, "first_name": "F", "last_name": "L",
+                "email": "e", "projekt": "p"}
+
+    store_month("2025-05", "2025-05-01", "2025-05-31",
+                [row("u1", "g1", 1.0), row("u2", "g1|g2", 2.0)], db_path=db)
+    store_month("2025-06", "2025-06-01", "2025-06-30", [row("u1", "g1", 4.0)], db_path=db)
+
+    with mock.patch("usage_report.report.aggregate_rows", wraps=report.aggregate_rows) as agg:
+        trend = report.load_group_trend(["2025-05", "2025-06", "2025-07"], db_path=db)
+        assert agg.call_count == 2
+        assert trend["2025-05"]["g1"]["gpu_hours"] == 3.0
+        assert trend["2025-05"]["g2"]["gpu_hours"] == 2.0
+        assert list(trend) == ["2025-05", "2025-06"]
+
+        # a new month only aggregates that month, the others come from rollups
+        store_month("2025-07", "2025-07-01", "2025-07-31", [row("u2", "g2", 8.0)], db_path=db)
+        trend = report.load_group_trend(["2025-05", "2025-06", "2025-07"], db_path=db)
+        assert agg.call_count == 3
+        assert trend["2025-07"] == {"g2": {"cpu_hours": 0.0, "gpu_hours": 8.0, "ram_gb_hours": 0.0}}
+
+
+def test_select_and_aggregate_clusters():
+    from usage_report.report import aggregate_clusters, select_clusters
+
+    def usage(gpu):
+        return {"cpu_hours": 1.0, "gpu_hours": gpu, "ram_gb_hours": 0.0}
+
+    rows = [
+        {
+            "kennung": "u1",
+            "gpu_hours": 3.0,
+            "period_start": "2025-01-01",
+            "period_end": "2025-01-31",
+            "cluster_usage": {"a": {"gpu": usage(1.0)}, "b": {"gpu": usage(2.0)}},
+        },
+        {
+            "kennung": "u2",
+            "gpu_hours": 4.0,
+            "cluster_usage": {"a": {}, "b": {"gpu": usage(4.0), "cpu": usage(0.0)}},
+        },
+    ]
+    selected = select_clusters(rows, ["b"])
+    assert [r.gpu_hours for r in selected] == [2.0, 4.0]
+    assert selected[1]["partition_usage"]["cpu"]["cpu_hours"] == 1.0
+    assert select_clusters(rows, ["b"], partitions=["cpu"])[1].cpu_hours == 1.0
+    assert select_clusters(rows, ["c"]) is None
+    # without clusters only rows of the default cluster are wanted
+    assert select_clusters(rows, None) is None
+    plain = [{"kennung": "u1", "gpu_hours": 3.0}]
+    assert select_clusters(plain, []) == plain
+
+    totals = aggregate_clusters(rows, ignore_users=["u2"])
+    assert [(r.cluster, r.gpu_hours) for r in totals] == [("a", 1.0), ("b", 2.0)]
+    assert totals[0].period_start == "2025-01-01"
+    assert aggregate_clusters(rows)[1].gpu_hours == 6.0
+
+
+def test_shards_partition_active_users():
+    from usage_report.report import in_shard
+
+    users = [f"user{i}" for i in range(100)]
+    slices = [[u for u in users if in_shard(u, (i, 3))] for i in (1, 2, 3)]
+    assert sorted(sum(slices, [])) == sorted(users)
+    assert all(slices)
+    with mock.patch(
+        "usage_report.report.fetch_active_usage",
+        return_value={"partitions": [], **{u: 1.0 for u in users}},
+    ), mock.patch(
+        "usage_report.report.create_report",
+        side_effect=lambda user, *a, **k: {"kennung": user},
+    ):
+        rows = create_active_reports("2025-01-01", "2025-01-31", shard=(2, 3))
+    assert [r["kennung"] for r in rows] == slices[1]
+
+
+def test_enrich_stored_month_persists_and_freezes(tmp_path):
+    from usage_report.database import is_month_frozen, load_month, store_month
+    from usage_report.report import enrich_stored_month
+
+    db = tmp_path / "usage.db"
+    store_month(
+        "2025-06",
+        "2025-06-01",
+        "2025-06-30",
+        [{"kennung": "user1", "gpu_hours": 2.0}],
+        db_path=db,
+    )
+    user_info = {
+        "kennung": "user1",
+        "projekt": "proj",
+        "daten": {
+            "vorname": "Max",
+            "nachname": "Mustermann",
+            "emailadressen": [{"adresse": "max@example.com"}],
+        },
+    }
+    with mock.patch("usage_report.report.SimAPI") as MockAPI:
+        MockAPI.return_value.fetch_user.return_value = user_info
+        with mock.patch("usage_report.report.list_user_groups", return_value=["test-ai-c"]):
+            rows = enrich_stored_month(
+                "2025-06", load_month("2025-06", db_path=db), cache={}, db_path=db
+            )
+    assert rows[0]["email"] == "max@example.com"
+    assert is_month_frozen("2025-06", db_path=db)
+    stored = load_month("2025-06", db_path=db)
+    assert stored[0]["first_name"] == "Max"
+    assert stored[0]["ai_c_group"] == "test-ai-c"
+
+    # frozen months are read without any lookups
+    with mock.patch("usage_report.report.SimAPI") as MockAPI:
+        rows = enrich_stored_month("2025-06", stored, cache={}, db_path=db)
+    MockAPI.assert_not_called()
+    assert rows[0]["last_name"] == "Mustermann"
+
+
+def test_enrich_stored_month_failed_lookup_does_not_freeze(tmp_path):
+    from usage_report.database import is_month_frozen, load_month, store_month
+    from usage_report.report import enrich_stored_month
+
+    db = tmp_path / "usage.db"
+    store_month("2025-06", "2025-06-01", "2025-06-30", [{"kennung": "user1"}], db_path=db)
+    with mock.patch("usage_report.report.SimAPI") as MockAPI:
+        MockAPI.return_value.fetch_user.side_effect = SimAPIError("down")
+        enrich_stored_month(
+            "2025-06", load_month("2025-06", db_path=db), cache={}, db_path=db
+        )
+    assert not is_month_frozen("2025-06", db_path=db)
+
+
+def test_active_roster_prefers_stored_daily_usage(tmp_path):
+    from usage_report.database import store_month
+    from usage_report.report import active_roster
+
+    db = tmp_path / "usage.db"
+    row = {
+        "kennung": "u1",
+        "partition_usage": {},
+        "daily_usage": {"2025-06-03": {"cpu": {"cpu_hours": 1.0}}},
+    }
+    store_month("2025-06", "2025-06-01", "2025-06-30", [row], db_path=db)
+    with mock.patch("usage_report.report.fetch_active_usage") as fa:
+        assert active_roster("2025-06-01", "2025-06-30", db_path=db) == ["u1"]
+        assert active_roster("2025-06-01", "2025-06-30", users=["u9"], db_path=db) == ["u9"]
+    fa.assert_not_called()
+
+    sample_active = {"partitions": [], "u1": 1.0, "u2": 2.0}
+    with mock.patch(
+        "usage_report.report.fetch_active_usage", return_value=sample_active
+    ) as fa:
+        # periods not collected completely and forced sources query sreport
+        assert active_roster("2025-06-01", "2025-07-31", db_path=db) == ["u1", "u2"]
+        assert active_roster(
+            "2025-06-01", "2025-06-30", source="sreport", db_path=db
+        ) == ["u1", "u2"]
+    assert fa.call_count == 2
+    with pytest.raises(ValueError):
+        active_roster("2025-05-01", "2025-05-31", source="stored", db_path=db)
+
+
+def test_load_stored_tables_only_enriches_matching_rows(tmp_path):
+    from usage_report.database import store_month
+    from usage_report.report import load_stored_tables
+    from usage_report.rows import parse_filter
+
+    db = tmp_path / "usage.db"
+    rows = [
+        {"kennung": "u1", "first_name": "A", "last_name": "B", "email": "a@x",
+         "projekt": "pn1", "gpu_hours": 5.0},
+        {"kennung": "u2", "gpu_hours": 7.0},
+        {"kennung": "u3", "gpu_hours": 0.5},
+    ]
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+
+    def fetch_user(user):
+        return {"kennung": user, "projekt": "pn2", "daten": {}}
+
+    with mock.patch("usage_report.report.SimAPI") as MockAPI:
+        MockAPI.return_value.fetch_user.side_effect = fetch_user
+        with mock.patch("usage_report.report.list_user_groups", return_value=[]):
+            tables = load_stored_tables(
+                "2025-06",
+                where=[parse_filter("projekt=pn*"), parse_filter("gpu_hours>=1")],
+                cache={},
+                db_path=db,
+            )
+    assert [r["kennung"] for r in tables[0]["rows"]] == ["u1", "u2"]
+    # u3 is below the threshold and never looked up
+    assert [c.args[0] for c in MockAPI.return_value.fetch_user.call_args_list] == ["u2"]
+
+
+def test_stored_tables_of_cluster_months_need_clusters(tmp_path):
+    from usage_report.database import store_month
+    from usage_report.report import iter_stored_rows, load_stored_tables
+    from usage_report.rows import parse_filter
+
+    def usage(gpu):
+        return {"gpu": {"cpu_hours": 0.0, "gpu_hours": gpu, "ram_gb_hours": 0.0}}
+
+    db = tmp_path / "usage.db"
+    user = {"first_name": "A", "last_name": "B", "email": "a@x", "projekt": "pn1"}
+    rows = [
+        {**user, "kennung": "u1", "cluster_usage": {"a": usage(1.0), "b": usage(2.0)}},
+        {**user, "kennung": "u2", "cluster_usage": {"a": usage(5.0), "b": usage(0.5)}},
+    ]
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+
+    # the stored totals are summed over both clusters
+    with pytest.raises(ValueError, match="--cluster"):
+        load_stored_tables("2025-06", db_path=db)
+    with pytest.raises(ValueError):
+        list(iter_stored_rows("2025-06", db_path=db))
+    with pytest.raises(ValueError, match="not collected"):
+        load_stored_tables("2025-06", clusters=["c"], db_path=db)
+
+    tables = load_stored_tables(
+        "2025-06", clusters=["b"], top=1, sort_key="gpu_hours", reverse=True, db_path=db
+    )
+    assert [(r["kennung"], r["gpu_hours"]) for r in tables[0]["rows"]] == [("u1", 2.0)]
+    streamed = iter_stored_rows(
+        "2025-06", clusters=["b"], where=[parse_filter("gpu_hours>=1")], db_path=db
+    )
+    assert [(r["kennung"], r["gpu_hours"]) for r in streamed] == [("u1", 2.0)]
+
+
+def test_stored_tables_top_by_enriched_column(tmp_path):
+    from usage_report.database import store_month
+    from usage_report.report import load_stored_tables
+
+    db = tmp_path / "usage.db"
+    rows = [{"kennung": f"u{i}", "gpu_hours": float(i)} for i in range(4)]
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+    names = {"u0": "Zed", "u1": "Ann", "u2": "Max", "u3": "Bob"}
+
+    def fetch_user(user):
+        return {"kennung": user, "nachname": names[user], "daten": {}}
+
+    with mock.patch("usage_report.report.SimAPI") as MockAPI:
+        MockAPI.return_value.fetch_user.side_effect = fetch_user
+        with mock.patch("usage_report.report.list_user_groups", return_value=[]):
+            tables = load_stored_tables(
+                "2025-06", top=2, sort_key="last_name", cache={}, db_path=db
+            )
+    # the last names are only known after enrichment
+    assert [r["last_name"] for r in tables[0]["rows"]] == ["Ann", "Bob"]
+
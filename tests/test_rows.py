@@ -0,0 +1,73 @@
+from __future__ import annotations
+import sys, pathlib; sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import json
+
+import pytest
+
+from usage_report.report import aggregate_rows, sum_rows
+from usage_report.rows import UsageRow, as_row, to_dicts
+
+
+def test_usage_row_behaves_like_stored_dict():
+    data = {"kennung": "u1", "cpu_hours": "2.5", "partition_usage": {"gpu": {}}}
+    row = UsageRow.from_dict(data)
+    assert row.cpu_hours == 2.5 and row.gpu_hours == 0.0
+    assert row["kennung"] == "u1" and row.get("email") is None
+    assert "email" not in row and "partition_usage" in row
+    assert row == {"kennung": "u1", "cpu_hours": 2.5, "gpu_hours": 0.0,
+                   "ram_gb_hours": 0.0, "partition_usage": {"gpu": {}}}
+
+    row["month"] = "2025-06"
+    assert row.pop("month") == "2025-06" and "month" not in row
+    assert (row | {"partition": "*"}).partition == "*" and row.partition is None
+    assert as_row(row) is row
+    assert json.loads(json.dumps(to_dicts([row])))[0]["kennung"] == "u1"
+    if sys.version_info >= (3, 10):
+        assert not hasattr(row, "__dict__")
+
+
+def test_deleted_usage_columns_leave_the_mapping():
+    row = UsageRow(kennung="u1", gpu_hours=2.0)
+    assert row.pop("gpu_hours") == 2.0 and "gpu_hours" not in row
+    with pytest.raises(KeyError):
+        del row["gpu_hours"]
+    assert row.pop("gpu_hours", None) is None
+    row["gpu_hours"] = "1.5"
+    assert row["gpu_hours"] == 1.5
+
+    row.clear()
+    assert len(row) == 0 and dict(row) == {}
+    with pytest.raises(KeyError):
+        row.popitem()
+
+
+def test_aggregation_returns_typed_rows():
+    rows = [
+        {"kennung": "u1", "ai_c_group": "a|b", "gpu_hours": "1.5", "period_start": "2025-06-01"},
+        UsageRow(kennung="u2", ai_c_group="a", gpu_hours=2.0, period_start="2025-05-01"),
+    ]
+    groups = {r.ai_c_group: r for r in aggregate_rows(rows, by_group=True)}
+    assert groups["a"].gpu_hours == 3.5 and groups["b"].gpu_hours == 1.5
+    assert groups["a"].period_start == "2025-05-01"
+    total = sum_rows(rows, ignore_users=["u2"])
+    assert isinstance(total, UsageRow) and total.gpu_hours == 1.5
+
+
+def test_parse_filter():
+    from usage_report.rows import RowFilter, parse_filter
+
+    assert parse_filter("gpu_hours>=100") == RowFilter("gpu_hours", ">=", 100.0)
+    assert parse_filter("projekt = pn12*") == RowFilter("projekt", "=", "pn12*")
+    # values may contain operators, the first one in the spec splits it
+    assert parse_filter("kennung=a!=b") == RowFilter("kennung", "=", "a!=b")
+    assert parse_filter("projekt!=a=b") == RowFilter("projekt", "!=", "a=b")
+    assert parse_filter("gpu_hours<=1") == RowFilter("gpu_hours", "<=", 1.0)
+    row = UsageRow.from_dict({"kennung": "ab12cde", "projekt": "pn12xy", "gpu_hours": 5})
+    assert parse_filter("projekt=pn12*").matches(row)
+    assert not parse_filter("kennung!=ab*").matches(row)
+    assert parse_filter("ai_c_group!=mcml*").matches(row)
+    assert not parse_filter("gpu_hours>5").matches(row)
+    for spec in ("gpu_hours>=many", "email=x", "projekt>a", "projekt"):
+        with pytest.raises(ValueError):
+            parse_filter(spec)
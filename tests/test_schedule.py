@@ -0,0 +1,106 @@
+from __future__ import annotations
+import sys, pathlib; sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import json
+from datetime import datetime
+
+import pytest
+
+from usage_report.database import list_schedule_runs
+from usage_report.schedule import (
+    ScheduledJob,
+    _JobLock,
+    due_target,
+    load_schedule,
+    run_job,
+    run_pending,
+)
+
+
+def test_load_schedule(tmp_path):
+    path = tmp_path / "schedule.json"
+    path.write_text(
+        json.dumps(
+            {
+                "jobs": [
+                    {"name": "mtd", "every": "daily", "at": "02:00", "jitter": 60},
+                    {"name": "close", "month": "previous", "after_close": True},
+                ]
+            }
+        )
+    )
+    jobs = load_schedule(path)
+    assert jobs[0].every == 86400
+    assert jobs[0].jitter == 60
+    assert jobs[1].after_close is True
+
+    path.write_text(json.dumps({"jobs": [{"name": "x", "every": 10, "bogus": 1}]}))
+    with pytest.raises(ValueError):
+        load_schedule(path)
+
+
+def test_due_target_interval_and_daily():
+    hourly = ScheduledJob("h", every=3600)
+    now = datetime(2025, 6, 15, 12, 0)
+    assert due_target(hourly, now, []) == "2025-06"
+    runs = [{"target": "2025-06", "started": "2025-06-15T11:30:00", "status": "ok"}]
+    assert due_target(hourly, now, runs) is None
+    runs[0]["started"] = "2025-06-15T10:59:00"
+    assert due_target(hourly, now, runs) == "2025-06"
+
+    daily = ScheduledJob("d", every=86400, at="02:00")
+    runs = [{"target": "2025-06", "started": "2025-06-15T02:05:00", "status": "ok"}]
+    assert due_target(daily, now, runs) is None
+    assert due_target(daily, datetime(2025, 6, 16, 1, 0), runs) is None
+    assert due_target(daily, datetime(2025, 6, 16, 2, 1), runs) == "2025-06"
+
+
+def test_due_target_after_close_runs_once():
+    job = ScheduledJob("close", month="previous", after_close=True, close_delay=3600)
+    assert due_target(job, datetime(2025, 7, 1, 0, 30), []) is None
+    assert due_target(job, datetime(2025, 7, 1, 2, 0), []) == "2025-06"
+    failed = [{"target": "2025-06", "started": "2025-07-01T02:00:00", "status": "error"}]
+    assert due_target(job, datetime(2025, 7, 1, 3, 0), failed) == "2025-06"
+    done = [{"target": "2025-06", "started": "2025-07-01T02:00:00", "status": "ok"}]
+    assert due_target(job, datetime(2025, 7, 20), done) is None
+
+
+def test_run_pending_records_status(tmp_path):
+    db = tmp_path / "usage.db"
+    calls = []
+
+    def fake_collect(month, **kwargs):
+        calls.append(month)
+        if kwargs["partitions"] == ["bad"]:
+            raise RuntimeError("sacct timeout")
+
+    jobs = [
+        ScheduledJob("ok", month="2025-06", every=3600, jitter=5),
+        ScheduledJob("bad", month="2025-05", every=3600, partitions=["bad"]),
+    ]
+    delays = []
+    results = run_pending(jobs, db_path=db, collect=fake_collect, sleep=delays.append)
+    assert results == {"ok": "ok", "bad": "error"}
+    assert calls == ["2025-06", "2025-05"]
+    assert len(delays) == 1 and 0 <= delays[0] <= 5
+
+    runs = {r["job"]: r for r in list_schedule_runs(db_path=db)}
+    assert runs["ok"]["status"] == "ok"
+    assert runs["ok"]["duration"] is not None
+    assert runs["bad"]["error"] == "sacct timeout"
+
+    # nothing is due again within the interval
+    assert run_pending(jobs, db_path=db, collect=fake_collect) == {}
+
+
+def test_run_job_skips_active_run(tmp_path):
+    db = tmp_path / "usage.db"
+    job = ScheduledJob("busy", every=60)
+    lock = _JobLock(tmp_path / "schedule-busy.lock")
+    assert lock.acquire()
+    try:
+        status = run_job(job, "2025-06", db_path=db, collect=lambda *a, **k: None)
+    finally:
+        lock.release()
+    assert status == "skipped"
+    assert list_schedule_runs(db_path=db) == []
@@ -0,0 +1,134 @@
+from __future__ import annotations
+import sys, pathlib; sys.path.insert(0, str(pathlib.Path(__file__).resolve().parents[1]))
+
+import threading
+
+import pytest
+
+from usage_report import report
+from usage_report.database import store_month
+from usage_report.server import DaemonState, UsageServer, query_daemon
+
+
+@pytest.fixture
+def daemon(tmp_path, monkeypatch):
+    db = tmp_path / "usage.db"
+    rows = [
+        {"kennung": "u1", "ai_c_group": "g1", "cpu_hours": 1.0, "gpu_hours": 2.0, "ram_gb_hours": 0.0},
+        {"kennung": "u2", "ai_c_group": "g2", "cpu_hours": 3.0, "gpu_hours": 4.0, "ram_gb_hours": 0.0},
+    ]
+    store_month("2025-06", "2025-06-01", "2025-06-30", rows, db_path=db)
+    lookups = []
+
+    class FakeAPI:
+        def __init__(self, netrc_file=None):
+            pass
+
+        def fetch_user(self, user_id):
+            lookups.append(user_id)
+            return {"kennung": user_id, "vorname": "A", "nachname": "B", "projekt": "p"}
+
+    monkeypatch.setattr(report, "SimAPI", FakeAPI)
+    monkeypatch.setattr(report, "list_user_groups", lambda user: [])
+    sock = pathlib.Path("/tmp") / f"usage-test-{id(tmp_path)}.sock"
+    state = DaemonState(db_path=db)
+    server = UsageServer(sock, state)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield sock, state, lookups, db
+    server.shutdown()
+    server.server_close()
+    sock.unlink()
+
+
+def test_daemon_show_uses_warm_cache(daemon):
+    sock, state, lookups, _ = daemon
+    request = {"command": "show", "month": "2025-06", "partitions": None}
+    first = query_daemon(request, path=sock)
+    assert first["tables"][0]["rows"][0]["first_name"] == "A"
+    assert sorted(lookups) == ["u1", "u2"]
+    query_daemon(dict(request, top=1, sort_key="gpu_hours", reverse=True), path=sock)
+    assert len(lookups) == 2
+
+
+def test_daemon_aggregate_and_invalidation(daemon):
+    sock, state, lookups, db = daemon
+    request = {"command": "aggregate", "months": ["2025-06"], "aggregate": "groups"}
+    rows = query_daemon(request, path=sock)["rows"]
+    assert {r["ai_c_group"]: r["gpu_hours"] for r in rows} == {"g1": 2.0, "g2": 4.0}
+    assert len(state.rollups) == 1
+
+    store_month(
+        "2025-06",
+        "2025-06-01",
+        "2025-06-30",
+        [{"kennung": "u1", "ai_c_group": "g1", "gpu_hours": 7.0}],
+        db_path=db,
+    )
+    rows = query_daemon(request, path=sock)["rows"]
+    assert [r["gpu_hours"] for r in rows] == [7.0]
+
+
+def test_daemon_missing_month_falls_back(daemon):
+    sock = daemon[0]
+    request = {"command": "aggregate", "months": ["2025-01"], "aggregate": "all"}
+    assert query_daemon(request, path=sock) is None
+
+
+def test_query_daemon_without_socket(tmp_path):
+    assert query_daemon({"command": "ping"}, path=tmp_path / "missing.sock") is None
+
+
+def test_pooled_connections_are_thread_safe(tmp_path):
+    from usage_report.database import (
+        close_connection_pool,
+        enable_connection_pool,
+        load_sim_record,
+        store_sim_record,
+    )
+
+    db = tmp_path / "usage.db"
+    errors = []
+    start = threading.Barrier(8)
+
+    def worker(n):
+        start.wait()
+        try:
+            for i in range(200):
+                user = f"u{n}-{i}"
+                store_sim_record(user, "{}", etag=None, last_modified=None, fetched=i, db_path=db)
+                assert load_sim_record(user, db_path=db)["fetched"] == i
+        except Exception as exc:  # collected for the main thread
+            errors.append(exc)
+
+    enable_connection_pool()
+    try:
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        close_connection_pool()
+    assert errors == []
+    assert load_sim_record("u7-199", db_path=db)["fetched"] == 199
+
+
+def test_daemon_serves_clients_concurrently(daemon, monkeypatch):
+    import os
+    import socket
+    import stat
+
+    sock, state, lookups, _ = daemon
+    assert stat.S_IMODE(os.stat(sock).st_mode) == 0o600
+    netrc_files = []
+    monkeypatch.setattr(
+        report, "enrich_report_rows",
+        lambda rows, netrc_file=None, **k: netrc_files.append(netrc_file) or rows,
+    )
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as idle:
+        # an open connection without a request does not block others
+        idle.connect(str(sock))
+        request = {"command": "show", "month": "2025-06", "netrc_file": "/etc/shadow"}
+        assert query_daemon(request, path=sock, timeout=5) is not None
+    assert netrc_files == [None]
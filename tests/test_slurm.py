@@ -4,7 +4,14 @@ from unittest import mock
 
 import pytest
 
-from usage_report.slurm import parse_elapsed, parse_mem, fetch_usage
+from usage_report.slurm import (
+    parse_elapsed,
+    parse_mem,
+    fetch_usage,
+    expand_partitions,
+    list_partitions,
+    plan_sacct_command,
+)
 
 
 def test_parse_elapsed():
@@ -21,27 +28,206 @@ def test_parse_mem():
 
 def test_fetch_usage():
     sample = (
-        "JobID|Partition|Elapsed|NCPUS|AllocTRES\n"
-        "123|gpu|01:00:00|4|cpu=4,mem=8000M,gres/gpu=2\n"
-        "123.batch|gpu|00:10:00|4|cpu=4,mem=8000M,gres/gpu=2\n"
+        "123|gpu|3600|4|cpu=4,mem=8000M,gres/gpu=2\n"
+        "124|gpu|1800|2|cpu=2,mem=4000M\n"
     )
     mocked_proc = mock.Mock(stdout=sample)
-    with mock.patch("subprocess.run", return_value=mocked_proc):
+    with mock.patch("subprocess.run", return_value=mocked_proc) as run:
         usage = fetch_usage("user", "2025-01-01")
-    assert usage["cpu_hours"] == 4.0
+    cmd = run.call_args.args[0]
+    assert "-X" in cmd and "--noheader" in cmd
+    assert "--format=JobID,Partition,ElapsedRaw,NCPUS,AllocTRES,Start,End" in cmd
+    assert usage["cpu_hours"] == 5.0
     assert usage["gpu_hours"] == 2.0
-    assert usage["ram_gb_hours"] == pytest.approx(8.0, rel=0.05)
+    assert usage["ram_gb_hours"] == pytest.approx(10.0, rel=0.05)
+
+
+def _fake_slurm(sacct_output, partitions="lrz-gpu\nlrz-cpu\nmcml-cpu\n"):
+    calls = []
+
+    def run(cmd, **kwargs):
+        calls.append(cmd)
+        if cmd[0] == "sinfo":
+            return mock.Mock(stdout=partitions)
+        return mock.Mock(stdout=sacct_output)
+
+    return run, calls
 
 
 def test_fetch_usage_partition_filter():
+    list_partitions.cache_clear()
     sample = (
-        "JobID|Partition|Elapsed|NCPUS|AllocTRES\n"
-        "1|lrz-gpu|01:00:00|4|cpu=4,mem=8000M,gres/gpu=2\n"
-        "2|mcml-cpu|02:00:00|8|cpu=8,mem=16000M\n"
+        "1|lrz-gpu|3600|4|cpu=4,mem=8000M,gres/gpu=2\n"
+        "2|mcml-cpu|7200|8|cpu=8,mem=16000M\n"
     )
-    mocked_proc = mock.Mock(stdout=sample)
-    with mock.patch("subprocess.run", return_value=mocked_proc):
+    run, calls = _fake_slurm(sample)
+    with mock.patch("subprocess.run", side_effect=run):
         usage = fetch_usage("user", "2025-01-01", partitions=["lrz*"])
+    sacct = calls[-1]
+    assert sacct[sacct.index("-r") + 1] == "lrz-cpu,lrz-gpu"
     assert usage["gpu_hours"] == 2.0
     assert usage["cpu_hours"] == 4.0
+    list_partitions.cache_clear()
+
+
+def test_plan_sacct_command_partitions():
+    list_partitions.cache_clear()
+    run, calls = _fake_slurm("")
+    with mock.patch("subprocess.run", side_effect=run):
+        cmd = plan_sacct_command("user", "2025-01-01", "2025-01-31", partitions=["mcml*", "old"])
+        plan_sacct_command("user", "2025-01-01", partitions=["lrz*"])
+        assert plan_sacct_command("user", "2025-01-01", partitions=["none*"]) is None
+    assert cmd[cmd.index("-r") + 1] == "mcml-cpu,old"
+    # plain queries pass the range to sacct unchanged
+    assert cmd[cmd.index("-E") + 1] == "2025-01-31"
+    assert "-T" not in cmd
+    # the partition list is looked up once
+    assert sum(1 for c in calls if c[0] == "sinfo") == 1
+    list_partitions.cache_clear()
+
+
+def test_expand_partitions_without_sinfo():
+    assert expand_partitions(["lrz*"], known=[]) is None
+    assert expand_partitions(["gpu", "cpu"], known=[]) == ["gpu", "cpu"]
+
+
+def test_planned_command_logged(caplog):
+    import logging
+
+    with caplog.at_level(logging.DEBUG, logger="usage_report.slurm"):
+        plan_sacct_command("user", "2025-01-01")
+    assert "Planned sacct command: sacct -X --noheader" in caplog.text
+
+
+def test_fetch_usage_by_partition():
+    from usage_report.slurm import fetch_usage_by_partition, filter_partition_usage
+
+    sample = (
+        "1|lrz-gpu|3600|4|cpu=4,mem=8000M,gres/gpu=2\n"
+        "2|mcml-cpu|7200|8|cpu=8,mem=16000M\n"
+        "3|lrz-gpu|1800|2|cpu=2,mem=2000M,gres/gpu=1\n"
+    )
+    with mock.patch("subprocess.run", return_value=mock.Mock(stdout=sample)) as run:
+        breakdown = fetch_usage_by_partition("user", "2025-01-01", "2025-01-31")
+    assert run.call_count == 1
+    assert "-r" not in run.call_args.args[0]
+    assert breakdown["lrz-gpu"]["gpu_hours"] == 2.5
+    assert breakdown["mcml-cpu"]["cpu_hours"] == 16.0
+    assert filter_partition_usage(breakdown, ["lrz*"])["cpu_hours"] == 5.0
+    assert filter_partition_usage(breakdown)["cpu_hours"] == 21.0
+
+
+def test_fetch_daily_usage_splits_jobs_at_midnight():
+    from usage_report.slurm import fetch_daily_usage
+
+    sample = (
+        # 22:00 to 02:00 on the next day
+        "1|lrz-gpu|14400|4|cpu=4,mem=8G,gres/gpu=1|2025-01-01T22:00:00|2025-01-02T02:00:00\n"
+        # started before the period, counted from its start
+        "2|mcml-cpu|0|2|cpu=2,mem=4G|2024-12-31T12:00:00|2025-01-01T06:00:00\n"
+        # pending job without start
+        "3|lrz-gpu|0|4|cpu=4|Unknown|Unknown\n"
+    )
+    with mock.patch("subprocess.run", return_value=mock.Mock(stdout=sample)):
+        breakdown, daily = fetch_daily_usage("user", "2025-01-01", "2025-01-31")
+    assert daily["2025-01-01"]["lrz-gpu"]["gpu_hours"] == pytest.approx(2.0)
+    assert daily["2025-01-02"]["lrz-gpu"]["cpu_hours"] == pytest.approx(8.0)
+    assert daily["2025-01-01"]["mcml-cpu"]["cpu_hours"] == pytest.approx(12.0)
+    assert "2024-12-31" not in daily
+    assert breakdown["lrz-gpu"]["cpu_hours"] == pytest.approx(16.0)
+    assert breakdown["mcml-cpu"]["ram_gb_hours"] == pytest.approx(24.0)
+
+
+def test_parse_job_records_typed_fields():
+    from datetime import datetime
+
+    from usage_report.slurm import SACCT_FIELDS, JobRecord, parse_job_records
+
+    text = (
+        "JobID|User|Partition|ElapsedRaw|NCPUS|AllocTRES|Start\n"
+        "7|alice|lrz-gpu|3600|4|cpu=4,mem=8G,gres/gpu=2|2025-01-01T10:00:00\n"
+        "7.batch|alice|lrz-gpu|3600|4|cpu=4,mem=8G|2025-01-01T10:00:00\n"
+        "8|bob|lrz-gpu|60|1|cpu=1,mem=512M|Unknown\n"
+    )
+    records = list(parse_job_records(text))
+    assert records[0] == JobRecord(
+        "7", "alice", "lrz-gpu", 3600, 4, 2, 8.0, datetime(2025, 1, 1, 10), None
+    )
+    assert records[1].is_step and not records[0].is_step
+    assert records[2].mem_gb == 0.5 and records[2].start is None
+    # partition names are shared between records
+    assert records[0].partition is records[2].partition
+
+    no_user = list(parse_job_records("1|cpu|10|1|cpu=1\n", SACCT_FIELDS, user="carol"))
+    assert no_user[0].user == "carol" and no_user[0].elapsed == 10
+
+
+def test_fetch_cluster_usage_queries_clusters_with_M():
+    from usage_report.slurm import fetch_cluster_usage
+
+    outputs = {
+        "cm4": "1|cm4_tiny|3600|4|cpu=4,mem=8G|2025-01-02T08:00:00|2025-01-02T09:00:00\n",
+        "lrz-ai": "2|lrz-gpu|3600|2|cpu=2,mem=4G,gres/gpu=1|2025-01-02T10:00:00|2025-01-02T11:00:00\n",
+    }
+
+    def fake_run(cmd, **kwargs):
+        return mock.Mock(stdout=outputs[cmd[cmd.index("-M") + 1]])
+
+    with mock.patch("subprocess.run", side_effect=fake_run) as run:
+        breakdown, daily, per_cluster = fetch_cluster_usage(
+            "user", "2025-01-01", "2025-01-31", ["cm4", "lrz-ai"]
+        )
+        total = fetch_usage("user", "2025-01-01", "2025-01-31", clusters=["cm4", "lrz-ai"])
+    assert run.call_count == 4
+    assert set(per_cluster) == {"cm4", "lrz-ai"}
+    assert per_cluster["lrz-ai"]["lrz-gpu"]["gpu_hours"] == 1.0
+    assert breakdown["cm4_tiny"]["cpu_hours"] == 4.0
+    assert daily["2025-01-02"]["lrz-gpu"]["cpu_hours"] == 2.0
+    assert total["cpu_hours"] == 6.0 and total["gpu_hours"] == 1.0
+
+
+def test_partition_filter_is_expanded_per_cluster():
+    list_partitions.cache_clear()
+    partitions = {"local": "CLUSTER: local\nlrz-cpu\n", "other": "CLUSTER: other\nmcml-gpu\n"}
+    outputs = {
+        "local": "1|lrz-cpu|3600|4|cpu=4,mem=8G|2025-01-02T08:00:00|2025-01-02T09:00:00\n",
+        "other": "2|mcml-gpu|3600|2|cpu=2,mem=4G,gres/gpu=1|2025-01-02T10:00:00|2025-01-02T11:00:00\n",
+    }
+    calls = []
+
+    def fake_run(cmd, **kwargs):
+        calls.append(cmd)
+        cluster = cmd[cmd.index("-M") + 1]
+        return mock.Mock(stdout=(partitions if cmd[0] == "sinfo" else outputs)[cluster])
+
+    with mock.patch("subprocess.run", side_effect=fake_run):
+        usage = fetch_usage(
+            "user", "2025-01-01", "2025-01-31", partitions=["mcml*"], clusters=["local", "other"]
+        )
+    assert usage["gpu_hours"] == 1.0 and usage["cpu_hours"] == 2.0
+    sacct = [c for c in calls if c[0] == "sacct"]
+    # the filter matches nothing on "local", so only "other" is queried
+    assert len(sacct) == 1 and sacct[0][sacct[0].index("-r") + 1] == "mcml-gpu"
+    assert sorted(c[c.index("-M") + 1] for c in calls if c[0] == "sinfo") == ["local", "other"]
+    list_partitions.cache_clear()
+
+
+def test_only_daily_buckets_truncate_the_sacct_window():
+    from usage_report.slurm import fetch_daily_usage
+
+    # 20:00 on the last day to 04:00 after the period
+    sample = "1|lrz-gpu|28800|2|cpu=2,mem=4G|2025-01-31T20:00:00|2025-02-01T04:00:00\n"
+    with mock.patch("subprocess.run", return_value=mock.Mock(stdout=sample)) as run:
+        usage = fetch_usage("user", "2025-01-01", "2025-01-31")
+        breakdown, _ = fetch_daily_usage("user", "2025-01-01", "2025-01-31")
+    query, buckets = (c.args[0] for c in run.call_args_list)
+    assert query[:5] == ["sacct", "-X", "--noheader", "--parsable2", "-u"]
+    assert query[query.index("-E") + 1] == "2025-01-31"
+    # plain queries count the whole run time as before
+    assert usage["cpu_hours"] == pytest.approx(16.0)
 
+    assert buckets[:5] == ["sacct", "-X", "--noheader", "--parsable2", "-T"]
+    assert buckets[buckets.index("-S") + 1] == "2025-01-01"
+    assert buckets[buckets.index("-E") + 1] == "2025-01-31T23:59:59"
+    # only the four hours inside the period are in the buckets
+    assert breakdown["lrz-gpu"]["cpu_hours"] == pytest.approx(8.0)
@@ -33,3 +33,27 @@ def test_fetch_active_usage():
     assert usage["partitions"] == ["gpu"]
     assert usage["user1"] == 10.0
     assert usage["user2"] == 5.0
+
+
+def test_closed_periods_are_served_from_store(tmp_path):
+    from usage_report.sreport import sreport_cache
+
+    mocked_proc = mock.Mock(stdout=" Login  Used\n user1  10\n user2  5\n")
+    db = tmp_path / "usage.db"
+    with mock.patch("subprocess.run", return_value=mocked_proc) as run:
+        with sreport_cache(db):
+            first = fetch_active_usage("2024-03-01", "2024-03-31", active_users=["user1"])
+            second = fetch_active_usage("2024-03-01", "2024-03-31", active_users=["user2"])
+            # open periods are always queried
+            fetch_active_usage("2024-03-01")
+        assert run.call_count == 2
+        assert first["user1"] == 10.0 and second == {"partitions": [], "user2": 5.0}
+
+        with sreport_cache(db, refresh=True):
+            fetch_active_usage("2024-03-01", "2024-03-31")
+        assert run.call_count == 3
+
+        # results are stored per cluster
+        fetch_active_usage("2024-03-01", "2024-03-31", cluster="c2", cache_db=db)
+        assert run.call_count == 4
+        assert run.call_args.args[0][:3] == ["sreport", "-M", "c2"]
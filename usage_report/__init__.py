@@ -1,18 +1,36 @@
-"""Usage Report library."""
+"""Usage Report library.
 
-from .api import SimAPI, SimAPIError
-from .slurm import fetch_usage, parse_elapsed, parse_tres, parse_mem
-from .report import (
-    create_report,
-    create_active_reports,
-    write_report_csv,
-    aggregate_rows,
-    sum_rows,
-)
-from .sreport import fetch_active_usage, parse_sreport_output
-from .database import store_month, load_month, list_months
-from .groups import list_user_groups
-from .plotting import create_donut_plot
+Public names are imported from their submodules on first access so that
+``import usage_report`` stays cheap.
+"""
+from __future__ import annotations
+
+_EXPORTS = {
+    "SimAPI": ".api",
+    "SimAPIError": ".api",
+    "fetch_usage": ".slurm",
+    "parse_elapsed": ".slurm",
+    "parse_tres": ".slurm",
+    "parse_mem": ".slurm",
+    "parse_job_records": ".slurm",
+    "JobRecord": ".slurm",
+    "create_report": ".report",
+    "create_active_reports": ".report",
+    "write_report_csv": ".report",
+    "aggregate_rows": ".report",
+    "sum_rows": ".report",
+    "UsageRow": ".rows",
+    "fetch_active_usage": ".sreport",
+    "parse_sreport_output": ".sreport",
+    "store_month": ".database",
+    "load_month": ".database",
+    "list_months": ".database",
+    "merge_databases": ".database",
+    "list_user_groups": ".groups",
+    "create_donut_plot": ".plotting",
+    "create_trend_plot": ".plotting",
+    "export_usage": ".export",
+}
 
 __all__ = [
     "SimAPI",
@@ -21,17 +39,37 @@ __all__ = [
     "parse_elapsed",
     "parse_tres",
     "parse_mem",
+    "parse_job_records",
+    "JobRecord",
     "create_report",
     "create_active_reports",
     "write_report_csv",
     "aggregate_rows",
     "sum_rows",
+    "UsageRow",
     "create_donut_plot",
+    "create_trend_plot",
     "list_user_groups",
     "fetch_active_usage",
     "parse_sreport_output",
     "store_month",
     "load_month",
     "list_months",
+    "merge_databases",
+    "export_usage",
 ]
 __version__ = "0.1.0"
+
+
+def __getattr__(name: str) -> object:
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    module = __import__(f"{__name__}{module_name}", fromlist=[name])
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
@@ -4,14 +4,51 @@ from __future__ import annotations
 import json
 import netrc
 import base64
+import random
+import socket
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
 from pathlib import Path
-from typing import Any
+from typing import Any, Iterator
 
 import logging
 from urllib import request, error
 
+from .limiter import AIMDLimiter
+from .memo import memoized
+
 logger = logging.getLogger(__name__)
 
+# Seconds a cached SIM record is used without asking SIM whether it changed
+RECORD_MAX_AGE = 24 * 3600.0
+
+# Database caching SIM records, see :func:`record_cache`
+_record_db: Path | None = None
+
+# Upper bound of concurrent SIM requests; the limiter adapts below it
+SIM_MAX_WORKERS = 16
+
+# Shared by all SimAPI instances so parallel lookups adapt to SIM together
+_limiter = AIMDLimiter(maximum=SIM_MAX_WORKERS)
+
+# Status codes telling us to slow down
+_RETRY_STATUS = {429, 500, 502, 503, 504}
+
+
+@contextmanager
+def record_cache(db_path: str | Path | None) -> Iterator[None]:
+    """Cache SIM records in *db_path* for :class:`SimAPI` instances in the block.
+
+    ``None`` disables the cache.
+    """
+    global _record_db
+    previous, _record_db = _record_db, Path(db_path) if db_path else None
+    try:
+        yield
+    finally:
+        _record_db = previous
+
 
 class SimAPIError(Exception):
     """Custom exception for API errors."""
@@ -22,11 +59,34 @@ class SimAPI:
 
     BASE_URL = "https://simapi.sim.lrz.de/user/"
 
-    def __init__(self, netrc_file: str | Path | None = None) -> None:
+    def __init__(
+        self,
+        netrc_file: str | Path | None = None,
+        *,
+        cache_db: str | Path | None = None,
+        max_age: float = RECORD_MAX_AGE,
+        limiter: AIMDLimiter | None = None,
+        retries: int = 4,
+        backoff: float = 0.5,
+        timeout: float = 30.0,
+    ) -> None:
         self.netrc_file = Path(netrc_file) if netrc_file else Path.home() / ".netrc"
+        self.cache_db = Path(cache_db) if cache_db else _record_db
+        self.max_age = max_age
+        self.limiter = limiter or _limiter
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._auth: tuple[str, str] | None = None
         logger.debug("Using netrc file %s", self.netrc_file)
 
     def _get_auth(self) -> tuple[str, str]:
+        """Return the credentials, parsing the netrc file once per run."""
+        if self._auth is None:
+            self._auth = memoized(("netrc", str(self.netrc_file)), self._read_auth)
+        return self._auth
+
+    def _read_auth(self) -> tuple[str, str]:
         try:
             auths = netrc.netrc(str(self.netrc_file))
             login, _, password = auths.authenticators("simapi.sim.lrz.de")
@@ -39,31 +99,139 @@ class SimAPI:
     def fetch_user(self, user_id: str) -> dict[str, Any]:
         """Fetch user information for *user_id*.
 
+        With a record cache (*cache_db*) records younger than *max_age*
+        seconds are returned without a request.  Older records are
+        revalidated with ``If-None-Match``/``If-Modified-Since`` so an
+        unchanged record costs a ``304`` response without a body.
+
         Parameters
         ----------
         user_id:
             The LRZ user identifier to query.
         """
+        record = None
+        if self.cache_db is not None:
+            from .database import load_sim_record
+
+            record = load_sim_record(user_id, db_path=self.cache_db)
+            if record is not None and time.time() - record["fetched"] < self.max_age:
+                logger.debug("Using cached SIM record of %s", user_id)
+                return self._decode(record["body"])
         login, password = self._get_auth()
         url = self.BASE_URL + user_id
         headers = {"Accept": "application/json"}
         credentials = f"{login}:{password}".encode()
         headers["Authorization"] = "Basic " + base64.b64encode(credentials).decode()
+        if record is not None:
+            if record["etag"]:
+                headers["If-None-Match"] = record["etag"]
+            if record["last_modified"]:
+                headers["If-Modified-Since"] = record["last_modified"]
         logger.debug("Fetching user %s from %s", user_id, url)
         req = request.Request(url, headers=headers)
         try:
-            with request.urlopen(req) as resp:
-                body = resp.read().decode()
-                logger.debug("SIM API responded with status %s", resp.status)
-                if resp.status != 200:
-                    logger.debug("Response body: %s", body)
-                    raise SimAPIError(
-                        f"API request failed with status {resp.status}: {body}"
-                    )
+            status, body, validators = self._open(req)
+            logger.debug("SIM API responded with status %s", status)
+            if status != 200:
+                logger.debug("Response body: %s", body)
+                raise SimAPIError(f"API request failed with status {status}: {body}")
+        except error.HTTPError as err:
+            if err.code == 304 and record is not None:
+                return self._revalidated(user_id, record)
+            logger.error("SIM API request for %s failed: %s", user_id, err)
+            raise SimAPIError(f"API request failed with status {err.code}") from err
         except error.URLError as err:
             logger.error("Failed to contact SIM API: %s", err)
             raise SimAPIError(f"Failed to contact API: {err}") from err
+        data = self._decode(body)
+        if self.cache_db is not None:
+            from .database import store_sim_record
+
+            store_sim_record(
+                user_id,
+                body,
+                etag=validators.get("ETag"),
+                last_modified=validators.get("Last-Modified"),
+                fetched=time.time(),
+                db_path=self.cache_db,
+            )
+        return data
+
+    def _open(self, req: request.Request) -> tuple[int, str, Any]:
+        """Return status, body and headers of *req*, retrying when overloaded.
+
+        Requests are limited by the shared :class:`AIMDLimiter`.  Rate limited
+        (429), failing (5xx) and timed out requests are retried up to
+        *retries* times after a delay given by ``Retry-After`` or a jittered
+        exponential backoff.
+        """
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            with self.limiter.slot() as ticket:
+                begin = time.monotonic()
+                try:
+                    with request.urlopen(req, timeout=self.timeout) as resp:
+                        body = resp.read().decode()
+                        self.limiter.success(time.monotonic() - begin)
+                        return resp.status, body, getattr(resp, "headers", None) or {}
+                except error.HTTPError as err:
+                    if err.code not in _RETRY_STATUS or attempt == self.retries:
+                        raise
+                    retry_after = _retry_after(err.headers)
+                    reason: object = err.code
+                except (error.URLError, socket.timeout) as err:
+                    timed_out = isinstance(err, socket.timeout) or isinstance(
+                        getattr(err, "reason", None), socket.timeout
+                    )
+                    if not timed_out or attempt == self.retries:
+                        raise
+                    reason = "timeout"
+                self.limiter.overload(ticket, retry_after)
+            delay = (
+                retry_after
+                if retry_after is not None
+                else random.uniform(0, self.backoff * 2**attempt)
+            )
+            logger.debug(
+                "SIM request %s failed (%s), retrying in %.2fs",
+                req.full_url,
+                reason,
+                delay,
+            )
+            time.sleep(delay)
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    def _revalidated(self, user_id: str, record: dict[str, Any]) -> dict[str, Any]:
+        """Renew the unchanged cached *record* of *user_id* and return it."""
+        from .database import renew_sim_record
+
+        assert self.cache_db is not None
+        renew_sim_record(user_id, time.time(), db_path=self.cache_db)
+        logger.debug(
+            "SIM record of %s not modified, saved %d bytes",
+            user_id,
+            len(record["body"].encode()),
+        )
+        return self._decode(record["body"])
+
+    @staticmethod
+    def _decode(body: str) -> dict[str, Any]:
         try:
             return json.loads(body)
         except json.JSONDecodeError as err:
             raise SimAPIError("Failed to decode JSON response") from err
+
+
+def _retry_after(headers: Any) -> float | None:
+    """Return the delay requested by a ``Retry-After`` header in seconds."""
+    value = headers.get("Retry-After") if headers is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
@@ -1,37 +1,115 @@
-"""Command line interface for usage."""
+"""Command line interface for usage.
+
+Subcommand dependencies are imported lazily so that cheap commands such as
+``usage --help`` or ``usage report list`` do not pay for loading the SIM
+client, the Slurm helpers or plotting support.
+"""
 from __future__ import annotations
 
 import argparse
+import json
 import sys
-from pprint import pprint
-from datetime import datetime, timedelta
-import logging
-
-from .api import SimAPI, SimAPIError
-from .slurm import fetch_usage
-from .sreport import fetch_active_usage
-from .database import store_month, list_months, load_month
-from .report import (
-    create_report,
-    create_active_reports,
-    enrich_report_rows,
-    write_report_csv,
-    aggregate_rows,
-    sum_rows,
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+
+# Attributes resolved on first use, mapped to the module providing them.
+_LAZY_ATTRS = {
+    "SimAPI": ".api",
+    "SimAPIError": ".api",
+    "fetch_usage": ".slurm",
+    "fetch_active_usage": ".sreport",
+    "fetch_cluster_active_usage": ".sreport",
+    "DEFAULT_DB_PATH": ".database",
+    "store_month": ".database",
+    "list_months": ".database",
+    "load_month": ".database",
+    "load_range_usage": ".database",
+    "select_top": ".database",
+    "create_report": ".report",
+    "create_active_reports": ".report",
+    "collect_active_months": ".report",
+    "enrich_stored_month": ".report",
+    "load_stored_tables": ".report",
+    "iter_stored_rows": ".report",
+    "load_range_reports": ".report",
+    "write_report_csv": ".report",
+    "aggregate_rows": ".report",
+    "aggregate_clusters": ".report",
+    "select_clusters": ".report",
+    "sum_rows": ".report",
+    "load_group_trend": ".report",
+    "create_donut_plot": ".plotting",
+    "create_trend_plot": ".plotting",
+    "default_export_path": ".export",
+    "export_usage": ".export",
+    "list_schedule_runs": ".database",
+    "merge_databases": ".database",
+    "MergeConflictError": ".database",
+    "load_schedule": ".schedule",
+    "run_pending": ".schedule",
+    "run_forever": ".schedule",
+    "query_daemon": ".server",
+    "serve": ".server",
+    "expand_month": ".dates",
+    "pprint": "pprint",
+}
+
+# Mirrors ``export.EXPORT_FORMATS`` without importing the export module.
+EXPORT_FORMATS = ("parquet", "arrow", "csv")
+
+# Mirrors ``plotting.TREND_KINDS`` without importing the plotting module.
+TREND_KINDS = ("stacked", "line")
+
+OUTPUT_FORMATS = ("table", "json", "jsonl")
+
+# Mirrors ``rows.USAGE_COLUMNS``; stored months are sorted by these in SQL.
+USAGE_COLUMNS = ("cpu_hours", "gpu_hours", "ram_gb_hours")
+
+# Columns of the printed rows that --sortby accepts
+SORT_COLUMNS = (
+    "first_name",
+    "last_name",
+    "email",
+    "kennung",
+    "projekt",
+    "ai_c_group",
+    *USAGE_COLUMNS,
+    "timestamp",
+    "period_start",
+    "period_end",
+    "partition",
+    "cluster",
+    "month",
 )
-from .plotting import create_donut_plot
 
+# Mirrors ``report.ROSTER_SOURCES`` without importing the report module.
+ROSTER_SOURCES = ("auto", "list", "stored", "sreport")
+
+
+def __getattr__(name: str) -> object:
+    module_name = _LAZY_ATTRS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    if module_name.startswith("."):
+        module_name = f"{__package__}{module_name}"
+    module = __import__(module_name, fromlist=[name])
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
 
-def expand_month(month: str) -> tuple[str, str]:
-    """Return start and end dates for ``month`` (``YYYY-MM``)."""
-    dt = datetime.strptime(month, "%Y-%m")
-    start = dt.replace(day=1)
-    if dt.month == 12:
-        next_month = dt.replace(year=dt.year + 1, month=1, day=1)
-    else:
-        next_month = dt.replace(month=dt.month + 1, day=1)
-    last_day = next_month - timedelta(days=1)
-    return start.strftime("%Y-%m-%d"), last_day.strftime("%Y-%m-%d")
+
+def _need(*names: str) -> tuple:
+    """Return the lazily imported attributes *names*.
+
+    Values already present in the module namespace (for example replaced by
+    tests) take precedence over a fresh import.
+    """
+    namespace = globals()
+    return tuple(
+        namespace[name] if name in namespace else __getattr__(name)
+        for name in names
+    )
 
 
 def _parse_plot_spec(spec: str) -> tuple[str, str]:
@@ -52,8 +130,13 @@ def print_usage_table(
     sort_key: str | None = None,
     reverse: bool = False,
     columns: list[str] | None = None,
+    top: int | None = None,
 ) -> None:
-    """Print ``rows`` as a table."""
+    """Print ``rows`` as a table.
+
+    If *top* is given only the first *top* rows in sort order are printed.
+    They are picked with a heap instead of sorting all rows.
+    """
     if start or end:
         period = f"{start or '?'} - {end or '?'}"
         print(f"Period: {period}")
@@ -77,6 +160,12 @@ def print_usage_table(
             "period_end",
         ]
 
+    if sort_key:
+        (select_top,) = _need("select_top")
+        rows = select_top(rows, sort_key, reverse, top)
+    elif top is not None:
+        rows = rows[:top]
+
     widths = {c: len(c) for c in columns}
     for row in rows:
         for c in columns:
@@ -85,16 +174,6 @@ def print_usage_table(
                 val = f"{val:.1f}"
             widths[c] = max(widths[c], len(str(val)))
 
-    if sort_key:
-        try:
-            rows = sorted(rows, key=lambda r: r.get(sort_key) or 0, reverse=reverse)
-        except TypeError:
-            rows = sorted(
-                rows,
-                key=lambda r: str(r.get(sort_key, "")),
-                reverse=reverse,
-            )
-
     header = " ".join(f"{c:<{widths[c]}}" for c in columns)
     print(header)
     print("-" * len(header))
@@ -109,6 +188,120 @@ def print_usage_table(
         print(" ".join(parts))
 
 
+def _json_default(value: object) -> object:
+    return dict(value) if isinstance(value, Mapping) else str(value)
+
+
+def _to_json(value: object, **kwargs: object) -> str:
+    return json.dumps(value, default=_json_default, **kwargs)
+
+
+def _pick_columns(row: Mapping[str, object], columns: list[str] | None) -> dict[str, object]:
+    if columns is None:
+        return dict(row)
+    return {c: row.get(c) for c in columns}
+
+
+class JsonLinesWriter:
+    """Write rows to *stream* as JSON Lines, flushing after every row.
+
+    Instances are callables that can be passed as ``on_row`` callbacks and
+    may be called from several threads.  Only *columns* are written if
+    given; *extra* fields are added to every row.
+    """
+
+    def __init__(
+        self,
+        columns: list[str] | None = None,
+        *,
+        extra: Mapping[str, object] | None = None,
+        stream=None,
+    ) -> None:
+        self.columns = columns
+        self.extra = dict(extra or {})
+        self.stream = stream
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, row: Mapping[str, object]) -> None:
+        line = _to_json(_pick_columns({**row, **self.extra}, self.columns))
+        stream = self.stream or sys.stdout
+        with self._lock:
+            stream.write(line + "\n")
+            stream.flush()
+            self.count += 1
+
+
+def write_rows(
+    rows,
+    fmt: str = "table",
+    *,
+    start: str | None = None,
+    end: str | None = None,
+    sort_key: str | None = None,
+    reverse: bool = False,
+    columns: list[str] | None = None,
+    top: int | None = None,
+) -> None:
+    """Write *rows* in the output format *fmt*.
+
+    ``table`` prints them with :func:`print_usage_table` and ``json`` as one
+    sorted array of the *columns*.  ``jsonl`` writes every row as soon as
+    *rows* yields it, in the order given, so iterators are consumed with
+    constant memory; only with *top* the rows are collected and sorted.
+    """
+    if fmt == "table":
+        print_usage_table(
+            list(rows),
+            start=start,
+            end=end,
+            sort_key=sort_key,
+            reverse=reverse,
+            columns=columns,
+            top=top,
+        )
+        return
+    columns = columns or _USER_COLUMNS
+    if fmt == "jsonl" and top is None:
+        writer = JsonLinesWriter(columns)
+        for row in rows:
+            writer(row)
+        return
+    rows = list(rows)
+    if sort_key:
+        (select_top,) = _need("select_top")
+        rows = select_top(rows, sort_key, reverse, top)
+    elif top is not None:
+        rows = rows[:top]
+    if fmt == "jsonl":
+        writer = JsonLinesWriter(columns)
+        for row in rows:
+            writer(row)
+    else:
+        print(_to_json([_pick_columns(r, columns) for r in rows], indent=2))
+
+
+def _output_format(args: argparse.Namespace) -> str:
+    return getattr(args, "output_format", None) or "table"
+
+
+def _emit(value: object, args: argparse.Namespace, rows: list | None = None) -> None:
+    """Print a command result: pretty printed, as JSON or as JSON Lines.
+
+    JSON Lines output writes *rows* if given, otherwise *value* as one line.
+    """
+    fmt = _output_format(args)
+    if fmt == "table":
+        (pprint,) = _need("pprint")
+        pprint(value)
+    elif fmt == "json":
+        print(_to_json(value, indent=2))
+    else:
+        writer = JsonLinesWriter()
+        for row in rows if rows is not None else [value]:
+            writer(row)
+
+
 def print_report_table(report: dict[str, object]) -> None:
     """Print ``report`` dictionary as a single-row table."""
     if not report:
@@ -117,6 +310,45 @@ def print_report_table(report: dict[str, object]) -> None:
     print_usage_table([report])
 
 
+def _positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError("must be a positive integer")
+    return number
+
+
+def _shard_spec(value: str) -> tuple[int, int]:
+    """Parse an ``i/N`` shard specification."""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("must be i/N, e.g. 1/4") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError("shard i/N needs 1 <= i <= N")
+    return index, count
+
+
+def _where_spec(value: str) -> object:
+    """Parse a ``--where`` filter such as ``projekt=pn12*`` or ``gpu_hours>=100``."""
+    from .rows import parse_filter
+
+    try:
+        return parse_filter(value)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from None
+
+
+def _add_cluster_argument(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "-M",
+        "--cluster",
+        dest="clusters",
+        action="append",
+        help="Cluster to query, queried in parallel if given several times "
+        "(accepts comma separated values; default: the local cluster)",
+    )
+
+
 def _add_sim_parser(sub: argparse._SubParsersAction) -> None:
     sim_parser = sub.add_parser("sim", help="Fetch LRZ SIM API user info")
     sim_parser.add_argument("user_id", help="LRZ user identifier")
@@ -145,6 +377,7 @@ def _add_slurm_parser(sub: argparse._SubParsersAction) -> None:
         action="append",
         help="Partition to include (can be used multiple times, supports wildcards)",
     )
+    _add_cluster_argument(slurm_parser)
 
 
 def _add_report_parser(sub: argparse._SubParsersAction) -> None:
@@ -169,6 +402,7 @@ def _add_report_parser(sub: argparse._SubParsersAction) -> None:
         action="append",
         help="Partition to include (can be used multiple times, supports wildcards)",
     )
+    _add_cluster_argument(user_parser)
 
     active_parser = rep_sub.add_parser("active", help="Usage report for active users")
     grp_a = active_parser.add_mutually_exclusive_group(required=True)
@@ -191,13 +425,28 @@ def _add_report_parser(sub: argparse._SubParsersAction) -> None:
         "--aggregate",
         nargs="?",
         const="user",
-        choices=["user", "groups", "all"],
-        help="Aggregate cached months (optionally by group)",
+        choices=["user", "groups", "clusters", "all"],
+        help="Aggregate cached months (optionally by group or cluster)",
     )
     active_parser.add_argument(
         "--plot",
         dest="plot",
-        help="Create a plot from aggregated data (e.g. donut,gpu_hours)",
+        help="Create a plot from aggregated data (e.g. donut,gpu_hours) or a "
+        "trend of group usage over the --month list (stacked,gpu_hours or line,gpu_hours)",
+    )
+    active_parser.add_argument(
+        "--plot-output",
+        dest="plot_output",
+        default="usage_plot.png",
+        help="File the plot is written to; a .svg suffix writes SVG (default: usage_plot.png)",
+    )
+    active_parser.add_argument(
+        "--plot-backend",
+        dest="plot_backend",
+        choices=["auto", "matplotlib", "svg"],
+        default="auto",
+        help="Render plots with matplotlib or the built-in SVG renderer "
+        "(default: matplotlib if installed)",
     )
     active_parser.add_argument(
         "--ignore_user",
@@ -208,6 +457,8 @@ def _add_report_parser(sub: argparse._SubParsersAction) -> None:
         "--sortby",
         dest="sortby",
         default="gpu_hours",
+        choices=SORT_COLUMNS,
+        metavar="COLUMN",
         help="Column to sort by when showing cached data (default: gpu_hours)",
     )
     active_parser.add_argument(
@@ -215,6 +466,54 @@ def _add_report_parser(sub: argparse._SubParsersAction) -> None:
         action="store_true",
         help="Sort in descending order when showing cached data",
     )
+    active_parser.add_argument(
+        "--top",
+        type=_positive_int,
+        help="Only show the first N rows in sort order",
+    )
+    active_parser.add_argument(
+        "--workers",
+        type=_positive_int,
+        default=4,
+        help="Number of months collected in parallel (default: 4)",
+    )
+    active_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Query sreport again instead of using stored results of closed periods",
+    )
+    active_parser.add_argument(
+        "-u",
+        "--user",
+        dest="active_users",
+        action="append",
+        help="Report these users instead of the active ones (can be used "
+        "multiple times, not with --month)",
+    )
+    active_parser.add_argument(
+        "--user-list",
+        dest="active_user_list",
+        help="Comma separated list of users to report instead of the active ones",
+    )
+    active_parser.add_argument(
+        "--roster",
+        choices=ROSTER_SOURCES,
+        help="Where the active users come from: the --user list, the daily usage "
+        "already stored for the period or sreport (default: auto, the cheapest "
+        "available; sreport with --refresh)",
+    )
+    _add_cluster_argument(active_parser)
+    active_parser.add_argument(
+        "--shard",
+        type=_shard_spec,
+        help="Only collect the i-th of N slices of the active users (by hash of "
+        "the user ID); needs --db, combine shards with 'usage db merge'",
+    )
+    active_parser.add_argument(
+        "--db",
+        dest="db",
+        help="Usage database to read and store months in (default: output/usage.db)",
+    )
 
     list_parser = rep_sub.add_parser("list", help="List stored monthly usage data")
 
@@ -236,6 +535,8 @@ def _add_report_parser(sub: argparse._SubParsersAction) -> None:
         "--sortby",
         dest="sortby",
         default="gpu_hours",
+        choices=SORT_COLUMNS,
+        metavar="COLUMN",
         help="Column to sort by (default: gpu_hours)",
     )
     show_parser.add_argument(
@@ -243,6 +544,55 @@ def _add_report_parser(sub: argparse._SubParsersAction) -> None:
         action="store_true",
         help="Sort in descending order",
     )
+    show_parser.add_argument(
+        "--top",
+        type=_positive_int,
+        help="Only load and show the first N rows in sort order",
+    )
+    show_parser.add_argument(
+        "--where",
+        action="append",
+        type=_where_spec,
+        help="Only load and show matching rows: kennung, projekt or ai_c_group "
+        "with = or != and a glob pattern, or cpu_hours, gpu_hours or ram_gb_hours "
+        "compared to a number, e.g. 'projekt=pn12*' or 'gpu_hours>=100' "
+        "(can be used multiple times, all must match)",
+    )
+    show_parser.add_argument(
+        "-M",
+        "--cluster",
+        dest="clusters",
+        action="append",
+        help="Show the usage on this cluster of a month collected with --cluster "
+        "(accepts comma separated values)",
+    )
+
+    export_parser = rep_sub.add_parser(
+        "export", help="Export stored monthly usage to a columnar file"
+    )
+    export_parser.add_argument(
+        "--format",
+        dest="export_format",
+        choices=EXPORT_FORMATS,
+        default="parquet",
+        help="Output format (default: parquet, falls back to csv without pyarrow)",
+    )
+    export_parser.add_argument(
+        "--months",
+        help="Comma separated months YYYY-MM to export (default: all stored months)",
+    )
+    export_parser.add_argument(
+        "-p",
+        "--partition",
+        dest="partitions",
+        action="append",
+        help="Only export entries stored with this partition filter",
+    )
+    export_parser.add_argument(
+        "-o",
+        "--output",
+        help="Output file (default: output/usage.<format>)",
+    )
 
 
 def _add_active_parser(sub: argparse._SubParsersAction) -> None:
@@ -279,6 +629,82 @@ def _add_active_parser(sub: argparse._SubParsersAction) -> None:
         choices=["user", "groups", "all"],
         help="Aggregate cached months (optionally by group)",
     )
+    active_parser.add_argument(
+        "--refresh",
+        action="store_true",
+        help="Query sreport again instead of using stored results of closed periods",
+    )
+    _add_cluster_argument(active_parser)
+
+
+def _add_db_parser(sub: argparse._SubParsersAction) -> None:
+    db_parser = sub.add_parser("db", help="Maintain usage databases")
+    db_sub = db_parser.add_subparsers(dest="db_cmd", required=True)
+    merge_parser = db_sub.add_parser(
+        "merge", help="Merge usage databases, e.g. shards, into the main database"
+    )
+    merge_parser.add_argument("sources", nargs="+", help="Databases to merge")
+    merge_parser.add_argument(
+        "--db",
+        dest="db",
+        help="Database merged into (default: output/usage.db)",
+    )
+    merge_parser.add_argument(
+        "--on-conflict",
+        dest="on_conflict",
+        choices=["fail", "keep", "replace"],
+        default="fail",
+        help="Handling of entries differing between databases: abort without "
+        "changes, keep the existing entry or replace it (default: fail)",
+    )
+
+
+def _add_serve_parser(sub: argparse._SubParsersAction) -> None:
+    serve_parser = sub.add_parser(
+        "serve", help="Run a daemon answering report queries with warm caches"
+    )
+    serve_parser.add_argument(
+        "--socket",
+        dest="socket",
+        help="Unix socket path (default: $USAGE_SOCKET or output/usage.sock)",
+    )
+    serve_parser.add_argument(
+        "--netrc-file",
+        dest="netrc_file",
+        help="Custom path to .netrc file for authentication",
+    )
+
+
+def _add_schedule_parser(sub: argparse._SubParsersAction) -> None:
+    schedule_parser = sub.add_parser(
+        "schedule", help="Run collection jobs from a schedule file"
+    )
+    schedule_parser.add_argument(
+        "--file",
+        dest="schedule_file",
+        help="JSON schedule file describing the collection jobs",
+    )
+    schedule_parser.add_argument(
+        "--once",
+        action="store_true",
+        help="Run all due jobs once and exit (e.g. from a single cron line)",
+    )
+    schedule_parser.add_argument(
+        "--poll",
+        type=float,
+        default=60.0,
+        help="Seconds between checks for due jobs (default: 60)",
+    )
+    schedule_parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Show the recorded state of previous runs and exit",
+    )
+    schedule_parser.add_argument(
+        "--netrc-file",
+        dest="netrc_file",
+        help="Custom path to .netrc file for authentication",
+    )
 
 
 def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
@@ -287,13 +713,17 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
     while "--debug" in argv_list:
         argv_list.remove("--debug")
         debug = True
-    if argv_list and argv_list[0] == "report":
+    # skip global options like ``--format json`` before the subcommand
+    pos = 0
+    while pos < len(argv_list) and argv_list[pos].startswith("-"):
+        pos += 2 if argv_list[pos] == "--format" else 1
+    if argv_list[pos:pos + 1] == ["report"]:
         if (
-            len(argv_list) > 1
-            and not argv_list[1].startswith("-")
-            and argv_list[1] not in {"user", "active", "list", "show"}
+            len(argv_list) > pos + 1
+            and not argv_list[pos + 1].startswith("-")
+            and argv_list[pos + 1] not in {"user", "active", "list", "show", "export"}
         ):
-            argv_list.insert(1, "user")
+            argv_list.insert(pos + 1, "user")
 
     parser = argparse.ArgumentParser(description="Usage reporting utilities")
     parser.add_argument(
@@ -301,11 +731,22 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
         action="store_true",
         help="Enable debug logging",
     )
+    parser.add_argument(
+        "--format",
+        dest="output_format",
+        choices=OUTPUT_FORMATS,
+        default="table",
+        help="Output format; jsonl writes every row as soon as it is produced "
+        "(default: table)",
+    )
     sub = parser.add_subparsers(dest="command", required=True)
     _add_sim_parser(sub)
     _add_slurm_parser(sub)
     _add_report_parser(sub)
     _add_active_parser(sub)
+    _add_db_parser(sub)
+    _add_serve_parser(sub)
+    _add_schedule_parser(sub)
     args = parser.parse_args(argv_list)
     if getattr(args, "ignore_user", None):
         args.ignore_user = [
@@ -346,374 +787,840 @@ def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
                 seen.add(user)
                 deduped.append(user)
         args.active_users = deduped or None
+    if getattr(args, "clusters", None):
+        clusters = [
+            c.strip() for spec in args.clusters for c in spec.split(",") if c.strip()
+        ]
+        args.clusters = list(dict.fromkeys(clusters)) or None
     if debug:
         args.debug = True
     return args
 
 
-def main(argv: list[str] | None = None) -> int:
-    args = parse_args(argv)
-    if getattr(args, "debug", False):
-        logging.basicConfig(level=logging.DEBUG)
-    if args.command == "sim":
-        api = SimAPI(netrc_file=args.netrc_file)
-        try:
-            data = api.fetch_user(args.user_id)
-        except SimAPIError as exc:
-            print(f"Error: {exc}", file=sys.stderr)
+def _run_sim(args: argparse.Namespace) -> int:
+    """Handle ``usage sim``."""
+    SimAPI, SimAPIError = _need("SimAPI", "SimAPIError")
+    api = SimAPI(netrc_file=args.netrc_file)
+    try:
+        data = api.fetch_user(args.user_id)
+    except SimAPIError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    _emit(data, args)
+    return 0
+
+
+def _stored_range_usage(
+    users: list[str], start: str, end: str | None, partitions: list[str] | None
+) -> dict | None:
+    """Return usage of *users* from the daily buckets if the range is stored."""
+    if not end:
+        # open ranges include today, which is never completely stored
+        return None
+    (load_range_usage,) = _need("load_range_usage")
+    return load_range_usage(start, end, users=users, partitions=partitions)
+
+
+def _db_options(args: argparse.Namespace, name: str = "db_path") -> dict[str, object]:
+    """Return the *name* keyword for ``--db``, empty without it."""
+    db = getattr(args, "db", None)
+    return {name: Path(db)} if db else {}
+
+
+def _shard_options(args: argparse.Namespace) -> dict[str, object]:
+    shard = getattr(args, "shard", None)
+    return {"shard": shard} if shard else {}
+
+
+def _roster_options(args: argparse.Namespace) -> dict[str, object]:
+    """Return the ``roster`` keyword for ``--roster``, empty for ``auto``."""
+    roster = getattr(args, "roster", None)
+    if roster is None and getattr(args, "refresh", False):
+        roster = "sreport"
+    return {"roster": roster} if roster and roster != "auto" else {}
+
+
+def _cluster_options(args: argparse.Namespace) -> dict[str, object]:
+    """Return the ``clusters`` keyword for ``--cluster``, empty without it."""
+    clusters = getattr(args, "clusters", None)
+    return {"clusters": clusters} if clusters else {}
+
+
+def _run_slurm(args: argparse.Namespace) -> int:
+    """Handle ``usage slurm``."""
+    fetch_usage, expand_month = _need("fetch_usage", "expand_month")
+    start = args.start
+    end = args.end
+    if args.month:
+        if args.end:
+            print("--end cannot be used with --month", file=sys.stderr)
             return 1
-        pprint(data)
-    elif args.command == "slurm":
-        start = args.start
-        end = args.end
-        if args.month:
-            if args.end:
-                print("--end cannot be used with --month", file=sys.stderr)
-                return 1
-            start, end = expand_month(args.month)
-        users = getattr(args, "users", [])
-        if not users:
-            print("At least one user must be specified", file=sys.stderr)
+        start, end = expand_month(args.month)
+    users = getattr(args, "users", [])
+    if not users:
+        print("At least one user must be specified", file=sys.stderr)
+        return 1
+    options = _cluster_options(args)
+    # the daily buckets are not kept per cluster
+    stored = None if options else _stored_range_usage(users, start, end, args.partitions)
+    if len(users) == 1:
+        if stored is not None:
+            usage = stored[users[0]]
+        else:
+            usage = fetch_usage(
+                users[0], start, end, partitions=args.partitions, **options
+            )
+        _emit(usage, args, rows=[{"user": users[0], **usage}])
+    else:
+        # JSON Lines output writes every user as soon as it is known
+        stream = JsonLinesWriter() if _output_format(args) == "jsonl" else None
+        per_user: list[dict[str, object]] = []
+        totals = {"cpu_hours": 0.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
+        for user in users:
+            if stored is not None:
+                usage = stored[user]
+            else:
+                usage = fetch_usage(
+                    user, start, end, partitions=args.partitions, **options
+                )
+            per_user.append({"user": user, **usage})
+            if stream is not None:
+                stream(per_user[-1])
+            for key in totals:
+                totals[key] += float(usage.get(key, 0.0))
+        if stream is None:
+            _emit({"users": per_user, "group_usage": totals}, args)
+    return 0
+
+
+def _run_active(args: argparse.Namespace) -> int:
+    """Handle ``usage active``."""
+    fetch_active_usage, expand_month = _need("fetch_active_usage", "expand_month")
+    start = args.start
+    end = args.end
+    if args.month:
+        if args.end:
+            print("--end cannot be used with --month", file=sys.stderr)
             return 1
-        if len(users) == 1:
-            usage = fetch_usage(users[0], start, end, partitions=args.partitions)
-            pprint(usage)
+        start, end = expand_month(args.month)
+    if args.clusters:
+        (fetch_cluster_active_usage,) = _need("fetch_cluster_active_usage")
+        usage = fetch_cluster_active_usage(
+            start,
+            end,
+            args.clusters,
+            active_users=args.active_users,
+            partitions=args.partitions,
+        )
+    else:
+        usage = fetch_active_usage(start, end, active_users=args.active_users, partitions=args.partitions)
+    if args.active_users:
+        partitions = usage.get("partitions") if isinstance(usage, dict) else []
+        users_usage = []
+        for user in args.active_users:
+            value = 0.0
+            if isinstance(usage, dict):
+                try:
+                    value = float(usage.get(user, 0.0))
+                except (TypeError, ValueError):
+                    value = 0.0
+            users_usage.append({"user": user, "hours": value})
+        group_hours = sum(item["hours"] for item in users_usage)
+        result = {
+            "partitions": partitions,
+            "users": users_usage,
+            "group_hours": group_hours,
+        }
+        _emit(result, args, rows=users_usage)
+    else:
+        _emit(
+            usage,
+            args,
+            rows=[{"user": u, "hours": h} for u, h in usage.items() if u != "partitions"],
+        )
+    return 0
+
+
+def _run_report_user(args: argparse.Namespace) -> int:
+    """Handle ``usage report user``."""
+    (
+        SimAPIError,
+        create_report,
+        write_report_csv,
+        expand_month,
+    ) = _need(
+        "SimAPIError",
+        "create_report",
+        "write_report_csv",
+        "expand_month",
+    )
+    start = args.start
+    end = args.end
+    if args.month:
+        if args.end:
+            print("--end cannot be used with --month", file=sys.stderr)
+            return 1
+        start, end = expand_month(args.month)
+    options = _cluster_options(args)
+    stored = (
+        None if options else _stored_range_usage([args.user_id], start, end, args.partitions)
+    )
+    try:
+        report = create_report(
+            args.user_id,
+            start,
+            end,
+            partitions=args.partitions,
+            netrc_file=args.netrc_file,
+            usage=stored[args.user_id] if stored is not None else None,
+            **options,
+        )
+    except SimAPIError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    output_path = write_report_csv(
+        report,
+        "output",
+        f"{args.user_id}.csv",
+        start=start,
+        end=end,
+        partitions=args.partitions,
+    )
+
+    report_with_period = report.copy()
+    report_with_period["period_start"] = start
+    report_with_period["period_end"] = end
+
+    fmt = _output_format(args)
+    if fmt == "table":
+        print_report_table(report_with_period)
+        print(f"Report written to {output_path}")
+    else:
+        write_rows([report_with_period], fmt)
+        print(f"Report written to {output_path}", file=sys.stderr)
+    return 0
+
+
+_USER_COLUMNS = [
+    "first_name",
+    "last_name",
+    "email",
+    "kennung",
+    "projekt",
+    "ai_c_group",
+    "cpu_hours",
+    "gpu_hours",
+    "ram_gb_hours",
+    "timestamp",
+    "period_start",
+    "period_end",
+]
+
+_ACTIVE_COLUMNS = _USER_COLUMNS + ["partition"]
+
+_GROUP_COLUMNS = [
+    "ai_c_group",
+    "partition",
+    "cpu_hours",
+    "gpu_hours",
+    "ram_gb_hours",
+    "timestamp",
+    "period_start",
+    "period_end",
+]
+
+_CLUSTER_COLUMNS = [
+    "cluster",
+    "partition",
+    "cpu_hours",
+    "gpu_hours",
+    "ram_gb_hours",
+    "timestamp",
+    "period_start",
+    "period_end",
+]
+
+_TOTAL_COLUMNS = [
+    "month",
+    "partition",
+    "cpu_hours",
+    "gpu_hours",
+    "ram_gb_hours",
+    "timestamp",
+    "period_start",
+    "period_end",
+]
+
+
+def _split_months(value: str | None) -> list[str]:
+    """Return the months in a comma separated ``--month`` value."""
+    if not value:
+        return []
+    return [m.strip() for m in value.split(",") if m.strip()]
+
+
+def _sort_options(args: argparse.Namespace) -> dict[str, object]:
+    return {
+        "sort_key": args.sortby,
+        "reverse": (args.desc or args.sortby == "gpu_hours"),
+        "top": args.top,
+    }
+
+
+def _month_total(
+    rows: list[dict[str, object]],
+    args: argparse.Namespace,
+    month: str,
+    start: str,
+    end: str | None,
+) -> dict[str, object]:
+    """Return the ``--aggregate all`` summary row of *rows*."""
+    (sum_rows,) = _need("sum_rows")
+    total = sum_rows(rows, partitions=args.partitions, ignore_users=args.ignore_user)
+    total["month"] = month
+    total["period_start"] = start
+    total["period_end"] = end
+    return total
+
+
+def _partition_value(args: argparse.Namespace) -> str:
+    return ",".join(sorted(args.partitions or ["*"]))
+
+
+def _print_active_rows(
+    rows: list[dict[str, object]], args: argparse.Namespace, *, sort: bool = True
+) -> None:
+    part_val = _partition_value(args)
+    show_rows = (r | {"partition": part_val} for r in rows)
+    fmt = _output_format(args)
+    if sort:
+        write_rows(show_rows, fmt, columns=_ACTIVE_COLUMNS, **_sort_options(args))
+    else:
+        write_rows(show_rows, fmt, columns=_ACTIVE_COLUMNS)
+
+
+def _row_stream(args: argparse.Namespace) -> JsonLinesWriter | None:
+    """Return the writer streaming collected rows with ``--format jsonl``."""
+    if _output_format(args) != "jsonl" or args.aggregate or args.top:
+        return None
+    return JsonLinesWriter(_ACTIVE_COLUMNS, extra={"partition": _partition_value(args)})
+
+
+def _print_aggregated(
+    aggregated: list[dict[str, object]], args: argparse.Namespace
+) -> None:
+    """Print aggregated rows and create the requested plot."""
+    if args.aggregate == "all":
+        columns = _TOTAL_COLUMNS
+    elif args.aggregate == "groups":
+        columns = _GROUP_COLUMNS
+    elif args.aggregate == "clusters":
+        columns = _CLUSTER_COLUMNS
+    else:
+        columns = _ACTIVE_COLUMNS
+    write_rows(aggregated, _output_format(args), columns=columns, **_sort_options(args))
+    if args.aggregate == "all" or not args.plot:
+        return
+    kind, column = _parse_plot_spec(args.plot)
+    if kind == "donut":
+        (create_donut_plot,) = _need("create_donut_plot")
+        if aggregated:
+            start_p = min(r.get("period_start") or "" for r in aggregated)
+            end_p = max(r.get("period_end") or "" for r in aggregated)
         else:
-            per_user: list[dict[str, object]] = []
-            totals = {"cpu_hours": 0.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
-            for user in users:
-                usage = fetch_usage(user, start, end, partitions=args.partitions)
-                per_user.append({"user": user, **usage})
-                for key in totals:
-                    totals[key] += float(usage.get(key, 0.0))
-            result = {"users": per_user, "group_usage": totals}
-            pprint(result)
-    elif args.command == "active":
+            start_p = end_p = None
+        create_donut_plot(
+            aggregated,
+            column,
+            start=start_p or None,
+            end=end_p or None,
+            output=args.plot_output,
+            backend=None if args.plot_backend == "auto" else args.plot_backend,
+        )
+
+
+def _collect_missing_months(
+    missing: dict[str, tuple[str, str]],
+    args: argparse.Namespace,
+    on_row: JsonLinesWriter | None = None,
+) -> dict[str, list[dict[str, object]]]:
+    """Collect and store the months in *missing* and return their rows.
+
+    Several months are collected concurrently by ``args.workers`` threads.
+    Interrupted collections resume where they stopped.  *on_row* receives
+    every row as soon as it is collected.
+    """
+    stream = {"on_row": on_row} if on_row is not None else {}
+    if len(missing) > 1 and args.workers > 1:
+        (collect_active_months,) = _need("collect_active_months")
+        return collect_active_months(
+            missing,
+            partitions=args.partitions,
+            netrc_file=args.netrc_file,
+            workers=args.workers,
+            **_cluster_options(args),
+            **_shard_options(args),
+            **_roster_options(args),
+            **_db_options(args),
+            **stream,
+        )
+    create_active_reports, store_month, DEFAULT_DB_PATH = _need(
+        "create_active_reports", "store_month", "DEFAULT_DB_PATH"
+    )
+    collected: dict[str, list[dict[str, object]]] = {}
+    for mon, (m_start, m_end) in missing.items():
+        rows = create_active_reports(
+            m_start,
+            m_end,
+            partitions=args.partitions,
+            netrc_file=args.netrc_file,
+            checkpoint_db=Path(args.db) if args.db else DEFAULT_DB_PATH,
+            **_cluster_options(args),
+            **_shard_options(args),
+            **_roster_options(args),
+            **stream,
+        )
+        store_month(
+            mon,
+            m_start,
+            m_end or "",
+            rows,
+            partitions=args.partitions,
+            **_shard_options(args),
+            **_db_options(args),
+        )
+        collected[mon] = rows
+    return collected
+
+
+def _run_trend_plot(months: list[str], args: argparse.Namespace) -> int:
+    """Print group usage per month and plot it as a stacked area or line chart."""
+    load_group_trend, create_trend_plot, expand_month = _need(
+        "load_group_trend", "create_trend_plot", "expand_month"
+    )
+    kind, column = _parse_plot_spec(args.plot)
+    options = {
+        "partitions": args.partitions,
+        "ignore_users": args.ignore_user,
+        "netrc_file": args.netrc_file,
+        **_db_options(args),
+    }
+    matrix = load_group_trend(months, **options)
+    missing = {mon: expand_month(mon) for mon in months if mon not in matrix}
+    if missing:
+        _collect_missing_months(missing, args)
+        matrix.update(load_group_trend(list(missing), **options))
+    part_val = ",".join(sorted(args.partitions or ["*"]))
+    rows = [
+        {"month": mon, "ai_c_group": group, "partition": part_val, **usage}
+        for mon in months
+        for group, usage in sorted(matrix.get(mon, {}).items())
+    ]
+    write_rows(
+        rows,
+        _output_format(args),
+        columns=["month", "ai_c_group", "partition", "cpu_hours", "gpu_hours", "ram_gb_hours"],
+    )
+    create_trend_plot(
+        matrix,
+        column,
+        kind=kind,
+        output=args.plot_output,
+        backend=None if args.plot_backend == "auto" else args.plot_backend,
+    )
+    return 0
+
+
+def _run_report_active(args: argparse.Namespace) -> int:
+    """Handle ``usage report active``."""
+    (
+        load_month,
+        create_active_reports,
+        enrich_stored_month,
+        aggregate_rows,
+        expand_month,
+    ) = _need(
+        "load_month",
+        "create_active_reports",
+        "enrich_stored_month",
+        "aggregate_rows",
+        "expand_month",
+    )
+    months = _split_months(args.month)
+    if months and args.end:
+        print("--end cannot be used with --month", file=sys.stderr)
+        return 1
+    if months and args.active_users:
+        # a month collected for some users only must not be stored as complete
+        print("--user cannot be used with --month", file=sys.stderr)
+        return 1
+    if args.roster == "list" and not args.active_users:
+        print("--roster list needs --user or --user-list", file=sys.stderr)
+        return 1
+    if args.shard and not args.db:
+        print("--shard needs its own database (--db)", file=sys.stderr)
+        return 1
+    if args.plot and _parse_plot_spec(args.plot)[0] in TREND_KINDS:
+        if not months:
+            print("Trend plots need one or more months (--month)", file=sys.stderr)
+            return 1
+        return _run_trend_plot(months, args)
+    # the daemon looks users up with its own credentials only
+    if months and args.aggregate and not (args.db or args.netrc_file):
+        (query_daemon,) = _need("query_daemon")
+        response = query_daemon(
+            {
+                "command": "aggregate",
+                "months": months,
+                "partitions": args.partitions,
+                "aggregate": args.aggregate,
+                "ignore_users": args.ignore_user,
+                **_cluster_options(args),
+            }
+        )
+        if response is not None:
+            _print_aggregated(response["rows"], args)
+            return 0
+
+    agg_rows: list[dict[str, object]] = []
+    if months:
+        stored: dict[str, list[dict[str, object]]] = {}
+        missing: dict[str, tuple[str, str]] = {}
+        # other columns are only known after enrichment
+        sql_top = (
+            args.top
+            and not args.aggregate
+            and not args.clusters
+            and args.sortby in USAGE_COLUMNS
+        )
+        for mon in months:
+            if sql_top:
+                existing = load_month(
+                    mon,
+                    partitions=args.partitions,
+                    sort_key=args.sortby,
+                    reverse=(args.desc or args.sortby == "gpu_hours"),
+                    limit=args.top,
+                    **_db_options(args),
+                )
+            else:
+                existing = load_month(mon, partitions=args.partitions, **_db_options(args))
+            rows = list(existing) if existing is not None else []
+            sample = rows[0] if rows else {}
+            per_cluster = args.aggregate == "clusters" and not args.clusters
+            if existing is not None and rows and not per_cluster:
+                (select_clusters,) = _need("select_clusters")
+                # months not collected for the clusters (without --cluster the
+                # default cluster) are collected again, keeping the stored ones
+                selected = select_clusters(rows, args.clusters, partitions=args.partitions)
+                existing = rows = selected
+            if existing is not None and isinstance(sample, Mapping) and "kennung" in sample:
+                stored[mon] = enrich_stored_month(
+                    mon,
+                    rows,
+                    complete=not sql_top,
+                    netrc_file=args.netrc_file,
+                    **_db_options(args),
+                )
+            else:
+                # not stored yet or a legacy entry without user rows
+                missing[mon] = expand_month(mon)
+        try:
+            collected = _collect_missing_months(missing, args, _row_stream(args))
+        except ValueError as exc:  # the requested roster is not available
+            print(exc, file=sys.stderr)
+            return 1
+        for mon in months:
+            m_start, m_end = expand_month(mon)
+            if mon in stored:
+                rows = stored[mon]
+                if not args.aggregate:
+                    _print_active_rows(rows, args)
+                    continue
+            else:
+                rows = collected[mon]
+            if args.aggregate == "all":
+                agg_rows.append(_month_total(rows, args, mon, m_start, m_end))
+            elif args.aggregate:
+                agg_rows.extend(rows)
+    else:
         start = args.start
         end = args.end
-        if args.month:
-            if args.end:
-                print("--end cannot be used with --month", file=sys.stderr)
-                return 1
-            start, end = expand_month(args.month)
-        usage = fetch_active_usage(start, end, active_users=args.active_users, partitions=args.partitions)
-        if args.active_users:
-            partitions = usage.get("partitions") if isinstance(usage, dict) else []
-            users_usage = []
-            for user in args.active_users:
-                value = 0.0
-                if isinstance(usage, dict):
-                    try:
-                        value = float(usage.get(user, 0.0))
-                    except (TypeError, ValueError):
-                        value = 0.0
-                users_usage.append({"user": user, "hours": value})
-            group_hours = sum(item["hours"] for item in users_usage)
-            result = {
-                "partitions": partitions,
-                "users": users_usage,
-                "group_hours": group_hours,
-            }
-            pprint(result)
-        else:
-            pprint(usage)
-    elif args.command == "report":
-        if args.report_cmd == "user":
-            start = args.start
-            end = args.end
-            if args.month:
-                if args.end:
-                    print("--end cannot be used with --month", file=sys.stderr)
-                    return 1
-                start, end = expand_month(args.month)
+        rows = None
+        if end and not args.clusters:
+            (load_range_reports,) = _need("load_range_reports")
+            rows = load_range_reports(
+                start,
+                end,
+                partitions=args.partitions,
+                netrc_file=args.netrc_file,
+                **_db_options(args),
+            )
+        stream = None
+        if rows is None:
+            (DEFAULT_DB_PATH,) = _need("DEFAULT_DB_PATH")
+            stream = _row_stream(args)
+            users = {"users": args.active_users} if args.active_users else {}
             try:
-                report = create_report(
-                    args.user_id,
+                rows = create_active_reports(
                     start,
                     end,
                     partitions=args.partitions,
                     netrc_file=args.netrc_file,
+                    **_cluster_options(args),
+                    **_shard_options(args),
+                    **_roster_options(args),
+                    **users,
+                    roster_db=Path(args.db) if args.db else DEFAULT_DB_PATH,
+                    **({"on_row": stream} if stream is not None else {}),
                 )
-            except SimAPIError as exc:
-                print(f"Error: {exc}", file=sys.stderr)
+            except ValueError as exc:  # the requested roster is not available
+                print(exc, file=sys.stderr)
                 return 1
-            output_path = write_report_csv(
-                report,
-                "output",
-                f"{args.user_id}.csv",
-                start=start,
-                end=end,
+        if stream is None:
+            _print_active_rows(rows, args, sort=bool(args.top))
+        if args.aggregate == "all":
+            agg_rows.append(_month_total(rows, args, "", start, end))
+        elif args.aggregate:
+            agg_rows.extend(rows)
+
+    if args.aggregate and agg_rows:
+        if args.aggregate == "all":
+            aggregated = agg_rows
+        elif args.aggregate == "clusters":
+            (aggregate_clusters,) = _need("aggregate_clusters")
+            aggregated = aggregate_clusters(
+                agg_rows, partitions=args.partitions, ignore_users=args.ignore_user
+            )
+        else:
+            aggregated = aggregate_rows(
+                agg_rows,
+                by_group=(args.aggregate == "groups"),
                 partitions=args.partitions,
+                ignore_users=args.ignore_user,
             )
+        _print_aggregated(aggregated, args)
+    return 0
 
-            report_with_period = report.copy()
-            report_with_period["period_start"] = start
-            report_with_period["period_end"] = end
-
-            print_report_table(report_with_period)
-            print(f"Report written to {output_path}")
-        elif args.report_cmd == "active":
-            start = args.start
-            end = args.end
-            months = [args.month] if args.month and "," not in args.month else []
-            if args.month and "," in args.month:
-                months = [m.strip() for m in args.month.split(",") if m.strip()]
-            if months:
-                if args.end:
-                    print("--end cannot be used with --month", file=sys.stderr)
-                    return 1
-            agg_rows: list[dict[str, object]] = []
-            if months:
-                for mon in months:
-                    m_start, m_end = expand_month(mon)
-                    existing = load_month(mon, partitions=args.partitions)
-                    if existing is not None:
-                        rows = list(existing)
-                        sample = rows[0] if rows else {}
-                        if not isinstance(sample, dict) or "kennung" not in sample:
-                            rows = create_active_reports(
-                                m_start,
-                                m_end,
-                                partitions=args.partitions,
-                                netrc_file=args.netrc_file,
-                            )
-                            store_month(
-                                mon,
-                                m_start,
-                                m_end or "",
-                                rows,
-                                partitions=args.partitions,
-                            )
-                        else:
-                            rows = enrich_report_rows(rows, netrc_file=args.netrc_file)
-                            if args.aggregate:
-                                if args.aggregate == "all":
-                                    ag = sum_rows(
-                                        rows,
-                                        partitions=args.partitions,
-                                        ignore_users=args.ignore_user,
-                                    )
-                                    ag["month"] = mon
-                                    ag["period_start"] = m_start
-                                    ag["period_end"] = m_end
-                                    agg_rows.append(ag)
-                                else:
-                                    agg_rows.extend(rows)
-                            else:
-                                part_val = ",".join(sorted(args.partitions or ["*"]))
-                                show_rows = [r | {"partition": part_val} for r in rows]
-                                cols = [
-                                    "first_name",
-                                    "last_name",
-                                    "email",
-                                    "kennung",
-                                    "projekt",
-                                    "ai_c_group",
-                                    "cpu_hours",
-                                    "gpu_hours",
-                                    "ram_gb_hours",
-                                    "timestamp",
-                                    "period_start",
-                                    "period_end",
-                                    "partition",
-                                ]
-                                print_usage_table(
-                                    show_rows,
-                                    sort_key=args.sortby,
-                                    reverse=(args.desc or args.sortby == "gpu_hours"),
-                                    columns=cols,
-                                )
-                    else:
-                        rows = create_active_reports(
-                            m_start,
-                            m_end,
-                            partitions=args.partitions,
-                            netrc_file=args.netrc_file,
-                        )
-                        store_month(
-                            mon,
-                            m_start,
-                            m_end or "",
-                            rows,
-                            partitions=args.partitions,
-                        )
-                        if args.aggregate:
-                            if args.aggregate == "all":
-                                ag = sum_rows(
-                                    rows,
-                                    partitions=args.partitions,
-                                    ignore_users=args.ignore_user,
-                                )
-                                ag["month"] = mon
-                                ag["period_start"] = m_start
-                                ag["period_end"] = m_end
-                                agg_rows.append(ag)
-                            else:
-                                agg_rows.extend(rows)
-            else:
-                rows = create_active_reports(
-                    start,
-                    end,
+
+def _run_report_list(args: argparse.Namespace) -> int:
+    """Handle ``usage report list``."""
+    (list_months,) = _need("list_months")
+    entries = list_months()
+    _emit(entries, args, rows=entries)
+    return 0
+
+
+def _run_report_export(args: argparse.Namespace) -> int:
+    """Handle ``usage report export``."""
+    default_export_path, export_usage = _need("default_export_path", "export_usage")
+    months = None
+    if args.months:
+        months = [m.strip() for m in args.months.split(",") if m.strip()]
+    output = args.output or default_export_path(args.export_format)
+    path, count = export_usage(
+        output,
+        fmt=args.export_format,
+        months=months,
+        partitions=args.partitions,
+    )
+    print(f"Exported {count} rows to {path}")
+    return 0
+
+
+def _run_report_show(args: argparse.Namespace) -> int:
+    """Handle ``usage report show``."""
+    load_stored_tables, query_daemon = _need("load_stored_tables", "query_daemon")
+    options = _sort_options(args)
+    fmt = _output_format(args)
+    where = {"where": args.where} if args.where else {}
+    if fmt == "jsonl" and not args.top:
+        # stream rows as they are read and enriched, unsorted
+        (iter_stored_rows,) = _need("iter_stored_rows")
+        try:
+            write_rows(
+                iter_stored_rows(
+                    args.month,
                     partitions=args.partitions,
                     netrc_file=args.netrc_file,
-                )
-                part_val = ",".join(sorted(args.partitions or ["*"]))
-                show_rows = [r | {"partition": part_val} for r in rows]
-                cols = [
-                    "first_name",
-                    "last_name",
-                    "email",
-                    "kennung",
-                    "projekt",
-                    "ai_c_group",
-                    "cpu_hours",
-                    "gpu_hours",
-                    "ram_gb_hours",
-                    "timestamp",
-                    "period_start",
-                    "period_end",
-                    "partition",
-                ]
-                print_usage_table(show_rows, columns=cols)
-                if args.month:
-                    store_month(
-                        args.month,
-                        start,
-                        end or "",
-                        rows,
-                        partitions=args.partitions,
-                    )
-                if args.aggregate:
-                    if args.aggregate == "all":
-                        ag = sum_rows(
-                            rows,
-                            partitions=args.partitions,
-                            ignore_users=args.ignore_user,
-                        )
-                        ag["period_start"] = start
-                        ag["period_end"] = end
-                        ag["month"] = args.month or ""
-                        agg_rows.append(ag)
-                    else:
-                        agg_rows.extend(rows)
-
-            if args.aggregate and agg_rows:
-                if args.aggregate == "all":
-                    aggregated = agg_rows
-                    cols = [
-                        "month",
-                        "partition",
-                        "cpu_hours",
-                        "gpu_hours",
-                        "ram_gb_hours",
-                        "timestamp",
-                        "period_start",
-                        "period_end",
-                    ]
-                    print_usage_table(
-                        aggregated,
-                        sort_key=args.sortby,
-                        reverse=(args.desc or args.sortby == "gpu_hours"),
-                        columns=cols,
-                    )
-                else:
-                    aggregated = aggregate_rows(
-                        agg_rows,
-                        by_group=(args.aggregate == "groups"),
-                        partitions=args.partitions,
-                        ignore_users=args.ignore_user,
-                    )
-                    if args.aggregate == "groups":
-                        cols = [
-                            "ai_c_group",
-                            "partition",
-                            "cpu_hours",
-                            "gpu_hours",
-                            "ram_gb_hours",
-                            "timestamp",
-                            "period_start",
-                            "period_end",
-                        ]
-                    else:
-                        cols = [
-                            "first_name",
-                            "last_name",
-                            "email",
-                            "kennung",
-                            "projekt",
-                            "ai_c_group",
-                            "cpu_hours",
-                            "gpu_hours",
-                            "ram_gb_hours",
-                            "timestamp",
-                            "period_start",
-                            "period_end",
-                            "partition",
-                        ]
-                    print_usage_table(
-                        aggregated,
-                        sort_key=args.sortby,
-                        reverse=(args.desc or args.sortby == "gpu_hours"),
-                        columns=cols,
-                    )
-                    if args.plot:
-                        kind, column = _parse_plot_spec(args.plot)
-                        if kind == "donut":
-                            if aggregated:
-                                start_p = min(
-                                    r.get("period_start") or "" for r in aggregated
-                                )
-                                end_p = max(
-                                    r.get("period_end") or "" for r in aggregated
-                                )
-                            else:
-                                start_p = end_p = None
-                            create_donut_plot(
-                                aggregated,
-                                column,
-                                start=start_p or None,
-                                end=end_p or None,
-                            )
-        elif args.report_cmd == "list":
-            entries = list_months()
-            pprint(entries)
-        elif args.report_cmd == "show":
-            parts = args.partitions
-            entries = [e for e in list_months() if e["month"] == args.month]
-            if parts is None:
-                if len(entries) == 1:
-                    parts = entries[0]["partitions"].split(",") if entries[0]["partitions"] else []
-                elif len(entries) > 1:
-                    for ent in entries:
-                        data = load_month(
-                            args.month,
-                            partitions=ent["partitions"].split(",") if ent["partitions"] else [],
-                        ) or []
-                        print_usage_table(
-                            data,
-                            start=ent["start"],
-                            end=ent["end"],
-                        )
-                    if not entries:
-                        print_usage_table([])
-                    return 0
-            usage = load_month(args.month, partitions=parts) or []
-            usage = enrich_report_rows(usage, netrc_file=args.netrc_file)
-            match = next(
-                (e for e in entries if e["partitions"] == ",".join(sorted(parts or []))),
-                None,
+                    **where,
+                    **_cluster_options(args),
+                ),
+                fmt,
             )
-            start = match["start"] if match else None
-            end = match["end"] if match else None
-            print_usage_table(
-                usage,
-                start=start,
-                end=end,
+        except ValueError as exc:  # not collected for the requested clusters
+            print(exc, file=sys.stderr)
+            return 1
+        return 0
+    request = {
+        "command": "show",
+        "month": args.month,
+        "partitions": args.partitions,
+        "sort_key": options["sort_key"],
+        "reverse": options["reverse"],
+        "top": options["top"],
+    }
+    if args.where:
+        request["where"] = [list(f) for f in args.where]
+    request.update(_cluster_options(args))
+    # the daemon looks users up with its own credentials only
+    response = query_daemon(request) if not args.netrc_file else None
+    if response is not None:
+        tables = response["tables"]
+    else:
+        try:
+            tables = load_stored_tables(
+                args.month,
+                partitions=args.partitions,
                 sort_key=args.sortby,
-                reverse=(args.desc or args.sortby == "gpu_hours"),
+                reverse=bool(options["reverse"]),
+                top=args.top,
+                netrc_file=args.netrc_file,
+                **where,
+                **_cluster_options(args),
             )
+        except ValueError as exc:  # not collected for the requested clusters
+            print(exc, file=sys.stderr)
+            return 1
+    if fmt != "table":
+        write_rows([r for t in tables for r in t["rows"]], fmt, **options)
+        return 0
+    for table in tables:
+        if table["enriched"]:
+            print_usage_table(
+                table["rows"], start=table["start"], end=table["end"], **options
+            )
+        else:
+            print_usage_table(
+                table["rows"], start=table["start"], end=table["end"], top=args.top
+            )
+    return 0
+
+
+def _run_db_merge(args: argparse.Namespace) -> int:
+    """Handle ``usage db merge``."""
+    merge_databases, MergeConflictError = _need("merge_databases", "MergeConflictError")
+    try:
+        result = merge_databases(
+            [Path(p) for p in args.sources],
+            on_conflict=args.on_conflict,
+            **_db_options(args),
+        )
+    except MergeConflictError as exc:
+        for conflict in exc.conflicts:
+            print(f"Conflict: {conflict}", file=sys.stderr)
+        print(
+            "Nothing merged; use --on-conflict keep or replace to resolve",
+            file=sys.stderr,
+        )
+        return 1
+    except FileNotFoundError as exc:
+        print(f"Error: {exc}", file=sys.stderr)
+        return 1
+    for conflict in result["conflicts"]:
+        print(f"Conflict ({args.on_conflict}): {conflict}")
+    print(f"Merged months: {', '.join(result['months']) or '-'}")
+    if result["completed"]:
+        print(f"All shards merged for: {', '.join(result['completed'])}")
     return 0
 
 
+def _run_serve(args: argparse.Namespace) -> int:
+    """Handle ``usage serve``."""
+    (serve,) = _need("serve")
+    serve(args.socket, netrc_file=args.netrc_file)
+    return 0
+
+
+def _run_schedule(args: argparse.Namespace) -> int:
+    """Handle ``usage schedule``."""
+    load_schedule, run_pending, run_forever, list_schedule_runs = _need(
+        "load_schedule", "run_pending", "run_forever", "list_schedule_runs"
+    )
+    if args.status:
+        write_rows(
+            list_schedule_runs(),
+            _output_format(args),
+            columns=["job", "target", "status", "started", "finished", "duration", "error"],
+        )
+        return 0
+    if not args.schedule_file:
+        print("--file is required unless --status is given", file=sys.stderr)
+        return 1
+    try:
+        jobs = load_schedule(args.schedule_file)
+    except (OSError, ValueError, KeyError) as exc:
+        print(f"Invalid schedule file: {exc}", file=sys.stderr)
+        return 1
+    if args.once:
+        results = run_pending(jobs, netrc_file=args.netrc_file)
+        for name, status in results.items():
+            print(f"{name}: {status}")
+        return 1 if "error" in results.values() else 0
+    try:
+        run_forever(jobs, poll=args.poll, netrc_file=args.netrc_file)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+_HANDLERS = {
+    "sim": _run_sim,
+    "slurm": _run_slurm,
+    "active": _run_active,
+    "serve": _run_serve,
+    "schedule": _run_schedule,
+}
+
+_DB_HANDLERS = {
+    "merge": _run_db_merge,
+}
+
+_REPORT_HANDLERS = {
+    "user": _run_report_user,
+    "active": _run_report_active,
+    "list": _run_report_list,
+    "export": _run_report_export,
+    "show": _run_report_show,
+}
+
+
+# Handlers looking up users in SIM
+_MEMOIZED_HANDLERS = {
+    _run_active,
+    _run_report_user,
+    _run_report_active,
+    _run_report_show,
+}
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    if getattr(args, "debug", False):
+        import logging
+
+        logging.basicConfig(level=logging.DEBUG)
+    if args.command == "report":
+        handler = _REPORT_HANDLERS[args.report_cmd]
+    elif args.command == "db":
+        handler = _DB_HANDLERS[args.db_cmd]
+    else:
+        handler = _HANDLERS[args.command]
+    if handler not in _MEMOIZED_HANDLERS:
+        return handler(args)
+    from .api import record_cache
+    from .database import DEFAULT_DB_PATH
+    from .memo import run_memo
+    from .sreport import sreport_cache
+
+    # SIM and group lookups are shared by all steps of one run, SIM records
+    # are kept in the database for revalidation by later runs and sreport
+    # results of closed periods are reused
+    refresh = bool(getattr(args, "refresh", False))
+    db_path = _db_options(args).get("db_path", DEFAULT_DB_PATH)
+    with run_memo(), record_cache(db_path), sreport_cache(db_path, refresh=refresh):
+        return handler(args)
+
+
 if __name__ == "__main__":  # pragma: no cover - CLI execution
     raise SystemExit(main())
@@ -1,15 +1,107 @@
+import heapq
 import json
+import logging
 import sqlite3
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
 from pathlib import Path
-from typing import Iterable, Dict, Any, List
+from typing import Iterable, Iterator, Dict, Any, List
 
 
+logger = logging.getLogger(__name__)
+
 DEFAULT_DB_PATH = Path("output/usage.db")
 
+# Key of the default cluster's usage in ``cluster_usage`` when rows also hold
+# the usage of clusters queried with ``--cluster``
+DEFAULT_CLUSTER = ""
+
+# Idle connections by database path while pooling is enabled (daemon mode).
+# A connection is used by one thread at a time: it is taken from the pool for
+# a ``with connect()`` block and put back afterwards.
+_POOL: Dict[str, List[sqlite3.Connection]] | None = None
+_POOL_LOCK = threading.Lock()
+
+
+def enable_connection_pool() -> None:
+    """Keep connections to each database open for the lifetime of the process.
+
+    Used by long running processes such as ``usage serve``; short CLI runs
+    open and close a connection per call.  Threads using the database at the
+    same time get a connection each.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        if _POOL is None:
+            _POOL = {}
+
+
+def close_connection_pool() -> None:
+    """Close all pooled connections and disable pooling.
+
+    Connections in use are closed when their ``with connect()`` block ends.
+    """
+    global _POOL
+    with _POOL_LOCK:
+        pool, _POOL = _POOL, None
+    for conns in (pool or {}).values():
+        for conn in conns:
+            conn.close()
+
+
+def _take_pooled(key: str) -> sqlite3.Connection | None:
+    with _POOL_LOCK:
+        if _POOL is None:
+            return None
+        idle = _POOL.setdefault(key, [])
+        return idle.pop() if idle else None
+
+
+def _return_pooled(key: str, conn: sqlite3.Connection) -> None:
+    with _POOL_LOCK:
+        if _POOL is not None:
+            _POOL.setdefault(key, []).append(conn)
+            return
+    conn.close()
+
+
+@contextmanager
+def connect(db_path: Path = DEFAULT_DB_PATH) -> Iterator[sqlite3.Connection]:
+    """Yield a connection to *db_path*, committing on success."""
+    if _POOL is None:
+        conn = sqlite3.connect(db_path)
+        try:
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+        return
+    key = str(Path(db_path).resolve())
+    conn = _take_pooled(key)
+    if conn is None:
+        conn = sqlite3.connect(db_path, check_same_thread=False)
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        _return_pooled(key, conn)
+
 
 def init_db(db_path: Path = DEFAULT_DB_PATH) -> None:
     db_path.parent.mkdir(parents=True, exist_ok=True)
-    conn = sqlite3.connect(db_path)
+    with connect(db_path) as conn:
+        _create_tables(conn)
+
+
+def _create_tables(conn: sqlite3.Connection) -> None:
+    indexed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name='usage_rows'"
+    ).fetchone()
     conn.execute(
         """
         CREATE TABLE IF NOT EXISTS monthly_usage (
@@ -22,8 +114,237 @@ def init_db(db_path: Path = DEFAULT_DB_PATH) -> None:
         )
         """
     )
-    conn.commit()
-    conn.close()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schedule_runs (
+            job TEXT NOT NULL,
+            target TEXT NOT NULL,
+            started TEXT NOT NULL,
+            finished TEXT,
+            status TEXT NOT NULL,
+            duration REAL,
+            error TEXT,
+            PRIMARY KEY (job, target)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sim_records (
+            user TEXT PRIMARY KEY,
+            body TEXT NOT NULL,
+            etag TEXT,
+            last_modified TEXT,
+            fetched REAL NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sreport_results (
+            cluster TEXT NOT NULL,
+            start TEXT NOT NULL,
+            end TEXT NOT NULL,
+            report TEXT NOT NULL,
+            format TEXT NOT NULL,
+            data TEXT NOT NULL,
+            fetched TEXT NOT NULL,
+            PRIMARY KEY (cluster, start, end, report, format)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS staged_collections (
+            start TEXT NOT NULL,
+            end TEXT NOT NULL,
+            partitions TEXT NOT NULL,
+            users TEXT NOT NULL,
+            started TEXT NOT NULL,
+            PRIMARY KEY (start, end, partitions)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS staged_rows (
+            start TEXT NOT NULL,
+            end TEXT NOT NULL,
+            partitions TEXT NOT NULL,
+            user TEXT NOT NULL,
+            data TEXT NOT NULL,
+            PRIMARY KEY (start, end, partitions, user)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_usage (
+            user TEXT NOT NULL,
+            partition TEXT NOT NULL,
+            day TEXT NOT NULL,
+            cpu_hours REAL NOT NULL,
+            gpu_hours REAL NOT NULL,
+            ram_gb_hours REAL NOT NULL,
+            cum_cpu_hours REAL NOT NULL DEFAULT 0,
+            cum_gpu_hours REAL NOT NULL DEFAULT 0,
+            cum_ram_gb_hours REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (user, partition, day)
+        )
+        """
+    )
+    conn.execute("CREATE INDEX IF NOT EXISTS daily_usage_day ON daily_usage (day, user)")
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS group_rollups (
+            month TEXT NOT NULL,
+            partitions TEXT NOT NULL,
+            ignored TEXT NOT NULL,
+            grp TEXT NOT NULL,
+            cpu_hours REAL NOT NULL,
+            gpu_hours REAL NOT NULL,
+            ram_gb_hours REAL NOT NULL,
+            PRIMARY KEY (month, partitions, ignored, grp)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS frozen_months (
+            month TEXT PRIMARY KEY,
+            frozen TEXT NOT NULL
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS shard_months (
+            month TEXT NOT NULL,
+            partitions TEXT NOT NULL,
+            shard INTEGER NOT NULL,
+            shards INTEGER NOT NULL,
+            start TEXT NOT NULL,
+            end TEXT NOT NULL,
+            PRIMARY KEY (month, partitions, shard, shards)
+        )
+        """
+    )
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS daily_coverage (
+            start TEXT NOT NULL,
+            end TEXT NOT NULL,
+            PRIMARY KEY (start, end)
+        )
+        """
+    )
+    # one row per element of the monthly_usage arrays, see _index_rows
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS usage_rows (
+            month TEXT NOT NULL,
+            partitions TEXT NOT NULL,
+            pos INTEGER NOT NULL,
+            kennung TEXT,
+            projekt TEXT,
+            ai_c_group TEXT,
+            cpu_hours REAL NOT NULL,
+            gpu_hours REAL NOT NULL,
+            ram_gb_hours REAL NOT NULL,
+            PRIMARY KEY (month, partitions, pos)
+        )
+        """
+    )
+    for column in ("kennung", "projekt", "ai_c_group", "gpu_hours"):
+        conn.execute(
+            f"CREATE INDEX IF NOT EXISTS usage_rows_{column} "
+            f"ON usage_rows (month, partitions, {column})"
+        )
+    if indexed is None:
+        # index months stored before the table existed
+        for (month,) in conn.execute("SELECT DISTINCT month FROM monthly_usage").fetchall():
+            _index_rows(conn, month)
+
+
+# columns of stored rows filled in by enrichment, see store_enrichment
+_ENRICHED_COLUMNS = ("projekt", "ai_c_group")
+
+
+def _index_rows(conn: sqlite3.Connection, month: str) -> None:
+    """Rebuild the ``usage_rows`` of all stored entries of *month*.
+
+    The table holds the filterable columns of every stored row with its
+    position in the JSON array, so filters are answered from its indexes
+    without decoding the rows, see :func:`load_month`.
+    """
+    conn.execute("DELETE FROM usage_rows WHERE month=?", (month,))
+    conn.execute(
+        "INSERT INTO usage_rows (month, partitions, pos, kennung, projekt, "
+        "ai_c_group, cpu_hours, gpu_hours, ram_gb_hours) "
+        "SELECT m.month, m.partitions, j.key, "
+        "json_extract(j.value, '$.kennung'), json_extract(j.value, '$.projekt'), "
+        "json_extract(j.value, '$.ai_c_group'), "
+        "COALESCE(CAST(json_extract(j.value, '$.cpu_hours') AS REAL), 0), "
+        "COALESCE(CAST(json_extract(j.value, '$.gpu_hours') AS REAL), 0), "
+        "COALESCE(CAST(json_extract(j.value, '$.ram_gb_hours') AS REAL), 0) "
+        "FROM monthly_usage AS m, json_each(m.data) AS j "
+        "WHERE m.month=? AND json_type(m.data)='array' AND j.type='object'",
+        (month,),
+    )
+
+
+def _filter_sql(
+    filters: Iterable[Any],
+    entry: str,
+    entry_params: List[Any],
+    *,
+    usage: bool = True,
+) -> tuple[str, list[Any]]:
+    """Return a query of the positions of matching rows and its parameters.
+
+    *filters* are :class:`~usage_report.rows.RowFilter` objects, *entry* is
+    the condition selecting the stored entry in ``usage_rows``.  Rows stored
+    without a filtered ``projekt`` or ``ai_c_group`` are included as well,
+    since their value is only known after enrichment.  Without *usage*
+    filters on usage columns are left out.
+    """
+    from .rows import FILTER_COLUMNS, USAGE_COLUMNS
+
+    # conditions on columns that enrichment may fill in, and on all others
+    enriched: list[str] = []
+    enriched_params: list[Any] = []
+    known: list[str] = []
+    known_params: list[Any] = []
+    pending: list[str] = []
+    for f in filters:
+        if f.op not in ("=", "!=", "<", "<=", ">", ">="):
+            raise ValueError(f"unknown operator {f.op}")
+        if f.column in USAGE_COLUMNS:
+            if not usage:
+                continue
+            known.append(f"{f.column} {f.op} ?")
+            known_params.append(f.value)
+        elif f.column in FILTER_COLUMNS:
+            negate = "NOT " if f.op == "!=" else ""
+            clause = f"{negate}{f.column} GLOB ?"
+            if f.column in _ENRICHED_COLUMNS:
+                enriched.append(clause)
+                enriched_params.append(f.value)
+                pending.append(f"{f.column} IS NULL")
+            else:
+                known.append(clause)
+                known_params.append(f.value)
+        else:
+            raise ValueError(f"cannot filter on {f.column}")
+    # separate selects, so each can use an index
+    query = f"SELECT pos FROM usage_rows WHERE {entry}"
+    query += "".join(f" AND {c}" for c in enriched + known)
+    params = [*entry_params, *enriched_params, *known_params]
+    if pending:
+        query += f" UNION SELECT pos FROM usage_rows WHERE {entry} AND ({' OR '.join(pending)})"
+        query += "".join(f" AND {c}" for c in known)
+        params += [*entry_params, *known_params]
+    return query, params
 
 
 def store_month(
@@ -34,18 +355,432 @@ def store_month(
     *,
     partitions: Iterable[str] | None = None,
     db_path: Path = DEFAULT_DB_PATH,
+    shard: tuple[int, int] | None = None,
+) -> None:
+    """Store *usage* for *month* in the database.
+
+    Rows carrying a ``partition_usage`` breakdown answer every partition
+    filter, so they are stored once with their totals over all partitions
+    and replace entries stored for individual filters.  Other rows are
+    stored under the *partitions* filter used to collect them.  Rows of
+    other clusters stored for the same period are kept, see
+    :func:`_merge_cluster_rows`.
+
+    If the rows also carry ``daily_usage`` the per-day usage is moved into
+    the ``daily_usage`` table, see :func:`load_range_usage`, unless they
+    were collected from several clusters (``cluster_usage``).  A staged
+    collection of the period (see :func:`stage_report`) is published by
+    this call and removed, as are group rollups of the month (see
+    :func:`store_group_rollups`), and a frozen month is thawed (see
+    :func:`store_enrichment`).
+
+    A *shard* ``(i, n)`` marks the rows as the i-th of *n* slices of the
+    users.  Its daily usage does not cover the period until all slices are
+    combined with :func:`merge_databases`.
+    """
+    init_db(db_path)
+    rows = list(usage)
+    breakdown = _has_breakdown(rows)
+    daily = None
+    if breakdown:
+        parts = ""
+        if end and all("daily_usage" in r for r in rows):
+            daily = {str(r["kennung"]): r.pop("daily_usage") for r in rows}
+            if any("cluster_usage" in r for r in rows):
+                # buckets summed over clusters are not the default cluster's usage
+                daily = None
+    else:
+        parts = ",".join(sorted(partitions or []))
+    from .rows import to_dicts
+
+    key = (start, end, ",".join(sorted(partitions or [])))
+    with connect(db_path) as conn:
+        if breakdown:
+            stored = conn.execute(
+                "SELECT data FROM monthly_usage "
+                "WHERE month=? AND partitions='' AND start=? AND end=?",
+                (month, start, end),
+            ).fetchone()
+            if stored is not None:
+                rows = _merge_cluster_rows(json.loads(stored[0]), rows)
+            rows = _apply_partition_filter(rows, None)
+        data = json.dumps(to_dicts(rows))
+        conn.execute(
+            "DELETE FROM staged_rows WHERE start=? AND end=? AND partitions=?", key
+        )
+        conn.execute(
+            "DELETE FROM staged_collections WHERE start=? AND end=? AND partitions=?",
+            key,
+        )
+        conn.execute("DELETE FROM group_rollups WHERE month=?", (month,))
+        conn.execute("DELETE FROM shard_months WHERE month=?", (month,))
+        conn.execute("DELETE FROM frozen_months WHERE month=?", (month,))
+        if shard is not None:
+            conn.execute(
+                "INSERT INTO shard_months (month, partitions, shard, shards, start, end) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (month, parts, shard[0], shard[1], start, end),
+            )
+        if daily is not None:
+            _store_daily_usage(conn, start, end, daily, covered=shard is None)
+        if breakdown:
+            conn.execute(
+                "DELETE FROM monthly_usage WHERE month=? AND partitions != ''",
+                (month,),
+            )
+        conn.execute(
+            "REPLACE INTO monthly_usage (month, start, end, partitions, data) VALUES (?, ?, ?, ?, ?)",
+            (month, start, end, parts, data),
+        )
+        _index_rows(conn, month)
+
+
+def _merge_cluster_rows(stored: List[Any], rows: List[Any]) -> List[Any]:
+    """Return the collected *rows* combined with the *stored* rows of a month.
+
+    The usage of every cluster is kept under ``cluster_usage``, the default
+    cluster under :data:`DEFAULT_CLUSTER`.  The usage of the collected
+    clusters is replaced, that of the other stored clusters is kept, so
+    collections with and without ``--cluster`` do not overwrite each other.
+    ``partition_usage`` holds the default cluster's usage if it was
+    collected, otherwise the sum over the clusters.
+    """
+    from .rows import UsageRow
+    from .slurm import merge_partition_usage
+
+    def by_cluster(row: Mapping[str, Any]) -> Dict[str, Any]:
+        per_cluster = row.get("cluster_usage")
+        if isinstance(per_cluster, Mapping):
+            return dict(per_cluster)
+        return {DEFAULT_CLUSTER: row.get("partition_usage") or {}}
+
+    stored = [r for r in stored if isinstance(r, Mapping) and "kennung" in r]
+    if not stored or not _has_breakdown(stored):
+        return rows
+    old = {str(r["kennung"]): r for r in stored}
+    new = {str(r["kennung"]): r for r in rows}
+    collected = {c for r in rows for c in by_cluster(r)} or {DEFAULT_CLUSTER}
+    kept = {c for r in stored for c in by_cluster(r)} - collected
+    if not kept:
+        return rows
+    result = []
+    for user in list(new) + [u for u in old if u not in new]:
+        base = new.get(user, old.get(user))
+        # users missing from a collection had no usage on its clusters
+        usage: Dict[str, Any] = {c: {} for c in kept | collected}
+        if user in old:
+            usage.update((c, b) for c, b in by_cluster(old[user]).items() if c in kept)
+        if user in new:
+            usage.update(by_cluster(new[user]))
+        row = UsageRow.from_dict(base)
+        if DEFAULT_CLUSTER in usage:
+            row["partition_usage"] = usage[DEFAULT_CLUSTER]
+        else:
+            total: Dict[str, Dict[str, float]] = {}
+            for breakdown in usage.values():
+                merge_partition_usage(total, breakdown)
+            row["partition_usage"] = total
+        row["cluster_usage"] = usage
+        result.append(row)
+    return result
+
+
+def load_staged_collection(
+    start: str,
+    end: str | None,
+    *,
+    partitions: Iterable[str] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> tuple[List[str] | None, Dict[str, Dict[str, Any]]]:
+    """Return the users and completed rows of an unfinished collection.
+
+    The users are ``None`` if no collection of the period with the
+    *partitions* filter has been started.  Completed rows are keyed by user.
+    Collections of periods that were still open when they started are only
+    resumed on the same day, later their rows would be outdated.
+    """
+    init_db(db_path)
+    key = (start, end or "", ",".join(sorted(partitions or [])))
+    with connect(db_path) as conn:
+        run = conn.execute(
+            "SELECT users FROM staged_collections "
+            "WHERE start=? AND end=? AND partitions=? "
+            "AND ((end != '' AND end < substr(started, 1, 10)) "
+            "OR substr(started, 1, 10) = ?)",
+            key + (date.today().isoformat(),),
+        ).fetchone()
+        if run is None:
+            # nothing to resume, ignore rows of an outdated collection
+            return None, {}
+        staged = conn.execute(
+            "SELECT user, data FROM staged_rows WHERE start=? AND end=? AND partitions=?",
+            key,
+        ).fetchall()
+    users = json.loads(run[0]) if run else None
+    from .rows import UsageRow
+
+    return users, {user: UsageRow.from_dict(json.loads(data)) for user, data in staged}
+
+
+def begin_staged_collection(
+    start: str,
+    end: str | None,
+    users: Iterable[str],
+    *,
+    partitions: Iterable[str] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
 ) -> None:
-    """Store *usage* for *month* in the database."""
+    """Record that the collection of *users* for the period has started.
+
+    Rows staged by an earlier collection of the period are discarded.
+    """
     init_db(db_path)
-    conn = sqlite3.connect(db_path)
     parts = ",".join(sorted(partitions or []))
-    data = json.dumps(list(usage))
-    conn.execute(
-        "REPLACE INTO monthly_usage (month, start, end, partitions, data) VALUES (?, ?, ?, ?, ?)",
-        (month, start, end, parts, data),
+    with connect(db_path) as conn:
+        conn.execute(
+            "DELETE FROM staged_rows WHERE start=? AND end=? AND partitions=?",
+            (start, end or "", parts),
+        )
+        conn.execute(
+            "REPLACE INTO staged_collections (start, end, partitions, users, started) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                start,
+                end or "",
+                parts,
+                json.dumps(list(users)),
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+
+
+def stage_report(
+    start: str,
+    end: str | None,
+    user: str,
+    row: Dict[str, Any],
+    *,
+    partitions: Iterable[str] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> None:
+    """Store the completed report *row* of *user* in the staging table."""
+    with connect(db_path) as conn:
+        conn.execute(
+            "REPLACE INTO staged_rows (start, end, partitions, user, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (
+                start,
+                end or "",
+                ",".join(sorted(partitions or [])),
+                user,
+                json.dumps(dict(row)),
+            ),
+        )
+
+
+def _store_daily_usage(
+    conn: sqlite3.Connection,
+    start: str,
+    end: str,
+    daily: Dict[str, Dict[str, Dict[str, Dict[str, float]]]],
+    *,
+    covered: bool = True,
+) -> None:
+    """Replace the daily usage of all users between *start* and *end*.
+
+    *daily* maps users to days to partitions to usage.  With *covered* the
+    range is marked as covered up to the last complete day before now.
+    """
+    conn.execute("DELETE FROM daily_usage WHERE day BETWEEN ? AND ?", (start, end))
+    conn.executemany(
+        "INSERT INTO daily_usage "
+        "(user, partition, day, cpu_hours, gpu_hours, ram_gb_hours) "
+        "VALUES (?, ?, ?, ?, ?, ?)",
+        [
+            (
+                user,
+                part,
+                day,
+                float(usage.get("cpu_hours", 0.0)),
+                float(usage.get("gpu_hours", 0.0)),
+                float(usage.get("ram_gb_hours", 0.0)),
+            )
+            for user, days in daily.items()
+            for day, by_part in days.items()
+            if start <= day <= end
+            for part, usage in by_part.items()
+        ],
+    )
+    _update_prefix_sums(conn, start)
+    if covered:
+        _mark_covered(conn, start, end)
+
+
+def _mark_covered(conn: sqlite3.Connection, start: str, end: str) -> None:
+    complete = min(end, (date.today() - timedelta(days=1)).isoformat())
+    if complete >= start:
+        conn.execute(
+            "INSERT OR IGNORE INTO daily_coverage (start, end) VALUES (?, ?)",
+            (start, complete),
+        )
+
+
+def _update_prefix_sums(conn: sqlite3.Connection, since: str) -> None:
+    """Recompute the cumulative usage of all buckets from *since* onwards."""
+    pairs = conn.execute(
+        "SELECT DISTINCT user, partition FROM daily_usage WHERE day >= ?", (since,)
+    ).fetchall()
+    for user, part in pairs:
+        base = conn.execute(
+            "SELECT cum_cpu_hours, cum_gpu_hours, cum_ram_gb_hours FROM daily_usage "
+            "WHERE user=? AND partition=? AND day < ? ORDER BY day DESC LIMIT 1",
+            (user, part, since),
+        ).fetchone()
+        cpu, gpu, ram = base or (0.0, 0.0, 0.0)
+        updates = []
+        for day, d_cpu, d_gpu, d_ram in conn.execute(
+            "SELECT day, cpu_hours, gpu_hours, ram_gb_hours FROM daily_usage "
+            "WHERE user=? AND partition=? AND day >= ? ORDER BY day",
+            (user, part, since),
+        ).fetchall():
+            cpu, gpu, ram = cpu + d_cpu, gpu + d_gpu, ram + d_ram
+            updates.append((cpu, gpu, ram, user, part, day))
+        conn.executemany(
+            "UPDATE daily_usage SET cum_cpu_hours=?, cum_gpu_hours=?, cum_ram_gb_hours=? "
+            "WHERE user=? AND partition=? AND day=?",
+            updates,
+        )
+
+
+def _is_covered(conn: sqlite3.Connection, start: str, end: str) -> bool:
+    """Return whether the stored coverage intervals include ``[start, end]``."""
+    cursor = start
+    for c_start, c_end in conn.execute(
+        "SELECT start, end FROM daily_coverage WHERE end >= ? ORDER BY start",
+        (start,),
+    ):
+        if c_start > cursor:
+            break
+        if c_end >= cursor:
+            cursor = (date.fromisoformat(c_end) + timedelta(days=1)).isoformat()
+        if cursor > end:
+            return True
+    return False
+
+
+def load_range_usage(
+    start: str,
+    end: str,
+    *,
+    users: Iterable[str] | None = None,
+    partitions: Iterable[str] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> Dict[str, Dict[str, float]] | None:
+    """Return usage totals per user between the days *start* and *end*.
+
+    The totals are computed from the cumulative daily buckets as the
+    difference of the prefix sums at *end* and before *start*, i.e. with two
+    index lookups per user and partition.  ``None`` is returned if the range
+    has not been collected completely.  Requested *users* without buckets
+    had no usage and get zero totals.
+    """
+    try:
+        date.fromisoformat(start)
+        date.fromisoformat(end)
+    except (TypeError, ValueError):
+        return None
+    if not Path(db_path).exists():
+        return None
+    init_db(db_path)
+    user_list = list(users) if users is not None else None
+    query = (
+        "SELECT p.user, p.partition, "
+        "hi.cum_cpu_hours - COALESCE(lo.cum_cpu_hours, 0), "
+        "hi.cum_gpu_hours - COALESCE(lo.cum_gpu_hours, 0), "
+        "hi.cum_ram_gb_hours - COALESCE(lo.cum_ram_gb_hours, 0) "
+        "FROM (SELECT DISTINCT user, partition FROM daily_usage"
+    )
+    params: list[Any] = []
+    if user_list is not None:
+        query += f" WHERE user IN ({','.join('?' * len(user_list))})"
+        params.extend(user_list)
+    query += (
+        ") AS p "
+        "JOIN daily_usage AS hi ON hi.user=p.user AND hi.partition=p.partition "
+        "AND hi.day=(SELECT MAX(day) FROM daily_usage "
+        "WHERE user=p.user AND partition=p.partition AND day <= ?) "
+        "LEFT JOIN daily_usage AS lo ON lo.user=p.user AND lo.partition=p.partition "
+        "AND lo.day=(SELECT MAX(day) FROM daily_usage "
+        "WHERE user=p.user AND partition=p.partition AND day < ?)"
+    )
+    params.extend([end, start])
+    with connect(db_path) as conn:
+        if not _is_covered(conn, start, end):
+            return None
+        records = conn.execute(query, params).fetchall()
+    from .slurm import filter_partition_usage
+
+    by_user: Dict[str, Dict[str, Dict[str, float]]] = {
+        user: {} for user in user_list or []
+    }
+    for user, part, cpu, gpu, ram in records:
+        by_user.setdefault(user, {})[part] = {
+            "cpu_hours": cpu,
+            "gpu_hours": gpu,
+            "ram_gb_hours": ram,
+        }
+    return {
+        user: filter_partition_usage(breakdown, partitions)
+        for user, breakdown in by_user.items()
+    }
+
+
+def load_range_users(
+    start: str, end: str, *, db_path: Path = DEFAULT_DB_PATH
+) -> List[str] | None:
+    """Return the users with daily usage between the days *start* and *end*.
+
+    ``None`` is returned if the range has not been collected completely, see
+    :func:`load_range_usage`.
+    """
+    try:
+        date.fromisoformat(start)
+        date.fromisoformat(end)
+    except (TypeError, ValueError):
+        return None
+    if not Path(db_path).exists():
+        return None
+    init_db(db_path)
+    with connect(db_path) as conn:
+        if not _is_covered(conn, start, end):
+            return None
+        records = conn.execute(
+            "SELECT DISTINCT user FROM daily_usage WHERE day BETWEEN ? AND ? ORDER BY user",
+            (start, end),
+        ).fetchall()
+    return [user for (user,) in records]
+
+
+def _apply_partition_filter(
+    rows: List[Any], partitions: Iterable[str] | None
+) -> List[Any]:
+    """Return *rows* with usage totals recomputed from ``partition_usage``."""
+    from .rows import UsageRow
+    from .slurm import filter_partition_usage
+
+    result = []
+    for row in rows:
+        breakdown = row.get("partition_usage") if isinstance(row, Mapping) else None
+        if isinstance(breakdown, dict):
+            row = UsageRow.from_dict(row) | filter_partition_usage(breakdown, partitions)
+        result.append(row)
+    return result
+
+
+def _has_breakdown(rows: List[Any]) -> bool:
+    return bool(rows) and all(
+        isinstance(r, Mapping) and "partition_usage" in r for r in rows
     )
-    conn.commit()
-    conn.close()
 
 
 def load_month(
@@ -53,36 +788,801 @@ def load_month(
     *,
     partitions: Iterable[str] | None = None,
     db_path: Path = DEFAULT_DB_PATH,
+    sort_key: str | None = None,
+    reverse: bool = False,
+    limit: int | None = None,
+    where: Iterable[Any] | None = None,
 ) -> List[Dict[str, Any]] | None:
-    """Return stored usage for *month* or ``None`` if not found."""
+    """Return stored usage for *month* or ``None`` if not found.
+
+    Entries stored for exactly *partitions* are returned as stored.
+    Otherwise the usage is computed from a stored per-partition breakdown if
+    one exists.
+
+    If *limit* is given only the first *limit* rows ordered by *sort_key*
+    (descending if *reverse* is true) are returned.  For stored entries and
+    a usage column as *sort_key* the selection is done by SQLite so the
+    remaining rows are never decoded; other columns may only be known after
+    enrichment, so callers sort those with :func:`select_top` afterwards.
+    Rows are returned as :class:`~usage_report.rows.UsageRow` except for
+    legacy entries storing a single dictionary.
+
+    *where* holds :class:`~usage_report.rows.RowFilter` conditions.  They are
+    answered from the indexed ``usage_rows`` table so only the matching rows
+    are decoded.  Rows lacking a filtered text column are returned too; their
+    value is only known after enrichment.
+    """
+    from .rows import USAGE_COLUMNS
+
     init_db(db_path)
     parts = ",".join(sorted(partitions or []))
-    conn = sqlite3.connect(db_path)
-    cur = conn.execute(
-        "SELECT data FROM monthly_usage WHERE month=? AND partitions=?",
-        (month, parts),
-    )
-    row = cur.fetchone()
-    conn.close()
+    filters = list(where or [])
+    if filters:
+        rows = _load_month_where(month, parts, partitions, db_path, filters)
+        if rows is None or limit is None:
+            return rows
+        return select_top(rows, sort_key, reverse, limit)
+    if limit is not None and (sort_key is None or sort_key in USAGE_COLUMNS):
+        top = _load_month_top(month, parts, db_path, sort_key, reverse, limit)
+        if top is not None or not parts:
+            return top
+        data = load_month(month, partitions=partitions, db_path=db_path)
+        if data is None:
+            return None
+        return select_top(data, sort_key, reverse, limit)
+    if limit is not None:
+        data = load_month(month, partitions=partitions, db_path=db_path)
+        if data is None:
+            return None
+        return select_top(data, sort_key, reverse, limit)
+    with connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT data FROM monthly_usage WHERE month=? AND partitions=?",
+            (month, parts),
+        ).fetchone()
+        fallback = None
+        if row is None and parts:
+            fallback = conn.execute(
+                "SELECT data FROM monthly_usage WHERE month=? AND partitions=''",
+                (month,),
+            ).fetchone()
     if row:
         data = json.loads(row[0])
         if isinstance(data, dict):
             # Support legacy entries storing a single dictionary
-            data = [data]
-        return data
+            return [data]
+        from .rows import as_rows
+
+        return as_rows(data)
+    if fallback:
+        data = json.loads(fallback[0])
+        if isinstance(data, list) and _has_breakdown(data):
+            return _apply_partition_filter(data, partitions)
     return None
 
 
+def _load_month_where(
+    month: str,
+    parts: str,
+    partitions: Iterable[str] | None,
+    db_path: Path,
+    filters: List[Any],
+) -> List[Dict[str, Any]] | None:
+    from .rows import USAGE_COLUMNS, as_rows
+
+    with connect(db_path) as conn:
+        key = parts
+        entry = conn.execute(
+            "SELECT json_type(data) FROM monthly_usage WHERE month=? AND partitions=?",
+            (month, key),
+        ).fetchone()
+        if entry is None and parts:
+            key = ""
+            entry = conn.execute(
+                "SELECT json_type(data) FROM monthly_usage WHERE month=? AND partitions=''",
+                (month,),
+            ).fetchone()
+        if entry is None:
+            return None
+        if entry[0] != "array":
+            if key != parts:
+                return None
+            # Legacy entries store a single dictionary
+            data = conn.execute(
+                "SELECT data FROM monthly_usage WHERE month=? AND partitions=?",
+                (month, key),
+            ).fetchone()[0]
+            return [json.loads(data)]
+        # totals of the breakdown entry change with the partition filter
+        exact = key == parts
+        positions, params = _filter_sql(
+            filters, "month=? AND partitions=?", [month, key], usage=exact
+        )
+        values = conn.execute(
+            "SELECT j.value FROM monthly_usage AS m, json_each(m.data) AS j "
+            f"WHERE m.month=? AND m.partitions=? AND j.key IN ({positions}) "
+            "ORDER BY j.key",
+            [month, key, *params],
+        ).fetchall()
+    rows = [json.loads(v) for (v,) in values]
+    if exact:
+        return as_rows(rows)
+    if rows and not _has_breakdown(rows):
+        return None
+    usage = [f for f in filters if f.column in USAGE_COLUMNS]
+    return [
+        row
+        for row in _apply_partition_filter(rows, partitions)
+        if all(f.matches(row) for f in usage)
+    ]
+
+
+def select_top(
+    rows: Iterable[Dict[str, Any]],
+    sort_key: str | None,
+    reverse: bool = False,
+    limit: int | None = None,
+) -> List[Dict[str, Any]]:
+    """Return *rows* ordered by *sort_key*, only the first *limit* if given.
+
+    Values are compared as numbers or, if that fails, as text.  With a
+    *limit* the rows are picked with a heap instead of sorting all rows.
+    """
+    rows = list(rows)
+    if not sort_key:
+        return rows[:limit]
+    keys = [
+        lambda r: r.get(sort_key) or 0,
+        lambda r: str(r.get(sort_key, "")),
+    ]
+    for key in keys:
+        try:
+            if limit is None:
+                return sorted(rows, key=key, reverse=reverse)
+            select = heapq.nlargest if reverse else heapq.nsmallest
+            return select(limit, rows, key=key)
+        except TypeError:
+            continue
+    return rows
+
+
+def _load_month_top(
+    month: str,
+    parts: str,
+    db_path: Path,
+    sort_key: str | None,
+    reverse: bool,
+    limit: int,
+) -> List[Dict[str, Any]] | None:
+    from .rows import USAGE_COLUMNS
+
+    if sort_key is not None and sort_key not in USAGE_COLUMNS:
+        raise ValueError(f"Cannot select top rows by {sort_key!r} in SQL")
+    with connect(db_path) as conn:
+        cur = conn.execute(
+            "SELECT json_type(data) FROM monthly_usage WHERE month=? AND partitions=?",
+            (month, parts),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        if row[0] != "array":
+            # Legacy entries store a single dictionary
+            data = json.loads(
+                conn.execute(
+                    "SELECT data FROM monthly_usage WHERE month=? AND partitions=?",
+                    (month, parts),
+                ).fetchone()[0]
+            )
+            return [data][:limit]
+        query = (
+            "SELECT j.value FROM monthly_usage AS m, json_each(m.data) AS j "
+            "WHERE m.month=? AND m.partitions=?"
+        )
+        params: list[Any] = [month, parts]
+        if sort_key:
+            direction = "DESC" if reverse else "ASC"
+            query += f" ORDER BY COALESCE(json_extract(j.value, ?), 0) {direction}, j.key"
+            params.append(f'$."{sort_key}"')
+        else:
+            query += " ORDER BY j.key"
+        query += " LIMIT ?"
+        params.append(limit)
+        from .rows import as_rows
+
+        return as_rows(json.loads(v) for (v,) in conn.execute(query, params))
+
+
+def is_month_frozen(month: str, *, db_path: Path = DEFAULT_DB_PATH) -> bool:
+    """Return whether the rows of *month* are final, see :func:`store_enrichment`."""
+    init_db(db_path)
+    with connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT 1 FROM frozen_months WHERE month=?", (month,)
+        ).fetchone()
+    return row is not None
+
+
+def store_enrichment(
+    month: str,
+    fields: Dict[str, Dict[str, Any]],
+    *,
+    freeze: bool = False,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> bool:
+    """Add looked up user *fields* to the rows stored for *month*.
+
+    *fields* maps users to their fields; only fields missing from a stored
+    row (or ``null``) are filled.  All stored entries of the month are
+    updated in one transaction.  With *freeze* the caller asserts that all
+    rows of the month are enriched: a month whose single stored entry ended
+    before today is then frozen, and readers use its rows as stored.
+    Return whether the month is frozen.
+    """
+    init_db(db_path)
+    with connect(db_path) as conn:
+        entries = conn.execute(
+            "SELECT partitions, end, data FROM monthly_usage WHERE month=?", (month,)
+        ).fetchall()
+        updates = []
+        for parts, _, data in entries:
+            rows = json.loads(data)
+            if not isinstance(rows, list):
+                continue
+            changed = False
+            for row in rows:
+                new = fields.get(row.get("kennung")) if isinstance(row, dict) else None
+                for key, value in (new or {}).items():
+                    if value is not None and row.get(key) is None:
+                        row[key] = value
+                        changed = True
+            if changed:
+                updates.append((json.dumps(rows), month, parts))
+        conn.executemany(
+            "UPDATE monthly_usage SET data=? WHERE month=? AND partitions=?", updates
+        )
+        if updates:
+            _index_rows(conn, month)
+        closed = (
+            len(entries) == 1
+            and bool(entries[0][1])
+            and entries[0][1] < date.today().isoformat()
+        )
+        if freeze and closed:
+            conn.execute(
+                "REPLACE INTO frozen_months (month, frozen) VALUES (?, ?)",
+                (month, datetime.now().isoformat(timespec="seconds")),
+            )
+        frozen = conn.execute(
+            "SELECT 1 FROM frozen_months WHERE month=?", (month,)
+        ).fetchone()
+    return frozen is not None
+
+
 def list_months(db_path: Path = DEFAULT_DB_PATH) -> list[dict[str, Any]]:
     """Return a list of all stored months."""
     init_db(db_path)
-    conn = sqlite3.connect(db_path)
-    cur = conn.execute(
-        "SELECT month, start, end, partitions FROM monthly_usage ORDER BY month"
-    )
-    rows = [
-        {"month": r[0], "start": r[1], "end": r[2], "partitions": r[3]}
-        for r in cur.fetchall()
-    ]
-    conn.close()
+    with connect(db_path) as conn:
+        cur = conn.execute(
+            "SELECT month, start, end, partitions FROM monthly_usage ORDER BY month"
+        )
+        rows = [
+            {"month": r[0], "start": r[1], "end": r[2], "partitions": r[3]}
+            for r in cur.fetchall()
+        ]
     return rows
+
+
+def iter_usage_rows(
+    months: Iterable[str] | None = None,
+    *,
+    partitions: Iterable[str] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    chunk_size: int = 10000,
+    where: Iterable[Any] | None = None,
+) -> Iterator[List[Dict[str, Any]]]:
+    """Yield stored usage rows in chunks of at most *chunk_size* rows.
+
+    Rows are expanded from the stored JSON arrays by SQLite itself so only a
+    single chunk is held in memory at a time.  Every row receives ``month``
+    and ``partitions`` keys naming the partition filter of their totals.  If
+    *months* is ``None`` all stored months are returned.  *partitions*
+    restricts the output to the entry stored with exactly that filter or,
+    as in :func:`load_month`, computes the totals of months without one from
+    their per-partition breakdown.  *where* selects rows as in
+    :func:`load_month`.  Legacy entries holding a single dictionary are
+    skipped.
+    """
+    from .rows import USAGE_COLUMNS, matches_all
+    from .slurm import filter_partition_usage
+
+    init_db(db_path)
+    query = (
+        "SELECT m.month, m.partitions, j.value "
+        "FROM monthly_usage AS m, json_each(m.data) AS j "
+        "WHERE json_type(m.data) = 'array'"
+    )
+    params: list[Any] = []
+    if months is not None:
+        month_list = list(months)
+        if not month_list:
+            return
+        query += f" AND m.month IN ({','.join('?' * len(month_list))})"
+        params.extend(month_list)
+    parts = list(partitions) if partitions is not None else None
+    key = ",".join(sorted(parts)) if parts is not None else None
+    if parts is not None:
+        query += (
+            " AND (m.partitions = ? OR (m.partitions = '' AND NOT EXISTS ("
+            "SELECT 1 FROM monthly_usage AS e "
+            "WHERE e.month = m.month AND e.partitions = ?)))"
+        )
+        params.extend([key, key])
+    filters = list(where or [])
+    # totals of the breakdown change with the partition filter
+    pushed = [f for f in filters if not key or f.column not in USAGE_COLUMNS]
+    if pushed:
+        positions, filter_params = _filter_sql(
+            pushed, "month=m.month AND partitions=m.partitions", []
+        )
+        query += f" AND j.key IN ({positions})"
+        params.extend(filter_params)
+    query += " ORDER BY m.month, m.partitions, j.key"
+    with connect(db_path) as conn:
+        cur = conn.execute(query, params)
+        while True:
+            batch = cur.fetchmany(chunk_size)
+            if not batch:
+                break
+            chunk = []
+            for month, entry, value in batch:
+                row = json.loads(value)
+                if not isinstance(row, dict):
+                    continue
+                breakdown = row.get("partition_usage")
+                if key and entry != key and isinstance(breakdown, dict):
+                    row.update(filter_partition_usage(breakdown, parts))
+                    entry = key
+                if len(pushed) < len(filters) and not matches_all(row, filters):
+                    continue
+                row["month"] = month
+                row["partitions"] = entry
+                chunk.append(row)
+            if chunk:
+                yield chunk
+
+
+def _rollup_key(
+    partitions: Iterable[str] | None, ignore_users: Iterable[str] | None
+) -> tuple[str, str]:
+    return ",".join(sorted(partitions or [])), ",".join(sorted(ignore_users or []))
+
+
+def store_group_rollups(
+    month: str,
+    rollups: Dict[str, Dict[str, float]],
+    *,
+    partitions: Iterable[str] | None = None,
+    ignore_users: Iterable[str] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> None:
+    """Store the usage totals per ``ai_c_group`` of *month*.
+
+    *rollups* maps groups to their usage for the *partitions* filter without
+    the users in *ignore_users*.  The rollups are removed when the month is
+    stored again.
+    """
+    init_db(db_path)
+    parts, ignored = _rollup_key(partitions, ignore_users)
+    with connect(db_path) as conn:
+        conn.execute(
+            "DELETE FROM group_rollups WHERE month=? AND partitions=? AND ignored=?",
+            (month, parts, ignored),
+        )
+        conn.executemany(
+            "INSERT INTO group_rollups "
+            "(month, partitions, ignored, grp, cpu_hours, gpu_hours, ram_gb_hours) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    month,
+                    parts,
+                    ignored,
+                    group,
+                    float(usage.get("cpu_hours", 0.0)),
+                    float(usage.get("gpu_hours", 0.0)),
+                    float(usage.get("ram_gb_hours", 0.0)),
+                )
+                for group, usage in rollups.items()
+            ],
+        )
+
+
+def load_group_matrix(
+    months: Iterable[str],
+    *,
+    partitions: Iterable[str] | None = None,
+    ignore_users: Iterable[str] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> Dict[str, Dict[str, Dict[str, float]]]:
+    """Return the stored group rollups of *months* with a single query.
+
+    The result maps months to groups to usage totals.  Months without
+    rollups for the *partitions* and *ignore_users* filters are missing.
+    """
+    init_db(db_path)
+    month_list = list(months)
+    if not month_list:
+        return {}
+    parts, ignored = _rollup_key(partitions, ignore_users)
+    matrix: Dict[str, Dict[str, Dict[str, float]]] = {}
+    with connect(db_path) as conn:
+        cur = conn.execute(
+            "SELECT month, grp, cpu_hours, gpu_hours, ram_gb_hours FROM group_rollups "
+            f"WHERE partitions=? AND ignored=? AND month IN ({','.join('?' * len(month_list))}) "
+            "ORDER BY month, grp",
+            [parts, ignored, *month_list],
+        )
+        for month, group, cpu, gpu, ram in cur:
+            matrix.setdefault(month, {})[group] = {
+                "cpu_hours": cpu,
+                "gpu_hours": gpu,
+                "ram_gb_hours": ram,
+            }
+    return matrix
+
+
+def load_sim_record(
+    user: str, *, db_path: Path = DEFAULT_DB_PATH
+) -> Dict[str, Any] | None:
+    """Return the cached SIM response for *user* or ``None``.
+
+    The record holds the response ``body``, its ``etag`` and
+    ``last_modified`` validators and the time it was ``fetched`` or last
+    revalidated (seconds since the epoch).
+    """
+    init_db(db_path)
+    with connect(db_path) as conn:
+        cur = conn.execute(
+            "SELECT body, etag, last_modified, fetched FROM sim_records WHERE user=?",
+            (user,),
+        )
+        row = cur.fetchone()
+        if row is None:
+            return None
+        return dict(zip([d[0] for d in cur.description], row))
+
+
+def store_sim_record(
+    user: str,
+    body: str,
+    *,
+    etag: str | None,
+    last_modified: str | None,
+    fetched: float,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> None:
+    """Cache the SIM response *body* for *user* with its validators."""
+    init_db(db_path)
+    with connect(db_path) as conn:
+        conn.execute(
+            "REPLACE INTO sim_records (user, body, etag, last_modified, fetched) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (user, body, etag, last_modified, fetched),
+        )
+
+
+def renew_sim_record(
+    user: str, fetched: float, *, db_path: Path = DEFAULT_DB_PATH
+) -> None:
+    """Mark the cached SIM response for *user* as revalidated at *fetched*."""
+    with connect(db_path) as conn:
+        conn.execute("UPDATE sim_records SET fetched=? WHERE user=?", (fetched, user))
+
+
+def load_sreport_result(
+    cluster: str,
+    start: str,
+    end: str,
+    report: str,
+    fmt: str,
+    *,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> Dict[str, float] | None:
+    """Return the stored ``sreport`` result for the key or ``None``."""
+    init_db(db_path)
+    with connect(db_path) as conn:
+        row = conn.execute(
+            "SELECT data FROM sreport_results "
+            "WHERE cluster=? AND start=? AND end=? AND report=? AND format=?",
+            (cluster, start, end, report, fmt),
+        ).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def store_sreport_result(
+    cluster: str,
+    start: str,
+    end: str,
+    report: str,
+    fmt: str,
+    data: Dict[str, float],
+    *,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> None:
+    """Store the parsed ``sreport`` result *data* under the key."""
+    init_db(db_path)
+    with connect(db_path) as conn:
+        conn.execute(
+            "REPLACE INTO sreport_results "
+            "(cluster, start, end, report, format, data, fetched) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                cluster,
+                start,
+                end,
+                report,
+                fmt,
+                json.dumps(data),
+                datetime.now().isoformat(timespec="seconds"),
+            ),
+        )
+
+
+def record_schedule_run(
+    job: str,
+    target: str,
+    *,
+    started: str,
+    status: str,
+    finished: str | None = None,
+    duration: float | None = None,
+    error: str | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> None:
+    """Store the state of the scheduled *job* run for *target*."""
+    init_db(db_path)
+    with connect(db_path) as conn:
+        conn.execute(
+            "REPLACE INTO schedule_runs "
+            "(job, target, started, finished, status, duration, error) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job, target, started, finished, status, duration, error),
+        )
+
+
+def list_schedule_runs(
+    job: str | None = None, *, db_path: Path = DEFAULT_DB_PATH
+) -> list[dict[str, Any]]:
+    """Return recorded scheduler runs, most recent first."""
+    init_db(db_path)
+    query = (
+        "SELECT job, target, started, finished, status, duration, error "
+        "FROM schedule_runs"
+    )
+    params: list[Any] = []
+    if job is not None:
+        query += " WHERE job=?"
+        params.append(job)
+    query += " ORDER BY started DESC"
+    with connect(db_path) as conn:
+        cur = conn.execute(query, params)
+        keys = [d[0] for d in cur.description]
+        return [dict(zip(keys, r)) for r in cur.fetchall()]
+
+
+class MergeConflictError(Exception):
+    """Raised when databases to merge hold different data for the same key."""
+
+    def __init__(self, conflicts: List[str]) -> None:
+        super().__init__(f"{len(conflicts)} conflicting entries: {'; '.join(conflicts[:5])}")
+        self.conflicts = conflicts
+
+
+def _same_row(a: Any, b: Any) -> bool:
+    """Return whether two stored rows agree apart from their timestamp."""
+    if isinstance(a, dict) and isinstance(b, dict):
+        return {k: v for k, v in a.items() if k != "timestamp"} == {
+            k: v for k, v in b.items() if k != "timestamp"
+        }
+    return a == b
+
+
+def _merge_month_rows(
+    key: str, target: List[Any], source: List[Any], on_conflict: str, conflicts: List[str]
+) -> List[Any]:
+    """Return the rows of *target* and *source* combined by ``kennung``."""
+    if not all(isinstance(r, dict) and "kennung" in r for r in target + source):
+        if target != source:
+            conflicts.append(f"{key}: stored data differs")
+            if on_conflict == "replace":
+                return source
+        return target
+    merged = {r["kennung"]: r for r in target}
+    for row in source:
+        user = row["kennung"]
+        if user not in merged:
+            merged[user] = row
+        elif not _same_row(merged[user], row):
+            conflicts.append(f"{key}: user {user} differs")
+            if on_conflict == "replace":
+                merged[user] = row
+    return list(merged.values())
+
+
+def _source_rows(
+    src: sqlite3.Connection, table: str, columns: str
+) -> Iterable[tuple[Any, ...]]:
+    """Return *columns* of *table* in the merge source *src*.
+
+    Sources written by older versions may lack tables; those are empty.
+    """
+    exists = src.execute(
+        "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?", (table,)
+    ).fetchone()
+    if exists is None:
+        return []
+    return src.execute(f"SELECT {columns} FROM {table}")
+
+
+def _merge_source(
+    conn: sqlite3.Connection,
+    src: sqlite3.Connection,
+    on_conflict: str,
+    conflicts: List[str],
+) -> tuple[set[str], str | None]:
+    """Merge the database *src* into *conn* without committing.
+
+    Return the changed months and the first day of merged daily usage.
+    """
+    months: set[str] = set()
+    for month, start, end, parts, data in _source_rows(
+        src, "monthly_usage", "month, start, end, partitions, data"
+    ):
+        key = f"{month} [{parts or '*'}]"
+        source = json.loads(data)
+        row = conn.execute(
+            "SELECT start, end, data FROM monthly_usage WHERE month=? AND partitions=?",
+            (month, parts),
+        ).fetchone()
+        if row is None:
+            merged = source
+        elif (row[0], row[1]) != (start, end):
+            conflicts.append(f"{key}: period {row[0]} - {row[1]} differs")
+            if on_conflict != "replace":
+                continue
+            merged = source
+        else:
+            target = json.loads(row[2])
+            merged = _merge_month_rows(
+                key,
+                target if isinstance(target, list) else [target],
+                source if isinstance(source, list) else [source],
+                on_conflict,
+                conflicts,
+            )
+            if merged == target:
+                continue
+        conn.execute(
+            "REPLACE INTO monthly_usage (month, start, end, partitions, data) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (month, start, end, parts, json.dumps(merged)),
+        )
+        months.add(month)
+
+    first_day = None
+    for user, part, day, cpu, gpu, ram in _source_rows(
+        src, "daily_usage", "user, partition, day, cpu_hours, gpu_hours, ram_gb_hours"
+    ):
+        row = conn.execute(
+            "SELECT cpu_hours, gpu_hours, ram_gb_hours FROM daily_usage "
+            "WHERE user=? AND partition=? AND day=?",
+            (user, part, day),
+        ).fetchone()
+        if row is not None:
+            if row == (cpu, gpu, ram):
+                continue
+            conflicts.append(f"daily usage of {user} on {day} ({part}) differs")
+            if on_conflict != "replace":
+                continue
+        conn.execute(
+            "REPLACE INTO daily_usage "
+            "(user, partition, day, cpu_hours, gpu_hours, ram_gb_hours) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            (user, part, day, cpu, gpu, ram),
+        )
+        first_day = day if first_day is None else min(first_day, day)
+
+    conn.executemany(
+        "INSERT OR IGNORE INTO daily_coverage (start, end) VALUES (?, ?)",
+        _source_rows(src, "daily_coverage", "start, end"),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO shard_months "
+        "(month, partitions, shard, shards, start, end) VALUES (?, ?, ?, ?, ?, ?)",
+        _source_rows(src, "shard_months", "month, partitions, shard, shards, start, end"),
+    )
+    conn.executemany(
+        "INSERT OR IGNORE INTO sreport_results "
+        "(cluster, start, end, report, format, data, fetched) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        _source_rows(
+            src, "sreport_results", "cluster, start, end, report, format, data, fetched"
+        ),
+    )
+    # keep the most recently validated SIM response of every user
+    for record in _source_rows(
+        src, "sim_records", "user, body, etag, last_modified, fetched"
+    ):
+        row = conn.execute(
+            "SELECT fetched FROM sim_records WHERE user=?", (record[0],)
+        ).fetchone()
+        if row is None or record[4] > row[0]:
+            conn.execute(
+                "REPLACE INTO sim_records (user, body, etag, last_modified, fetched) "
+                "VALUES (?, ?, ?, ?, ?)",
+                record,
+            )
+    return months, first_day
+
+
+def merge_databases(
+    sources: Iterable[Path],
+    *,
+    db_path: Path = DEFAULT_DB_PATH,
+    on_conflict: str = "fail",
+) -> Dict[str, Any]:
+    """Merge the usage databases *sources*, e.g. shards, into *db_path*.
+
+    Stored months are combined user by user and daily usage bucket by
+    bucket; cached SIM records and ``sreport`` results are copied.  Entries
+    present in both databases with different data are conflicts: with
+    *on_conflict* ``"fail"`` nothing is merged and
+    :class:`MergeConflictError` is raised, ``"keep"`` keeps the entries of
+    *db_path* and ``"replace"`` takes those of the source.  Once all shards
+    of a month are merged its daily usage is marked as covered.
+
+    Return the merged ``months``, the ``completed`` sharded months and the
+    ``conflicts``.
+    """
+    if on_conflict not in ("fail", "keep", "replace"):
+        raise ValueError(f"Unsupported conflict handling: {on_conflict}")
+    init_db(db_path)
+    conflicts: List[str] = []
+    months: set[str] = set()
+    completed: List[str] = []
+    with connect(db_path) as conn:
+        first_day = None
+        for source in sources:
+            if not Path(source).is_file():
+                raise FileNotFoundError(f"No usage database at {source}")
+            # sources are only read, never migrated or locked for writing
+            src = sqlite3.connect(f"{Path(source).resolve().as_uri()}?mode=ro", uri=True)
+            try:
+                changed, day = _merge_source(conn, src, on_conflict, conflicts)
+            finally:
+                src.close()
+            logger.debug("Merged %d months from %s", len(changed), source)
+            months |= changed
+            if day is not None:
+                first_day = day if first_day is None else min(first_day, day)
+        if conflicts and on_conflict == "fail":
+            raise MergeConflictError(conflicts)
+        if first_day is not None:
+            _update_prefix_sums(conn, first_day)
+        for month, parts, shards, start, end in conn.execute(
+            "SELECT month, partitions, shards, min(start), max(end) FROM shard_months "
+            "GROUP BY month, partitions, shards HAVING count(DISTINCT shard) = shards"
+        ).fetchall():
+            _mark_covered(conn, start, end)
+            conn.execute(
+                "DELETE FROM shard_months WHERE month=? AND partitions=?", (month, parts)
+            )
+            completed.append(month)
+        for month in months:
+            _index_rows(conn, month)
+        placeholders = ",".join("?" * len(months))
+        for table in ("group_rollups", "frozen_months"):
+            conn.execute(
+                f"DELETE FROM {table} WHERE month IN ({placeholders})", sorted(months)
+            )
+    return {"months": sorted(months), "completed": sorted(completed), "conflicts": conflicts}
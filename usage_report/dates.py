@@ -0,0 +1,16 @@
+"""Date helpers shared by the command line, the scheduler and the daemon."""
+from __future__ import annotations
+
+from datetime import datetime, timedelta
+
+
+def expand_month(month: str) -> tuple[str, str]:
+    """Return start and end dates for ``month`` (``YYYY-MM``)."""
+    dt = datetime.strptime(month, "%Y-%m")
+    start = dt.replace(day=1)
+    if dt.month == 12:
+        next_month = dt.replace(year=dt.year + 1, month=1, day=1)
+    else:
+        next_month = dt.replace(month=dt.month + 1, day=1)
+    last_day = next_month - timedelta(days=1)
+    return start.strftime("%Y-%m-%d"), last_day.strftime("%Y-%m-%d")
@@ -0,0 +1,149 @@
+"""Export stored monthly usage to columnar files."""
+from __future__ import annotations
+
+import csv
+import logging
+import sys
+from pathlib import Path
+from typing import Any, Iterable
+
+from .database import DEFAULT_DB_PATH, iter_usage_rows
+
+logger = logging.getLogger(__name__)
+
+EXPORT_FORMATS = ("parquet", "arrow", "csv")
+
+EXPORT_COLUMNS = [
+    "month",
+    "partitions",
+    "first_name",
+    "last_name",
+    "email",
+    "kennung",
+    "projekt",
+    "ai_c_group",
+    "cpu_hours",
+    "gpu_hours",
+    "ram_gb_hours",
+    "timestamp",
+    "period_start",
+    "period_end",
+]
+
+NUMERIC_COLUMNS = {"cpu_hours", "gpu_hours", "ram_gb_hours"}
+
+_SUFFIXES = {"parquet": ".parquet", "arrow": ".arrow", "csv": ".csv"}
+
+
+def _import_pyarrow() -> Any:
+    """Return the ``pyarrow`` module or ``None`` if it is not installed."""
+    try:
+        import pyarrow
+    except ImportError:  # pragma: no cover - optional dependency
+        return None
+    return pyarrow
+
+
+def _column_value(row: dict[str, Any], column: str) -> Any:
+    value = row.get(column)
+    if column in NUMERIC_COLUMNS:
+        try:
+            return float(value) if value is not None and value != "" else None
+        except (TypeError, ValueError):
+            return None
+    if value is None:
+        return None
+    return str(value)
+
+
+def _to_columns(chunk: list[dict[str, Any]]) -> dict[str, list[Any]]:
+    return {c: [_column_value(row, c) for row in chunk] for c in EXPORT_COLUMNS}
+
+
+def _write_csv(path: Path, chunks: Iterable[list[dict[str, Any]]]) -> int:
+    count = 0
+    with path.open("w", newline="") as fh:
+        writer = csv.writer(fh)
+        writer.writerow(EXPORT_COLUMNS)
+        for chunk in chunks:
+            for row in chunk:
+                writer.writerow(
+                    [
+                        "" if (val := _column_value(row, c)) is None else val
+                        for c in EXPORT_COLUMNS
+                    ]
+                )
+            count += len(chunk)
+    return count
+
+
+def _write_arrow(
+    pa: Any, path: Path, fmt: str, chunks: Iterable[list[dict[str, Any]]]
+) -> int:
+    schema = pa.schema(
+        [
+            (c, pa.float64() if c in NUMERIC_COLUMNS else pa.string())
+            for c in EXPORT_COLUMNS
+        ]
+    )
+    if fmt == "parquet":
+        import pyarrow.parquet as pq
+
+        writer = pq.ParquetWriter(str(path), schema)
+    else:
+        writer = pa.ipc.new_file(str(path), schema)
+    count = 0
+    try:
+        for chunk in chunks:
+            writer.write_table(pa.Table.from_pydict(_to_columns(chunk), schema=schema))
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count
+
+
+def export_usage(
+    output: str | Path,
+    *,
+    fmt: str = "parquet",
+    months: Iterable[str] | None = None,
+    partitions: Iterable[str] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    chunk_size: int = 10000,
+) -> tuple[Path, int]:
+    """Export stored usage rows to *output* and return ``(path, row_count)``.
+
+    Rows are streamed from the database in chunks of *chunk_size* and written
+    as Parquet, Arrow IPC or CSV depending on *fmt*.  The columnar formats
+    require ``pyarrow``; if it is not installed a CSV file is written instead
+    and its suffix is changed accordingly.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    path = Path(output)
+    pa = _import_pyarrow() if fmt != "csv" else None
+    if fmt != "csv" and pa is None:
+        print(
+            f"Exporting {fmt} requires pyarrow, falling back to CSV",
+            file=sys.stderr,
+        )
+        fmt = "csv"
+        path = path.with_suffix(_SUFFIXES["csv"])
+    path.parent.mkdir(parents=True, exist_ok=True)
+    chunks = iter_usage_rows(
+        months, partitions=partitions, db_path=db_path, chunk_size=chunk_size
+    )
+    logger.debug("Exporting usage to %s as %s", path, fmt)
+    if fmt == "csv":
+        count = _write_csv(path, chunks)
+    else:
+        count = _write_arrow(pa, path, fmt, chunks)
+    return path, count
+
+
+def default_export_path(fmt: str) -> Path:
+    """Return the default output path for *fmt*."""
+    return Path("output") / f"usage{_SUFFIXES.get(fmt, '.' + fmt)}"
+
+
+__all__ = ["export_usage", "default_export_path", "EXPORT_FORMATS"]
@@ -0,0 +1,103 @@
+"""Adaptive concurrency limit for calls to rate limited services."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class AIMDLimiter:
+    """Concurrency limit using additive increase, multiplicative decrease.
+
+    Every successful call whose latency stays within *tolerance* times the
+    lowest recent latency raises the limit by ``1 / limit``, i.e. by one per
+    round of calls.  An overloaded call (rate limited, server error or
+    timeout) multiplies the limit by *backoff*, at most once per round: calls
+    that started before the last decrease do not decrease it again.  A
+    ``Retry-After`` delay pauses all new calls.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        *,
+        minimum: int = 1,
+        maximum: int = 16,
+        backoff: float = 0.5,
+        tolerance: float = 2.0,
+    ) -> None:
+        self.minimum = minimum
+        self.maximum = maximum
+        self.backoff = backoff
+        self.tolerance = tolerance
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._started = 0
+        self._decreased_at = 0
+        self._baseline: float | None = None
+        self._paused_until = 0.0
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> int:
+        """Wait for a free slot and return the sequence number of the call."""
+        with self._cond:
+            while True:
+                pause = self._paused_until - time.monotonic()
+                if pause > 0:
+                    self._cond.wait(pause)
+                elif self._in_flight >= int(self.limit):
+                    self._cond.wait()
+                else:
+                    break
+            self._in_flight += 1
+            self._started += 1
+            return self._started
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self) -> Iterator[int]:
+        """Hold a slot for the duration of the block."""
+        ticket = self.acquire()
+        try:
+            yield ticket
+        finally:
+            self.release()
+
+    def success(self, latency: float) -> None:
+        """Record a call that finished after *latency* seconds."""
+        with self._cond:
+            if self._baseline is None or latency < self._baseline:
+                self._baseline = latency
+            elif latency <= self.tolerance * self._baseline:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            else:
+                # let the baseline follow a lasting change of the latency
+                self._baseline *= 1.05
+            self._cond.notify_all()
+
+    def overload(self, ticket: int, retry_after: float | None = None) -> None:
+        """Record that the call *ticket* was rejected or timed out."""
+        with self._cond:
+            if ticket > self._decreased_at:
+                self.limit = max(self.minimum, self.limit * self.backoff)
+                self._decreased_at = self._started
+                logger.debug("Overloaded, concurrency limit lowered to %.1f", self.limit)
+            if retry_after:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+
+
+__all__ = ["AIMDLimiter"]
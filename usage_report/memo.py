@@ -0,0 +1,109 @@
+"""Memoization of expensive lookups for the duration of one command run."""
+from __future__ import annotations
+
+import logging
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Hashable, Iterator
+
+logger = logging.getLogger(__name__)
+
+
+class _Call:
+    """A computation in progress that other threads can wait for."""
+
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Exception | None = None
+
+
+class Memo:
+    """Thread safe memo computing every key at most once.
+
+    Concurrent requests for a key that is being computed wait for the first
+    request and share its result.  Exceptions are remembered like results,
+    so a failing lookup is not repeated either.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._results: Dict[Hashable, tuple[Any, Exception | None]] = {}
+        self._calls: Dict[Hashable, _Call] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """Return the result of *compute* for *key*, computing it only once."""
+        with self._lock:
+            result = self._results.get(key)
+            call = self._calls.get(key) if result is None else None
+            leader = result is None and call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.misses += 1
+            else:
+                self.hits += 1
+        if result is not None:
+            value, error = result
+        elif not leader:
+            assert call is not None
+            call.done.wait()
+            value, error = call.value, call.error
+        else:
+            assert call is not None
+            completed = False
+            try:
+                try:
+                    call.value = compute()
+                except Exception as exc:
+                    call.error = exc
+                completed = True
+            finally:
+                with self._lock:
+                    if completed:
+                        self._results[key] = (call.value, call.error)
+                    self._calls.pop(key, None)
+                if not completed:
+                    call.error = RuntimeError(f"lookup of {key!r} was interrupted")
+                call.done.set()
+            value, error = call.value, call.error
+        if error is not None:
+            raise error
+        return value
+
+
+_current: Memo | None = None
+
+
+@contextmanager
+def run_memo() -> Iterator[Memo]:
+    """Memoize lookups made through :func:`memoized` within the block.
+
+    All threads share the memo, so lookups started by worker threads of the
+    same command run are coalesced as well.
+    """
+    global _current
+    previous, _current = _current, Memo()
+    memo = _current
+    try:
+        yield memo
+    finally:
+        _current = previous
+        logger.debug("Memoized lookups: %d hits, %d misses", memo.hits, memo.misses)
+
+
+def memoized(key: Hashable, compute: Callable[[], Any]) -> Any:
+    """Return ``compute()`` memoized for the current run.
+
+    Outside of :func:`run_memo` the value is computed on every call.
+    """
+    memo = _current
+    if memo is None:
+        return compute()
+    return memo.get(key, compute)
+
+
+__all__ = ["Memo", "memoized", "run_memo"]
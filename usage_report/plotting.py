@@ -1,48 +1,128 @@
 """Plotting utilities for Usage Report."""
 from __future__ import annotations
 
+import hashlib
+import json
+import math
+import shutil
+from collections.abc import Mapping
+from html import escape
+from pathlib import Path
 from typing import Iterable
 import sys
 
+DEFAULT_PLOT_PATH = Path("usage_plot.png")
 
-def create_donut_plot(
-    rows: Iterable[dict[str, object]],
-    column: str,
-    *,
-    start: str | None = None,
-    end: str | None = None,
-    title: str | None = None,
-) -> None:
-    """Create a donut plot from *rows* using *column* values.
+# Rendered plots by hash of their input, see :func:`_cached_plot`
+DEFAULT_PLOT_CACHE = Path("output/plot-cache")
 
-    The plot is saved as ``usage_plot.png`` in the current directory.  If
-    matplotlib is not available, a message is printed and the function returns
-    without raising an exception.
-    """
-    try:
-        import matplotlib
-        matplotlib.use("Agg")  # always use a non-interactive backend
-        import matplotlib.pyplot as plt
-    except Exception as exc:  # pragma: no cover - optional dependency
-        print(f"Plotting requires matplotlib: {exc}", file=sys.stderr)
+# Renderings kept in the plot cache; the least recently used are removed
+PLOT_CACHE_ENTRIES = 64
+
+PLOT_FORMATS = ("png", "svg")
+
+PLOT_BACKENDS = ("matplotlib", "svg")
+
+TREND_KINDS = ("stacked", "line")
+
+# Trend charts show the largest groups and combine the rest into "Others"
+TREND_MAX_GROUPS = 10
+
+# matplotlib's tab20 colors for the built-in SVG renderer
+TAB20 = [
+    "#1f77b4", "#aec7e8", "#ff7f0e", "#ffbb78", "#2ca02c",
+    "#98df8a", "#d62728", "#ff9896", "#9467bd", "#c5b0d5",
+    "#8c564b", "#c49c94", "#e377c2", "#f7b6d2", "#7f7f7f",
+    "#c7c7c7", "#bcbd22", "#dbdb8d", "#17becf", "#9edae5",
+]
+
+
+def _plot_format(output: Path, fmt: str | None) -> str:
+    fmt = (fmt or output.suffix.lstrip(".") or "png").lower()
+    if fmt not in PLOT_FORMATS:
+        raise ValueError(f"Unsupported plot format: {fmt}")
+    return fmt
+
+
+def _plot_key(kind: str, data: object, column: str, title: str, fmt: str) -> str:
+    """Return the cache key of a plot rendered from the given input."""
+    payload = json.dumps([kind, data, column, title, fmt], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def _cached_plot(key: str, fmt: str, output: Path, cache_dir: Path | None) -> bool:
+    """Copy a cached rendering of *key* to *output* and return whether it existed."""
+    if cache_dir is None:
+        return False
+    cached = cache_dir / f"{key}.{fmt}"
+    if not cached.exists():
+        return False
+    # mark as recently used for :func:`_prune_plot_cache`
+    cached.touch()
+    if output.resolve() != cached.resolve():
+        output.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(cached, output)
+    print(f"Plot saved to {output} (unchanged)")
+    return True
+
+
+def _cache_plot(key: str, fmt: str, output: Path, cache_dir: Path | None) -> None:
+    if cache_dir is None or not output.exists():
         return
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(output, cache_dir / f"{key}.{fmt}")
+    _prune_plot_cache(cache_dir)
 
-    data: list[tuple[str, float]] = []
 
+def _prune_plot_cache(cache_dir: Path) -> None:
+    """Remove all but the :data:`PLOT_CACHE_ENTRIES` most recently used renderings."""
+    entries = sorted(
+        (p for p in cache_dir.iterdir() if p.suffix.lstrip(".") in PLOT_FORMATS),
+        key=lambda p: p.stat().st_mtime,
+        reverse=True,
+    )
+    for path in entries[PLOT_CACHE_ENTRIES:]:
+        path.unlink(missing_ok=True)
+
+
+def _plot_title(
+    column: str, start: str | None, end: str | None, title: str | None
+) -> str:
+    if title is not None:
+        return title
+    period = f"{start or '?'} - {end or '?'}" if start or end else None
+    title = f"{column.replace('_', ' ').title()} by Group"
+    if period:
+        title += f" ({period})"
+    return title
+
+
+def _plot_values(
+    rows: Iterable[dict[str, object]], column: str
+) -> list[tuple[str, float]]:
+    """Return ``(label, value)`` pairs of *column* labelled by group, user or cluster."""
+    data: list[tuple[str, float]] = []
     for row in rows:
-        if not isinstance(row, dict):
+        if not isinstance(row, Mapping):
             continue
         val = float(row.get(column, 0) or 0)
-        label = str(row.get("ai_c_group") or row.get("kennung") or "")
+        label = str(
+            row.get("ai_c_group") or row.get("kennung") or row.get("cluster") or ""
+        )
         if label:
             label = label.replace("-ai-c", "")
         data.append((label, val))
+    return data
 
-    if not data:
-        print("No data to plot", file=sys.stderr)
-        return
 
-    data.sort(key=lambda t: t[1])
+def _donut_segments(data: list[tuple[str, float]]) -> list[tuple[str, float]]:
+    """Return the donut segments for the ``(label, value)`` pairs in *data*.
+
+    The smallest values are combined into an "Others" segment as long as it
+    stays below 105% of the largest value.  Segments are ordered by size
+    (largest first) with "Others" last.
+    """
+    data = sorted(data, key=lambda t: t[1])
     max_val = data[-1][1]
     threshold = max_val * 1.05
     other_total = 0.0
@@ -63,19 +143,99 @@ def create_donut_plot(
     keep.sort(key=lambda t: t[1], reverse=True)
     if others_pair:
         keep.append(others_pair)
+    return keep
+
+
+def _segment_colors(labels: list[str], palette: list) -> list:
+    """Return palette colors for *labels* in order, gray for "Others"."""
+    return [
+        "gray" if label == "Others" else palette[idx % len(palette)]
+        for idx, label in enumerate(labels)
+    ]
+
+
+def _have_matplotlib() -> bool:
+    """Return whether matplotlib can be imported, without importing it."""
+    if "matplotlib" in sys.modules:
+        return sys.modules["matplotlib"] is not None
+    import importlib.util
+
+    return importlib.util.find_spec("matplotlib") is not None
+
+
+def _resolve_backend(
+    backend: str | None, output: Path, fmt: str | None
+) -> tuple[str, Path, str]:
+    """Return the backend, output path and format used to render a plot."""
+    if backend is None:
+        backend = "matplotlib" if _have_matplotlib() else "svg"
+    if backend not in PLOT_BACKENDS:
+        raise ValueError(f"Unsupported plot backend: {backend}")
+    if backend == "svg":
+        if _plot_format(output, fmt) != "svg":
+            output = output.with_suffix(".svg")
+        fmt = "svg"
+    return backend, output, _plot_format(output, fmt)
 
+
+def create_donut_plot(
+    rows: Iterable[dict[str, object]],
+    column: str,
+    *,
+    start: str | None = None,
+    end: str | None = None,
+    title: str | None = None,
+    output: str | Path = DEFAULT_PLOT_PATH,
+    fmt: str | None = None,
+    cache_dir: Path | None = DEFAULT_PLOT_CACHE,
+    backend: str | None = None,
+) -> None:
+    """Create a donut plot from *rows* using *column* values.
+
+    The plot is saved to *output* (``usage_plot.png`` in the current
+    directory by default) as PNG or SVG; *fmt* defaults to the suffix of
+    *output*.  Renderings are kept in *cache_dir* under a hash of the plotted
+    values, column, title, format and backend, so an unchanged plot is
+    copied from there without rendering it again.
+
+    *backend* is ``"matplotlib"`` or ``"svg"``, the built-in SVG renderer.
+    By default matplotlib is used if it is installed.  The SVG backend
+    always writes SVG and changes the suffix of *output* if necessary.  If
+    the matplotlib backend is requested but not available, a message is
+    printed and the function returns without raising an exception.
+    """
+    backend, output, fmt = _resolve_backend(backend, Path(output), fmt)
+    data = _plot_values(rows, column)
+    if not data:
+        print("No data to plot", file=sys.stderr)
+        return
+    title = _plot_title(column, start, end, title)
+    key = _plot_key(f"donut-{backend}", data, column, title, fmt)
+    if _cached_plot(key, fmt, output, cache_dir):
+        return
+
+    keep = _donut_segments(data)
     labels = [l for l, _ in keep]
     values = [v for _, v in keep]
 
-    palette = list(matplotlib.cm.tab20.colors)
-    color_map: dict[str, str] = {}
-    for idx, (label, _) in enumerate(keep):
-        if label == "Others":
-            color_map[label] = "gray"
-        else:
-            color_map[label] = palette[idx % len(palette)]
+    if backend == "svg":
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(
+            render_donut_svg(labels, values, _segment_colors(labels, TAB20), title)
+        )
+        _cache_plot(key, fmt, output, cache_dir)
+        print(f"Plot saved to {output}")
+        return
+
+    try:
+        import matplotlib
+        matplotlib.use("Agg")  # always use a non-interactive backend
+        import matplotlib.pyplot as plt
+    except Exception as exc:  # pragma: no cover - optional dependency
+        print(f"Plotting requires matplotlib: {exc}", file=sys.stderr)
+        return
 
-    colors = [color_map[l] for l in labels]
+    colors = _segment_colors(labels, list(matplotlib.cm.tab20.colors))
 
     plt.figure(figsize=(10, 10))
     wedges, texts, autotexts = plt.pie(
@@ -93,15 +253,303 @@ def create_donut_plot(
         text.set(size=14)
     for autotext in autotexts:
         autotext.set(size=11, weight="bold")
-    if title is None:
-        period = f"{start or '?'} - {end or '?'}" if start or end else None
-        title = f"{column.replace('_', ' ').title()} by Group"
-        if period:
-            title += f" ({period})"
     plt.title(title, fontsize=20, pad=40)
     plt.axis("equal")
-    plt.savefig("usage_plot.png")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    plt.savefig(str(output), format=fmt)
     plt.close()
-    print("Plot saved to usage_plot.png")
+    _cache_plot(key, fmt, output, cache_dir)
+    print(f"Plot saved to {output}")
+
+
+def _point(cx: float, cy: float, radius: float, angle: float) -> str:
+    """Return SVG coordinates at *angle* degrees (counter-clockwise from east)."""
+    rad = math.radians(angle)
+    return f"{cx + radius * math.cos(rad):.2f},{cy - radius * math.sin(rad):.2f}"
+
+
+def render_donut_svg(
+    labels: list[str],
+    values: list[float],
+    colors: list[str],
+    title: str,
+    *,
+    size: int = 1000,
+) -> str:
+    """Return an SVG document drawing a donut chart.
+
+    The layout follows the matplotlib rendering: segments start at 140
+    degrees and run counter-clockwise, the hole covers 70% of the radius,
+    percentages are placed at 85% and labels at 110% of the radius.
+    """
+    cx, cy = size / 2, size * 0.53
+    outer = size * 0.33
+    inner = outer * 0.7
+    total = sum(values) or 1.0
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{size}" height="{size}" '
+        f'viewBox="0 0 {size} {size}" font-family="DejaVu Sans, Arial, sans-serif">',
+        f'<rect width="{size}" height="{size}" fill="white"/>',
+        f'<text x="{cx}" y="{size * 0.08:.0f}" font-size="28" text-anchor="middle">'
+        f"{escape(title)}</text>",
+    ]
+    angle = 140.0
+    for label, value, color in zip(labels, values, colors):
+        sweep = 360.0 * value / total
+        end = angle + sweep
+        if sweep >= 359.99:
+            # a full ring cannot be drawn as a single arc
+            parts.append(
+                f'<circle cx="{cx}" cy="{cy}" r="{(outer + inner) / 2:.2f}" fill="none" '
+                f'stroke="{color}" stroke-width="{outer - inner:.2f}"/>'
+            )
+        elif sweep > 0:
+            large = 1 if sweep > 180 else 0
+            parts.append(
+                f'<path d="M {_point(cx, cy, outer, angle)} '
+                f"A {outer:.2f} {outer:.2f} 0 {large} 0 {_point(cx, cy, outer, end)} "
+                f"L {_point(cx, cy, inner, end)} "
+                f'A {inner:.2f} {inner:.2f} 0 {large} 1 {_point(cx, cy, inner, angle)} Z" '
+                f'fill="{color}" stroke="white" stroke-width="1"/>'
+            )
+        mid = math.radians(angle + sweep / 2)
+        anchor = "start" if math.cos(mid) >= 0 else "end"
+        lx = cx + outer * 1.1 * math.cos(mid)
+        ly = cy - outer * 1.1 * math.sin(mid)
+        px = cx + outer * 0.85 * math.cos(mid)
+        py = cy - outer * 0.85 * math.sin(mid)
+        parts.append(
+            f'<text x="{lx:.2f}" y="{ly:.2f}" font-size="19" text-anchor="{anchor}" '
+            f'dominant-baseline="middle">{escape(label)}</text>'
+        )
+        parts.append(
+            f'<text x="{px:.2f}" y="{py:.2f}" font-size="15" font-weight="bold" '
+            f'text-anchor="middle" dominant-baseline="middle">'
+            f"{100 * value / total:.1f}%</text>"
+        )
+        angle = end
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
+
+def _trend_series(
+    matrix: dict[str, dict[str, dict[str, float]]], column: str
+) -> tuple[list[str], list[tuple[str, list[float]]]]:
+    """Return the months and ``(label, values)`` series per group of *matrix*.
+
+    Groups are ordered by their total usage (largest first).  Groups beyond
+    the :data:`TREND_MAX_GROUPS` largest are combined into "Others".
+    """
+    months = sorted(matrix)
+    totals: dict[str, list[float]] = {}
+    for idx, month in enumerate(months):
+        for group, usage in matrix[month].items():
+            values = totals.setdefault(group, [0.0] * len(months))
+            values[idx] += float(usage.get(column, 0) or 0)
+    ranked = sorted(totals.items(), key=lambda t: (-sum(t[1]), t[0]))
+    series = [
+        ((group.replace("-ai-c", "") or "(none)"), values)
+        for group, values in ranked[:TREND_MAX_GROUPS]
+    ]
+    rest = ranked[TREND_MAX_GROUPS:]
+    if rest:
+        series.append(("Others", [sum(v) for v in zip(*(values for _, values in rest))]))
+    return months, series
+
+
+def create_trend_plot(
+    matrix: dict[str, dict[str, dict[str, float]]],
+    column: str,
+    *,
+    kind: str = "stacked",
+    title: str | None = None,
+    output: str | Path = DEFAULT_PLOT_PATH,
+    fmt: str | None = None,
+    cache_dir: Path | None = DEFAULT_PLOT_CACHE,
+    backend: str | None = None,
+) -> None:
+    """Create a stacked area or line chart of group usage over months.
+
+    *matrix* maps months to ``ai_c_group`` names to usage totals, as
+    returned by :func:`usage_report.report.load_group_trend`.  *kind* is
+    ``"stacked"`` or ``"line"``.  Output, caching and backends work as for
+    :func:`create_donut_plot`.
+    """
+    if kind not in TREND_KINDS:
+        raise ValueError(f"Unsupported trend plot: {kind}")
+    backend, output, fmt = _resolve_backend(backend, Path(output), fmt)
+    months, series = _trend_series(matrix, column)
+    if not series:
+        print("No data to plot", file=sys.stderr)
+        return
+    if title is None:
+        title = f"{column.replace('_', ' ').title()} by Group ({months[0]} - {months[-1]})"
+    key = _plot_key(f"{kind}-{backend}", [months, series], column, title, fmt)
+    if _cached_plot(key, fmt, output, cache_dir):
+        return
+
+    labels = [label for label, _ in series]
+    if backend == "svg":
+        output.parent.mkdir(parents=True, exist_ok=True)
+        output.write_text(
+            render_trend_svg(
+                months,
+                series,
+                _segment_colors(labels, TAB20),
+                title,
+                stacked=(kind == "stacked"),
+                ylabel=column.replace("_", " "),
+            )
+        )
+        _cache_plot(key, fmt, output, cache_dir)
+        print(f"Plot saved to {output}")
+        return
+
+    try:
+        import matplotlib
+        matplotlib.use("Agg")  # always use a non-interactive backend
+        import matplotlib.pyplot as plt
+    except Exception as exc:  # pragma: no cover - optional dependency
+        print(f"Plotting requires matplotlib: {exc}", file=sys.stderr)
+        return
+
+    colors = _segment_colors(labels, list(matplotlib.cm.tab20.colors))
+    x = list(range(len(months)))
+    plt.figure(figsize=(12, 7))
+    if kind == "stacked":
+        plt.stackplot(x, *(values for _, values in series), labels=labels, colors=colors)
+    else:
+        for (label, values), color in zip(series, colors):
+            plt.plot(x, values, label=label, color=color, marker="o")
+    plt.xticks(x, months, rotation=45)
+    plt.ylabel(column.replace("_", " "))
+    plt.title(title, fontsize=16)
+    plt.legend(loc="upper left", bbox_to_anchor=(1.0, 1.0))
+    plt.tight_layout()
+    output.parent.mkdir(parents=True, exist_ok=True)
+    plt.savefig(str(output), format=fmt)
+    plt.close()
+    _cache_plot(key, fmt, output, cache_dir)
+    print(f"Plot saved to {output}")
+
+
+def _nice_step(top: float, ticks: int = 5) -> float:
+    """Return a round axis step dividing ``[0, top]`` into about *ticks* parts."""
+    raw = top / ticks
+    magnitude = 10 ** math.floor(math.log10(raw))
+    for factor in (1, 2, 2.5, 5, 10):
+        if raw <= factor * magnitude:
+            return factor * magnitude
+    return 10 * magnitude  # pragma: no cover - unreachable
+
+
+def render_trend_svg(
+    months: list[str],
+    series: list[tuple[str, list[float]]],
+    colors: list[str],
+    title: str,
+    *,
+    stacked: bool = True,
+    ylabel: str = "",
+    width: int = 1200,
+    height: int = 700,
+) -> str:
+    """Return an SVG document drawing *series* over *months*.
+
+    With *stacked* the series are drawn as stacked areas, otherwise as lines
+    with a marker per month.  The legend lists the series in order.
+    """
+    left, right, top, bottom = 90.0, width - 250.0, 80.0, height - 90.0
+    if stacked:
+        peak = max(sum(values) for values in zip(*(v for _, v in series)))
+    else:
+        peak = max(max(values) for _, values in series)
+    step = _nice_step(peak) if peak > 0 else 1.0
+    y_max = step * math.ceil(peak / step) if peak > 0 else 1.0
+
+    def x_at(idx: int) -> float:
+        if len(months) == 1:
+            return (left + right) / 2
+        return left + (right - left) * idx / (len(months) - 1)
+
+    def y_at(value: float) -> float:
+        return bottom - (bottom - top) * value / y_max
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="DejaVu Sans, Arial, sans-serif">',
+        f'<rect width="{width}" height="{height}" fill="white"/>',
+        f'<text x="{(left + right) / 2:.0f}" y="40" font-size="24" text-anchor="middle">'
+        f"{escape(title)}</text>",
+    ]
+    tick = 0.0
+    while tick <= y_max + step / 2:
+        y = y_at(tick)
+        parts.append(
+            f'<line x1="{left}" y1="{y:.2f}" x2="{right}" y2="{y:.2f}" stroke="#dddddd"/>'
+        )
+        parts.append(
+            f'<text x="{left - 8}" y="{y:.2f}" font-size="13" text-anchor="end" '
+            f'dominant-baseline="middle">{tick:g}</text>'
+        )
+        tick += step
+    for idx, month in enumerate(months):
+        parts.append(
+            f'<text x="{x_at(idx):.2f}" y="{bottom + 22}" font-size="13" '
+            f'text-anchor="middle">{escape(month)}</text>'
+        )
+    if ylabel:
+        parts.append(
+            f'<text x="25" y="{(top + bottom) / 2:.0f}" font-size="15" text-anchor="middle" '
+            f'transform="rotate(-90 25 {(top + bottom) / 2:.0f})">{escape(ylabel)}</text>'
+        )
+
+    base = [0.0] * len(months)
+    for (label, values), color in zip(series, colors):
+        if stacked:
+            upper = [b + v for b, v in zip(base, values)]
+            points = [f"{x_at(i):.2f},{y_at(v):.2f}" for i, v in enumerate(upper)]
+            points += [
+                f"{x_at(i):.2f},{y_at(base[i]):.2f}" for i in reversed(range(len(months)))
+            ]
+            parts.append(
+                f'<polygon points="{" ".join(points)}" fill="{color}" '
+                f'stroke="white" stroke-width="0.5"/>'
+            )
+            base = upper
+        else:
+            points = [f"{x_at(i):.2f},{y_at(v):.2f}" for i, v in enumerate(values)]
+            parts.append(
+                f'<polyline points="{" ".join(points)}" fill="none" '
+                f'stroke="{color}" stroke-width="2"/>'
+            )
+            for point in points:
+                px, py = point.split(",")
+                parts.append(f'<circle cx="{px}" cy="{py}" r="4" fill="{color}"/>')
+    parts.append(
+        f'<line x1="{left}" y1="{bottom}" x2="{right}" y2="{bottom}" stroke="black"/>'
+    )
+    parts.append(f'<line x1="{left}" y1="{top}" x2="{left}" y2="{bottom}" stroke="black"/>')
+
+    for idx, ((label, _), color) in enumerate(zip(series, colors)):
+        y = top + 26 * idx
+        parts.append(
+            f'<rect x="{right + 30}" y="{y:.0f}" width="16" height="16" fill="{color}"/>'
+        )
+        parts.append(
+            f'<text x="{right + 54}" y="{y + 8:.0f}" font-size="14" '
+            f'dominant-baseline="middle">{escape(label)}</text>'
+        )
+    parts.append("</svg>")
+    return "\n".join(parts) + "\n"
+
 
-__all__ = ["create_donut_plot"]
+__all__ = [
+    "create_donut_plot",
+    "create_trend_plot",
+    "render_donut_svg",
+    "render_trend_svg",
+    "PLOT_BACKENDS",
+    "PLOT_FORMATS",
+    "TREND_KINDS",
+]
@@ -4,13 +4,42 @@ from __future__ import annotations
 from pathlib import Path
 import csv
 import logging
+import zlib
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Iterable
+from typing import Callable, Iterable, Iterator
 
-from .api import SimAPI, SimAPIError
-from .slurm import fetch_usage
+from .api import SIM_MAX_WORKERS, SimAPI, SimAPIError
+from .database import (
+    DEFAULT_CLUSTER,
+    DEFAULT_DB_PATH,
+    begin_staged_collection,
+    is_month_frozen,
+    iter_usage_rows,
+    list_months,
+    load_group_matrix,
+    load_month,
+    load_range_usage,
+    load_range_users,
+    load_staged_collection,
+    select_top,
+    stage_report,
+    store_enrichment,
+    store_group_rollups,
+    store_month,
+)
+from .slurm import (
+    fetch_cluster_usage,
+    fetch_daily_usage,
+    fetch_usage,
+    filter_partition_usage,
+    merge_partition_usage,
+)
 from .groups import list_user_groups
-from .sreport import fetch_active_usage
+from .memo import memoized
+from .rows import USAGE_COLUMNS, RowFilter, UsageRow, as_row, matches_all
+from .sreport import fetch_active_usage, fetch_cluster_active_usage
 
 logger = logging.getLogger(__name__)
 
@@ -72,23 +101,15 @@ def _pick_email(data: dict[str, object]) -> str:
     return ""
 
 
-def create_report(
-    user_id: str,
-    start: str,
-    end: str | None = None,
-    *,
-    partitions: Iterable[str] | None = None,
-    netrc_file: str | Path | None = None,
-) -> dict[str, object]:
-    """Return a combined report dictionary for *user_id*."""
-    api = SimAPI(netrc_file=netrc_file)
+def _user_fields(api: SimAPI, user_id: str) -> dict[str, object]:
+    """Return the report fields of *user_id* from SIM and its ai-c groups.
+
+    Raises :class:`SimAPIError` if SIM cannot be queried.
+    """
     user_data = _normalize_user_data(api.fetch_user(user_id))
-    usage = fetch_usage(user_id, start, end, partitions=partitions)
     groups = list_user_groups(user_id)
     ai_c_groups = [g for g in groups if g.endswith("ai-c")]
-    ai_c_group = "|".join(ai_c_groups) if ai_c_groups else ""
-
-    report = {
+    return {
         "first_name": user_data.get("first_name")
         or user_data.get("firstname")
         or user_data.get("vorname"),
@@ -98,30 +119,285 @@ def create_report(
         "email": _pick_email(user_data),
         "kennung": user_data.get("kennung"),
         "projekt": user_data.get("projekt"),
-        "ai_c_group": ai_c_group,
+        "ai_c_group": "|".join(ai_c_groups) if ai_c_groups else "",
     }
+
+
+def _lookup_user(api: SimAPI, user_id: str) -> dict[str, object]:
+    """Return :func:`_user_fields` memoized for the current command run."""
+    return memoized(
+        ("sim-user", str(getattr(api, "netrc_file", "")), user_id),
+        lambda: _user_fields(api, user_id),
+    )
+
+
+def _lookup_users(
+    api: SimAPI, user_ids: Iterable[str], *, log_errors: bool = False
+) -> dict[str, dict[str, object] | None]:
+    """Look up *user_ids* concurrently and return their fields by user.
+
+    The number of requests in flight is adapted to SIM by the limiter of
+    :class:`SimAPI`; the thread pool only bounds it.  Users that could not be
+    looked up map to ``None``.
+    """
+    users = list(dict.fromkeys(user_ids))
+
+    def lookup(user: str) -> dict[str, object] | None:
+        try:
+            return _lookup_user(api, user)
+        except SimAPIError as exc:
+            if log_errors:
+                logger.error("Skipping user %s due to error: %s", user, exc)
+            return None
+
+    if len(users) <= 1:
+        return {user: lookup(user) for user in users}
+    with ThreadPoolExecutor(max_workers=min(len(users), SIM_MAX_WORKERS)) as pool:
+        return dict(zip(users, pool.map(lookup, users)))
+
+
+def create_report(
+    user_id: str,
+    start: str,
+    end: str | None = None,
+    *,
+    partitions: Iterable[str] | None = None,
+    netrc_file: str | Path | None = None,
+    by_partition: bool = False,
+    usage: dict[str, float] | None = None,
+    cache: dict[str, dict[str, object]] | None = None,
+    clusters: Iterable[str] | None = None,
+) -> UsageRow:
+    """Return the combined report row of *user_id*.
+
+    With *by_partition* the usage of every partition is collected in one
+    ``sacct`` scan and stored under ``partition_usage``, the usage per day
+    under ``daily_usage``; the usage totals still only include *partitions*.
+    Precomputed *usage* totals are used instead of querying Slurm.  *cache*
+    maps user identifiers to looked up user fields as in
+    :func:`enrich_report_rows`.
+
+    *clusters* are queried concurrently and their usage is summed.  With
+    *by_partition* the usage of each cluster is also kept under
+    ``cluster_usage``, mapping clusters to their per-partition usage.
+    """
+    fields = cache.get(user_id) if cache is not None else None
+    if fields is None:
+        fields = _lookup_user(SimAPI(netrc_file=netrc_file), user_id)
+        if cache is not None:
+            cache[user_id] = fields
+    clusters = list(clusters) if clusters else None
+    breakdown = daily = per_cluster = None
+    if by_partition:
+        if clusters:
+            breakdown, daily, per_cluster = fetch_cluster_usage(
+                user_id, start, end, clusters
+            )
+        else:
+            breakdown, daily = fetch_daily_usage(user_id, start, end)
+        usage = filter_partition_usage(breakdown, partitions)
+    elif usage is None:
+        usage = fetch_usage(user_id, start, end, partitions=partitions, clusters=clusters)
+
+    report = UsageRow.from_dict(fields)
     report.update(usage)
+    if breakdown is not None:
+        report["partition_usage"] = breakdown
+        report["daily_usage"] = daily
+    if per_cluster is not None:
+        report["cluster_usage"] = per_cluster
     return report
 
 
+def _listed_roster(
+    start: str,
+    end: str | None,
+    *,
+    users: Iterable[str] | None,
+    clusters: list[str] | None,
+    db_path: Path | None,
+) -> list[str] | None:
+    return list(users) if users is not None else None
+
+
+def _stored_roster(
+    start: str,
+    end: str | None,
+    *,
+    users: Iterable[str] | None,
+    clusters: list[str] | None,
+    db_path: Path | None,
+) -> list[str] | None:
+    # daily usage is only stored for the default cluster
+    if clusters or db_path is None or not end:
+        return None
+    return load_range_users(start, end, db_path=db_path)
+
+
+def _sreport_roster(
+    start: str,
+    end: str | None,
+    *,
+    users: Iterable[str] | None,
+    clusters: list[str] | None,
+    db_path: Path | None,
+) -> list[str] | None:
+    # fetch_active_usage does not support partition filtering via sreport,
+    # so the partitions are only applied when creating individual reports
+    if clusters:
+        active = fetch_cluster_active_usage(start, end, clusters)
+    else:
+        active = fetch_active_usage(start, end)
+    return [u for u in active if u != "partitions"]
+
+
+# Roster providers, cheapest first.  Each returns ``None`` if it cannot
+# answer the period.
+ROSTER_PROVIDERS: dict[str, Callable[..., list[str] | None]] = {
+    "list": _listed_roster,
+    "stored": _stored_roster,
+    "sreport": _sreport_roster,
+}
+
+ROSTER_SOURCES = ("auto", *ROSTER_PROVIDERS)
+
+
+def active_roster(
+    start: str,
+    end: str | None,
+    *,
+    source: str = "auto",
+    users: Iterable[str] | None = None,
+    clusters: Iterable[str] | None = None,
+    db_path: Path | None = None,
+) -> list[str]:
+    """Return the users active between *start* and *end*.
+
+    The roster is provided by *source*, one of :data:`ROSTER_PROVIDERS`:
+    ``list`` returns the explicit *users*, ``stored`` the users of the daily
+    usage stored in *db_path* if it covers the period (not for *clusters*)
+    and ``sreport`` the active users reported by ``sreport``.  With
+    ``auto`` the cheapest provider able to answer is used, so periods
+    already collected need no ``sreport`` call.  :class:`ValueError` is
+    raised if the requested provider cannot answer.
+    """
+    clusters = list(clusters) if clusters else None
+    if source == "auto":
+        names = list(ROSTER_PROVIDERS)
+    elif source in ROSTER_PROVIDERS:
+        names = [source]
+    else:
+        raise ValueError(f"unknown roster source: {source}")
+    for name in names:
+        roster = ROSTER_PROVIDERS[name](
+            start, end, users=users, clusters=clusters, db_path=db_path
+        )
+        if roster is not None:
+            logger.debug(
+                "Roster of %s to %s from %s: %d users", start, end, name, len(roster)
+            )
+            return roster
+    raise ValueError(f"no {source} roster available for {start} to {end}")
+
+
+def in_shard(user: str, shard: tuple[int, int] | None) -> bool:
+    """Return whether *user* belongs to the *shard* ``(i, n)`` of all users.
+
+    Users are assigned by a stable hash of their identifier, so every
+    process computes the same partition.  Shards are numbered from 1.
+    """
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(user.encode()) % count == index - 1
+
+
+def has_clusters(row: Mapping[str, object], clusters: Iterable[str] | None) -> bool:
+    """Return whether *row* holds the usage of exactly *clusters*.
+
+    Rows collected without clusters match an empty selection only.
+    """
+    stored = row.get("cluster_usage")
+    if not clusters:
+        return stored is None
+    return isinstance(stored, Mapping) and set(stored) == set(clusters)
+
+
 def create_active_reports(
     start: str,
     end: str | None = None,
     *,
     partitions: Iterable[str] | None = None,
     netrc_file: str | Path | None = None,
-) -> list[dict[str, object]]:
+    users: Iterable[str] | None = None,
+    cache: dict[str, dict[str, object]] | None = None,
+    checkpoint_db: Path | None = None,
+    clusters: Iterable[str] | None = None,
+    shard: tuple[int, int] | None = None,
+    on_row: Callable[[UsageRow], None] | None = None,
+    roster: str = "auto",
+    roster_db: Path | None = None,
+) -> list[UsageRow]:
     """Return combined report rows for all active users.
 
     The list includes a ``timestamp`` as well as ``period_start`` and
-    ``period_end`` fields for each user.
+    ``period_end`` fields for each user.  Each row also carries the usage of
+    every partition in ``partition_usage`` so the stored month can answer any
+    partition filter later.  The users are determined by :func:`active_roster`
+    from *roster*, *users* and the daily usage stored in *roster_db* (default
+    *checkpoint_db*); *cache* and *clusters* are passed on to
+    :func:`create_report`, the active users are those of any of *clusters*.
+    With *shard* ``(i, n)`` only the i-th of *n* slices of the users is
+    collected, see :func:`in_shard`.  *on_row* is called with every row as
+    soon as it is complete, e.g. to stream it to the output.
+
+    With *checkpoint_db* every finished row is staged in that database.  An
+    interrupted collection of the same period and *partitions* resumes with
+    the users of the first run and only processes those not staged yet.
+    Storing the month with :func:`store_month` publishes the collection.
+    Staged rows of other clusters are collected again.
     """
-    # fetch_active_usage does not support partition filtering via sreport,
-    # so the partitions are only applied when creating individual reports
-    active = fetch_active_usage(start, end)
-    user_ids = [u for u in active if u != "partitions"]
-    rows: list[dict[str, object]] = []
+    clusters = list(clusters) if clusters else None
+    staged: dict[str, dict[str, object]] = {}
+    staged_users = None
+    if checkpoint_db is not None:
+        staged_users, staged = load_staged_collection(
+            start, end, partitions=partitions, db_path=checkpoint_db
+        )
+        staged = {u: r for u, r in staged.items() if has_clusters(r, clusters)}
+    if users is None and staged_users is not None:
+        user_ids = staged_users
+    else:
+        user_ids = active_roster(
+            start,
+            end,
+            source=roster,
+            users=users,
+            clusters=clusters,
+            db_path=roster_db or checkpoint_db,
+        )
+    if shard is not None:
+        user_ids = [u for u in user_ids if in_shard(u, shard)]
+    if checkpoint_db is not None:
+        if staged_users is None:
+            begin_staged_collection(
+                start, end, user_ids, partitions=partitions, db_path=checkpoint_db
+            )
+        elif staged:
+            logger.info(
+                "Resuming collection of %s to %s: %d of %d users done",
+                start,
+                end,
+                sum(1 for u in user_ids if u in staged),
+                len(user_ids),
+            )
+    rows: list[UsageRow] = []
     for user in user_ids:
+        if user in staged:
+            rows.append(staged[user])
+            if on_row is not None:
+                on_row(staged[user])
+            continue
         try:
             report = create_report(
                 user,
@@ -129,58 +405,471 @@ def create_active_reports(
                 end,
                 partitions=partitions,
                 netrc_file=netrc_file,
+                by_partition=True,
+                cache=cache,
+                clusters=clusters,
             )
         except SimAPIError as exc:
             logger.error("Skipping user %s due to error: %s", user, exc)
             continue
-        report["period_start"] = start
-        report["period_end"] = end
-        report["timestamp"] = datetime.now().isoformat(timespec="seconds")
+        report = as_row(report)
+        report.period_start = start
+        report.period_end = end
+        report.timestamp = datetime.now().isoformat(timespec="seconds")
+        if checkpoint_db is not None:
+            stage_report(
+                start, end, user, report, partitions=partitions, db_path=checkpoint_db
+            )
         rows.append(report)
+        if on_row is not None:
+            on_row(report)
     return rows
 
 
-def enrich_report_rows(
-    rows: Iterable[dict[str, object]], *, netrc_file: str | Path | None = None
-) -> list[dict[str, object]]:
-    """Return ``rows`` with missing user information filled via SIM API."""
+def collect_active_months(
+    periods: dict[str, tuple[str, str]],
+    *,
+    partitions: Iterable[str] | None = None,
+    netrc_file: str | Path | None = None,
+    workers: int = 4,
+    db_path: Path = DEFAULT_DB_PATH,
+    clusters: Iterable[str] | None = None,
+    shard: tuple[int, int] | None = None,
+    on_row: Callable[[UsageRow], None] | None = None,
+    users: Iterable[str] | None = None,
+    roster: str = "auto",
+) -> dict[str, list[dict[str, object]]]:
+    """Collect and store the active user reports of several months concurrently.
+
+    *periods* maps months to their start and end dates.  The active users of
+    all months are determined first and the SIM and group data of every
+    distinct user is looked up once.  Up to *workers* months are then
+    collected in parallel and each is stored in its own transaction as soon
+    as it is complete.  Collections are checkpointed in *db_path* as in
+    :func:`create_active_reports`, which also receives *clusters*, *shard*
+    and *on_row* (called from the worker threads).  The active users come
+    from :func:`active_roster` with *roster* and *users*.  The rows of every
+    month are returned.
 
+    The full roster of a month is staged before the lookups.  A month with
+    users whose lookup failed is not stored, so running the collection again
+    resumes it and retries only those users.
+    """
     api = SimAPI(netrc_file=netrc_file)
-    enriched: list[dict[str, object]] = []
+    parts = list(partitions) if partitions is not None else None
+    clusters = list(clusters) if clusters else None
+    listed = list(users) if users is not None else None
+
+    def month_roster(month: str) -> tuple[list[str], dict[str, dict[str, object]]]:
+        start, end = periods[month]
+        users, staged = load_staged_collection(
+            start, end, partitions=parts, db_path=db_path
+        )
+        staged = {u: r for u, r in staged.items() if has_clusters(r, clusters)}
+        if users is None:
+            users = active_roster(
+                start,
+                end,
+                source=roster,
+                users=listed,
+                clusters=clusters,
+                db_path=db_path,
+            )
+            users = [u for u in users if in_shard(u, shard)]
+            begin_staged_collection(start, end, users, partitions=parts, db_path=db_path)
+            return users, staged
+        return [u for u in users if in_shard(u, shard)], staged
+
+    def collect(month: str) -> list[dict[str, object]]:
+        start, end = periods[month]
+        users, staged = rosters[month]
+        rows = create_active_reports(
+            start,
+            end,
+            partitions=parts,
+            netrc_file=netrc_file,
+            users=[u for u in users if u in cache or u in staged],
+            cache=cache,
+            checkpoint_db=db_path,
+            clusters=clusters,
+            shard=shard,
+            on_row=on_row,
+        )
+        failed = [u for u in users if u not in cache and u not in staged]
+        if failed:
+            logger.error(
+                "Not storing %s: %d users could not be looked up, "
+                "run the collection again to retry them",
+                month,
+                len(failed),
+            )
+            return rows
+        store_month(
+            month, start, end or "", rows, partitions=parts, db_path=db_path, shard=shard
+        )
+        logger.debug("Stored %s with %d users", month, len(rows))
+        return rows
+
+    months = list(periods)
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(months)))) as pool:
+        rosters = dict(zip(months, pool.map(month_roster, months)))
+        # users staged by an interrupted run need no lookup
+        users = sorted(
+            {u for us, staged in rosters.values() for u in us if u not in staged}
+        )
+        logger.debug(
+            "Collecting %d months with %d distinct users", len(months), len(users)
+        )
+        cache = {
+            user: fields
+            for user, fields in _lookup_users(api, users, log_errors=True).items()
+            if fields is not None
+        }
+        return dict(zip(months, pool.map(collect, months)))
+
+
+def load_range_reports(
+    start: str,
+    end: str,
+    *,
+    partitions: Iterable[str] | None = None,
+    netrc_file: str | Path | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> list[UsageRow] | None:
+    """Return report rows of all users with usage between *start* and *end*.
+
+    The usage is read from the stored daily buckets and the user information
+    is filled in via :func:`enrich_report_rows`.  ``None`` is returned if the
+    range has not been collected completely.
+    """
+    usage = load_range_usage(start, end, partitions=partitions, db_path=db_path)
+    if usage is None:
+        return None
+    timestamp = datetime.now().isoformat(timespec="seconds")
+    rows = enrich_report_rows(
+        [
+            UsageRow(kennung=user, **totals)
+            for user, totals in sorted(usage.items())
+            if any(totals.values())
+        ],
+        netrc_file=netrc_file,
+    )
     for row in rows:
-        if not isinstance(row, dict):
-            enriched.append(row)
-            continue
-        if all(row.get(key) for key in ("first_name", "last_name", "email", "projekt")):
-            enriched.append(row)
-            continue
-        user_id = row.get("kennung")
-        if not user_id:
-            enriched.append(row)
+        row.period_start = start
+        row.period_end = end
+        row.timestamp = timestamp
+    return rows
+
+
+def _needs_lookup(row: object) -> bool:
+    return (
+        isinstance(row, UsageRow)
+        and bool(row.kennung)
+        and not (row.first_name and row.last_name and row.email and row.projekt)
+    )
+
+
+def enrich_stored_month(
+    month: str,
+    rows: Iterable[dict[str, object]],
+    *,
+    complete: bool = True,
+    netrc_file: str | Path | None = None,
+    cache: dict[str, dict[str, object]] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> list[UsageRow]:
+    """Return the stored *rows* of *month* enriched like :func:`enrich_report_rows`.
+
+    Looked up fields are written back to the stored month in one update so
+    later reads need no lookups.  If *complete*, i.e. *rows* are all rows of
+    the month, and every user could be looked up, a closed month is frozen
+    (see :func:`~usage_report.database.store_enrichment`): the rows of a
+    frozen month are returned as stored without any SIM or ``id`` calls.
+    """
+    rows = [as_row(row) for row in rows]
+    if is_month_frozen(month, db_path=db_path):
+        return rows
+    enriched = enrich_report_rows(rows, netrc_file=netrc_file, cache=cache)
+    fields: dict[str, dict[str, object]] = {}
+    failed = _looked_up_fields(rows, enriched, fields)
+    _store_enrichment(month, fields, complete and not failed, db_path)
+    return enriched
+
+
+def _looked_up_fields(
+    rows: list[UsageRow],
+    enriched: list[UsageRow],
+    fields: dict[str, dict[str, object]],
+) -> bool:
+    """Add the fields filled by enrichment to *fields* by user.
+
+    Return whether a lookup failed.
+    """
+    failed = False
+    for old, new in zip(rows, enriched):
+        if not _needs_lookup(old):
             continue
-        try:
-            data = _normalize_user_data(api.fetch_user(str(user_id)))
-        except SimAPIError:
-            enriched.append(row)
+        if new is old:
+            # lookup failed, try again on the next read
+            failed = True
             continue
-        groups = list_user_groups(str(user_id))
-        ai_c_groups = [g for g in groups if g.endswith("ai-c")]
-        ai_c_group = "|".join(ai_c_groups) if ai_c_groups else ""
+        fields[str(old.kennung)] = {k: v for k, v in new.items() if k not in old}
+    return failed
+
+
+def _store_enrichment(
+    month: str, fields: dict[str, dict[str, object]], freeze: bool, db_path: Path
+) -> None:
+    if not fields and not freeze:
+        return
+    frozen = store_enrichment(month, fields, freeze=freeze, db_path=db_path)
+    logger.debug(
+        "Stored enrichment of %d users for %s%s",
+        len(fields),
+        month,
+        " (frozen)" if frozen else "",
+    )
+
+
+def enrich_report_rows(
+    rows: Iterable[dict[str, object]],
+    *,
+    netrc_file: str | Path | None = None,
+    cache: dict[str, dict[str, object]] | None = None,
+) -> list[UsageRow]:
+    """Return ``rows`` with missing user information filled via SIM API.
+
+    *cache* maps user identifiers to previously looked up user fields and is
+    updated in place.  Long running processes pass the same mapping on every
+    call to avoid repeated SIM and ``id`` lookups.  Missing users are looked
+    up concurrently.
+    """
 
+    api = SimAPI(netrc_file=netrc_file)
+    rows = [as_row(row) for row in rows]
+    incomplete = [row for row in rows if _needs_lookup(row)]
+    looked_up = _lookup_users(
+        api,
+        [
+            str(row.kennung)
+            for row in incomplete
+            if cache is None or str(row.kennung) not in cache
+        ],
+    )
+    enriched = {}
+    for row in incomplete:
+        user_id = str(row.kennung)
+        fields = cache.get(user_id) if cache is not None else None
+        if fields is None:
+            fields = looked_up.get(user_id)
+            if fields is None:
+                continue
+            if cache is not None:
+                cache[user_id] = fields
         new = row.copy()
-        new.setdefault(
-            "first_name",
-            data.get("first_name") or data.get("firstname") or data.get("vorname"),
-        )
-        new.setdefault(
-            "last_name",
-            data.get("last_name") or data.get("lastname") or data.get("nachname"),
+        for key, value in fields.items():
+            new.setdefault(key, value)
+        enriched[id(row)] = new
+    return [enriched.get(id(row), row) for row in rows]
+
+
+def _split_partitions(value: str) -> list[str]:
+    return value.split(",") if value else []
+
+
+def _select_stored_clusters(
+    month: str,
+    rows: list[dict[str, object]],
+    clusters: list[str],
+    partitions: Iterable[str] | None,
+) -> list[dict[str, object]]:
+    """Return stored *rows* of *month* restricted to *clusters*.
+
+    Raise :class:`ValueError` if *month* was not collected for *clusters*,
+    or without *clusters* if it was collected for several clusters.
+    """
+    selected = select_clusters(rows, clusters, partitions=partitions)
+    if selected is not None:
+        return selected
+    if clusters:
+        raise ValueError(f"{month} was not collected for cluster {', '.join(clusters)}")
+    raise ValueError(f"{month} was collected per cluster; select them with --cluster")
+
+
+def load_stored_tables(
+    month: str,
+    *,
+    partitions: Iterable[str] | None = None,
+    sort_key: str | None = None,
+    reverse: bool = False,
+    top: int | None = None,
+    netrc_file: str | Path | None = None,
+    cache: dict[str, dict[str, object]] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    where: Iterable[RowFilter] | None = None,
+    clusters: Iterable[str] | None = None,
+) -> list[dict[str, object]]:
+    """Return the stored tables shown by ``usage report show`` for *month*.
+
+    Each table is a dictionary with ``rows``, ``start``, ``end`` and an
+    ``enriched`` flag.  Without *partitions* and with several stored entries
+    for *month*, every entry is returned as stored.  Otherwise a single table
+    with rows enriched via :func:`enrich_report_rows` is returned; with *top*
+    only the first *top* rows in sort order are returned, and only those are
+    loaded if *sort_key* is a usage column.  Only rows matching
+    all *where* filters are loaded, enriched and returned.  Rows show the
+    usage on *clusters* (see :func:`select_clusters`); :class:`ValueError` is
+    raised if *month* was not collected for them.
+    """
+    entries = [e for e in list_months(db_path=db_path) if e["month"] == month]
+    parts = list(partitions) if partitions is not None else None
+    filters = list(where or [])
+    wanted = list(clusters or [])
+    # totals of the selected clusters are only known after loading
+    pushed = [f for f in filters if not wanted or f.column not in USAGE_COLUMNS]
+    if parts is None:
+        if len(entries) > 1:
+            return [
+                {
+                    "rows": [
+                        row
+                        for row in _select_stored_clusters(
+                            month,
+                            load_month(
+                                month,
+                                partitions=_split_partitions(ent["partitions"]),
+                                db_path=db_path,
+                                where=pushed,
+                            )
+                            or [],
+                            wanted,
+                            _split_partitions(ent["partitions"]),
+                        )
+                        if matches_all(row, filters)
+                    ],
+                    "start": ent["start"],
+                    "end": ent["end"],
+                    "enriched": False,
+                }
+                for ent in entries
+            ]
+        parts = _split_partitions(entries[0]["partitions"]) if entries else []
+    # usage columns are stored, others may only be known after enrichment
+    early_top = top and not filters and (sort_key is None or sort_key in USAGE_COLUMNS)
+    if filters:
+        rows = load_month(month, partitions=parts, db_path=db_path, where=pushed)
+    elif early_top and not wanted:
+        rows = load_month(
+            month,
+            partitions=parts,
+            db_path=db_path,
+            sort_key=sort_key,
+            reverse=reverse,
+            limit=top,
         )
-        new.setdefault("email", _pick_email(data))
-        new.setdefault("projekt", data.get("projekt"))
-        new.setdefault("ai_c_group", ai_c_group)
-        enriched.append(new)
-    return enriched
+    else:
+        rows = load_month(month, partitions=parts, db_path=db_path)
+    rows = _select_stored_clusters(month, rows or [], wanted, parts)
+    if early_top and wanted:
+        rows = select_top(rows, sort_key, reverse, top)
+    rows = enrich_stored_month(
+        month,
+        rows,
+        complete=not (early_top or filters),
+        netrc_file=netrc_file,
+        cache=cache,
+        db_path=db_path,
+    )
+    if filters:
+        # text columns of rows stored without them are only known now
+        rows = [row for row in rows if matches_all(row, filters)]
+    if top and not early_top:
+        rows = select_top(rows, sort_key, reverse, top)
+    key = ",".join(sorted(parts))
+    match = next((e for e in entries if e["partitions"] == key), None)
+    if match is None:
+        # answered from the per-partition breakdown
+        match = next((e for e in entries if e["partitions"] == ""), None)
+    return [
+        {
+            "rows": rows,
+            "start": match["start"] if match else None,
+            "end": match["end"] if match else None,
+            "enriched": True,
+        }
+    ]
+
+
+def iter_stored_rows(
+    month: str,
+    *,
+    partitions: Iterable[str] | None = None,
+    netrc_file: str | Path | None = None,
+    cache: dict[str, dict[str, object]] | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    chunk_size: int = 1000,
+    where: Iterable[RowFilter] | None = None,
+    clusters: Iterable[str] | None = None,
+) -> Iterator[UsageRow]:
+    """Yield the rows of :func:`load_stored_tables` for *month* one by one.
+
+    Rows are read from the database and enriched in chunks of *chunk_size*,
+    so only one chunk is held in memory.  Rows are not sorted.  Looked up
+    fields are stored as by :func:`enrich_stored_month` once all rows have
+    been yielded.  Only rows matching all *where* filters are read.  Rows
+    show the usage on *clusters* as in :func:`load_stored_tables`.
+    """
+    entries = [e for e in list_months(db_path=db_path) if e["month"] == month]
+    parts = list(partitions) if partitions is not None else None
+    sources: list[tuple[str, list[str] | None, bool]] = []
+    if parts is None and len(entries) > 1:
+        sources = [(e["partitions"], None, False) for e in entries]
+    elif parts is None:
+        sources = [(e["partitions"], None, True) for e in entries]
+    else:
+        key = ",".join(sorted(parts))
+        if any(e["partitions"] == key for e in entries):
+            sources = [(key, None, True)]
+        elif any(e["partitions"] == "" for e in entries):
+            # answered from the per-partition breakdown
+            sources = [("", parts, True)]
+    frozen = is_month_frozen(month, db_path=db_path)
+    filters = list(where or [])
+    wanted = list(clusters or [])
+    fields: dict[str, dict[str, object]] = {}
+    failed = False
+    for key, part_filter, enrich in sources:
+        # totals change with the partition filter and the selected clusters
+        pushed = [
+            f
+            for f in filters
+            if (part_filter is None and not wanted) or f.column not in USAGE_COLUMNS
+        ]
+        for chunk in iter_usage_rows(
+            [month],
+            partitions=_split_partitions(key),
+            db_path=db_path,
+            chunk_size=chunk_size,
+            where=pushed,
+        ):
+            rows = []
+            for row in chunk:
+                del row["month"], row["partitions"]
+                row = UsageRow.from_dict(row)
+                breakdown = row.get("partition_usage")
+                if part_filter is not None and isinstance(breakdown, dict):
+                    row.update(filter_partition_usage(breakdown, part_filter))
+                rows.append(row)
+            rows = _select_stored_clusters(
+                month, rows, wanted, part_filter or _split_partitions(key)
+            )
+            if enrich and not frozen:
+                enriched = enrich_report_rows(rows, netrc_file=netrc_file, cache=cache)
+                failed = _looked_up_fields(rows, enriched, fields) or failed
+                rows = enriched
+            yield from (row for row in rows if matches_all(row, filters))
+    if sources and sources[0][2] and not frozen:
+        _store_enrichment(month, fields, not (failed or filters), db_path)
 
 
 def write_report_csv(
@@ -203,7 +892,7 @@ def write_report_csv(
     out_dir.mkdir(parents=True, exist_ok=True)
     out_path = out_dir / filename
 
-    row = report.copy()
+    row = dict(report)
     row["timestamp"] = datetime.now().isoformat(timespec="seconds")
     row["period_start"] = start
     row["period_end"] = end or ""
@@ -231,50 +920,47 @@ def aggregate_rows(
     by_group: bool = False,
     partitions: Iterable[str] | None = None,
     ignore_users: Iterable[str] | None = None,
-) -> list[dict[str, object]]:
+) -> list[UsageRow]:
     """Return ``rows`` aggregated either by user or by ``ai_c_group``."""
 
     part_str = ",".join(sorted(partitions or ["*"]))
-    aggr: dict[str, dict[str, object]] = {}
+    aggr: dict[str, UsageRow] = {}
     ignore = set(ignore_users or [])
     for row in rows:
-        if not isinstance(row, dict):
+        row = as_row(row)
+        if not isinstance(row, UsageRow):
             continue
-        if row.get("kennung") in ignore:
+        if row.kennung in ignore:
             continue
-        groups = row.get("ai_c_group", "")
-        keys = [row.get("kennung")] if not by_group else (groups.split("|") if groups else [""])
+        groups = row.ai_c_group or ""
+        keys = [row.kennung] if not by_group else (groups.split("|") if groups else [""])
         for key in keys:
             if key is None:
                 continue
-            cur = aggr.setdefault(
-                str(key),
-                {
-                    "first_name": row.get("first_name"),
-                    "last_name": row.get("last_name"),
-                    "email": row.get("email"),
-                    "kennung": row.get("kennung"),
-                    "projekt": row.get("projekt"),
-                    "ai_c_group": key if by_group else row.get("ai_c_group", ""),
-                    "cpu_hours": 0.0,
-                    "gpu_hours": 0.0,
-                    "ram_gb_hours": 0.0,
-                    "timestamp": row.get("timestamp", ""),
-                    "period_start": row.get("period_start"),
-                    "period_end": row.get("period_end"),
-                    "partition": part_str,
-                },
-            )
-            cur["cpu_hours"] = float(cur.get("cpu_hours", 0.0)) + float(row.get("cpu_hours", 0.0))
-            cur["gpu_hours"] = float(cur.get("gpu_hours", 0.0)) + float(row.get("gpu_hours", 0.0))
-            cur["ram_gb_hours"] = float(cur.get("ram_gb_hours", 0.0)) + float(row.get("ram_gb_hours", 0.0))
-
-            start = str(row.get("period_start")) if row.get("period_start") else ""
-            end = str(row.get("period_end")) if row.get("period_end") else ""
-            if cur.get("period_start") is None or (start and start < cur["period_start"]):
-                cur["period_start"] = start
-            if cur.get("period_end") is None or (end and end > cur["period_end"]):
-                cur["period_end"] = end
+            cur = aggr.get(str(key))
+            if cur is None:
+                cur = aggr[str(key)] = UsageRow(
+                    first_name=row.first_name,
+                    last_name=row.last_name,
+                    email=row.email,
+                    kennung=row.kennung,
+                    projekt=row.projekt,
+                    ai_c_group=key if by_group else groups,
+                    timestamp=row.timestamp or "",
+                    period_start=row.period_start,
+                    period_end=row.period_end,
+                    partition=part_str,
+                )
+            cur.cpu_hours += row.cpu_hours
+            cur.gpu_hours += row.gpu_hours
+            cur.ram_gb_hours += row.ram_gb_hours
+
+            start = str(row.period_start) if row.period_start else ""
+            end = str(row.period_end) if row.period_end else ""
+            if cur.period_start is None or (start and start < cur.period_start):
+                cur.period_start = start
+            if cur.period_end is None or (end and end > cur.period_end):
+                cur.period_end = end
     return list(aggr.values())
 
 
@@ -283,46 +969,191 @@ def sum_rows(
     *,
     partitions: Iterable[str] | None = None,
     ignore_users: Iterable[str] | None = None,
-) -> dict[str, object]:
+) -> UsageRow:
     """Return total usage metrics aggregated over all *rows*."""
 
-    part_str = ",".join(sorted(partitions or ["*"]))
-    total = {
-        "cpu_hours": 0.0,
-        "gpu_hours": 0.0,
-        "ram_gb_hours": 0.0,
-        "timestamp": "",
-        "period_start": None,
-        "period_end": None,
-        "partition": part_str,
-    }
+    total = UsageRow(timestamp="", partition=",".join(sorted(partitions or ["*"])))
     ignore = set(ignore_users or [])
     for row in rows:
-        if not isinstance(row, dict):
+        row = as_row(row)
+        if not isinstance(row, UsageRow):
             continue
-        if row.get("kennung") in ignore:
+        if row.kennung in ignore:
             continue
-        total["cpu_hours"] += float(row.get("cpu_hours", 0.0))
-        total["gpu_hours"] += float(row.get("gpu_hours", 0.0))
-        total["ram_gb_hours"] += float(row.get("ram_gb_hours", 0.0))
-
-        start = str(row.get("period_start")) if row.get("period_start") else ""
-        end = str(row.get("period_end")) if row.get("period_end") else ""
-        if total["period_start"] is None or (start and start < total["period_start"]):
-            total["period_start"] = start
-        if total["period_end"] is None or (end and end > total["period_end"]):
-            total["period_end"] = end
-
-    total["period_start"] = total["period_start"] or ""
-    total["period_end"] = total["period_end"] or ""
+        total.cpu_hours += row.cpu_hours
+        total.gpu_hours += row.gpu_hours
+        total.ram_gb_hours += row.ram_gb_hours
+
+        start = str(row.period_start) if row.period_start else ""
+        end = str(row.period_end) if row.period_end else ""
+        if total.period_start is None or (start and start < total.period_start):
+            total.period_start = start
+        if total.period_end is None or (end and end > total.period_end):
+            total.period_end = end
+
+    total.period_start = total.period_start or ""
+    total.period_end = total.period_end or ""
     return total
 
 
+def select_clusters(
+    rows: Iterable[dict[str, object]],
+    clusters: Iterable[str] | None,
+    *,
+    partitions: Iterable[str] | None = None,
+) -> list[UsageRow] | None:
+    """Return *rows* restricted to the usage on *clusters*.
+
+    Totals and ``partition_usage`` are recomputed from ``cluster_usage``.
+    ``None`` is returned if a row was not collected for all *clusters*.
+    Without *clusters* the usage of the default cluster is wanted: rows
+    collected without ``--cluster`` are returned unchanged, others give their
+    :data:`DEFAULT_CLUSTER` usage without ``cluster_usage``, or ``None`` if
+    the default cluster was not collected.
+    """
+    rows = list(rows)
+    wanted = list(clusters or [])
+    default = not wanted
+    if default:
+        if not any(isinstance(r, Mapping) and "cluster_usage" in r for r in rows):
+            return rows
+        wanted = [DEFAULT_CLUSTER]
+    result: list[UsageRow] = []
+    for row in rows:
+        row = as_row(row)
+        stored = row.get("cluster_usage") if isinstance(row, Mapping) else None
+        if not isinstance(stored, Mapping) or not all(c in stored for c in wanted):
+            return None
+        breakdown: dict[str, dict[str, float]] = {}
+        for cluster in wanted:
+            merge_partition_usage(breakdown, stored[cluster])
+        row = row.copy()
+        row.update(filter_partition_usage(breakdown, partitions))
+        row["partition_usage"] = breakdown
+        if default:
+            del row["cluster_usage"]
+        else:
+            row["cluster_usage"] = {c: stored[c] for c in wanted}
+        result.append(row)
+    return result
+
+
+def aggregate_clusters(
+    rows: Iterable[dict[str, object]],
+    *,
+    partitions: Iterable[str] | None = None,
+    ignore_users: Iterable[str] | None = None,
+) -> list[UsageRow]:
+    """Return the usage of *rows* aggregated per cluster.
+
+    Only rows carrying ``cluster_usage`` contribute; the totals of each
+    cluster include *partitions* only.  The usage of the default cluster is
+    left out as its name is not known, it may be one of the clusters.
+    """
+    part_str = ",".join(sorted(partitions or ["*"]))
+    aggr: dict[str, UsageRow] = {}
+    ignore = set(ignore_users or [])
+    for row in rows:
+        row = as_row(row)
+        if not isinstance(row, UsageRow) or row.kennung in ignore:
+            continue
+        stored = row.get("cluster_usage")
+        if not isinstance(stored, Mapping):
+            continue
+        for cluster, breakdown in stored.items():
+            if cluster == DEFAULT_CLUSTER:
+                continue
+            cur = aggr.get(cluster)
+            if cur is None:
+                cur = aggr[cluster] = UsageRow(
+                    cluster=cluster, timestamp=row.timestamp or "", partition=part_str
+                )
+            usage = filter_partition_usage(breakdown, partitions)
+            cur.cpu_hours += usage["cpu_hours"]
+            cur.gpu_hours += usage["gpu_hours"]
+            cur.ram_gb_hours += usage["ram_gb_hours"]
+
+            start = str(row.period_start) if row.period_start else ""
+            end = str(row.period_end) if row.period_end else ""
+            if cur.period_start is None or (start and start < cur.period_start):
+                cur.period_start = start
+            if cur.period_end is None or (end and end > cur.period_end):
+                cur.period_end = end
+    return [aggr[c] for c in sorted(aggr)]
+
+
+def load_group_trend(
+    months: Iterable[str],
+    *,
+    partitions: Iterable[str] | None = None,
+    ignore_users: Iterable[str] | None = None,
+    netrc_file: str | Path | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> dict[str, dict[str, dict[str, float]]]:
+    """Return usage per ``ai_c_group`` for each of the stored *months*.
+
+    The result maps months to groups to usage totals.  Stored group rollups
+    are read with a single query; only months without a rollup are loaded,
+    enriched (see :func:`enrich_stored_month`) and aggregated, and their
+    rollup is stored if every user could be looked up.  Months that are not
+    stored or not collected for the default cluster are left out.
+    """
+    months = list(months)
+    matrix = load_group_matrix(
+        months, partitions=partitions, ignore_users=ignore_users, db_path=db_path
+    )
+    for month in months:
+        if month in matrix:
+            continue
+        rows = load_month(month, partitions=partitions, db_path=db_path)
+        if rows is None or (
+            rows and not (isinstance(rows[0], Mapping) and "kennung" in rows[0])
+        ):
+            # not stored or a legacy entry without user rows
+            continue
+        rows = select_clusters(rows, None, partitions=partitions)
+        if rows is None:
+            # the default cluster was not collected
+            continue
+        rows = enrich_stored_month(month, rows, netrc_file=netrc_file, db_path=db_path)
+        rollup = {
+            str(row.ai_c_group): {
+                "cpu_hours": row.cpu_hours,
+                "gpu_hours": row.gpu_hours,
+                "ram_gb_hours": row.ram_gb_hours,
+            }
+            for row in aggregate_rows(
+                rows, by_group=True, partitions=partitions, ignore_users=ignore_users
+            )
+        }
+        if all("ai_c_group" in row for row in rows):
+            store_group_rollups(
+                month,
+                rollup,
+                partitions=partitions,
+                ignore_users=ignore_users,
+                db_path=db_path,
+            )
+        logger.debug("Aggregated groups of %s", month)
+        matrix[month] = rollup
+    return {month: matrix[month] for month in months if month in matrix}
+
+
 __all__ = [
     "create_report",
     "create_active_reports",
+    "collect_active_months",
+    "active_roster",
     "enrich_report_rows",
+    "enrich_stored_month",
+    "load_stored_tables",
+    "iter_stored_rows",
+    "load_range_reports",
+    "load_group_trend",
     "write_report_csv",
     "aggregate_rows",
+    "aggregate_clusters",
+    "select_clusters",
+    "in_shard",
     "sum_rows",
 ]
@@ -0,0 +1,215 @@
+"""Typed usage rows passed between collection, storage and output."""
+from __future__ import annotations
+
+import sys
+from collections.abc import Mapping, MutableMapping
+from dataclasses import dataclass, field, replace
+from fnmatch import fnmatchcase
+from typing import Any, Dict, Iterable, Iterator, List, NamedTuple, Optional, Union
+
+# ``slots`` is only supported by dataclasses from Python 3.10 on
+_SLOTS: Dict[str, bool] = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+USAGE_COLUMNS = ("cpu_hours", "gpu_hours", "ram_gb_hours")
+
+_TEXT_COLUMNS = (
+    "first_name",
+    "last_name",
+    "email",
+    "kennung",
+    "projekt",
+    "ai_c_group",
+    "timestamp",
+    "period_start",
+    "period_end",
+    "partition",
+    "cluster",
+)
+
+# mapping order, matches the columns of printed and exported tables
+_COLUMNS = _TEXT_COLUMNS[:6] + USAGE_COLUMNS + _TEXT_COLUMNS[6:]
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value) if value is not None and value != "" else 0.0
+    except (TypeError, ValueError):
+        return 0.0
+
+
+@dataclass(eq=False, **_SLOTS)
+class UsageRow(MutableMapping):
+    """Usage of one user (or group) with its user information.
+
+    The usage columns are floats that default to ``0.0``.  Rows also behave
+    like the dictionaries stored in the database: columns that are ``None``
+    (e.g. after ``del row["cpu_hours"]``) are missing from the mapping and
+    any other key is kept in :attr:`extra`, e.g. ``partition_usage`` or
+    ``month``.  Convert rows with ``dict(row)`` where JSON or CSV is
+    written.
+    """
+
+    first_name: Any = None
+    last_name: Any = None
+    email: Any = None
+    kennung: Any = None
+    projekt: Any = None
+    ai_c_group: Any = None
+    cpu_hours: Optional[float] = 0.0
+    gpu_hours: Optional[float] = 0.0
+    ram_gb_hours: Optional[float] = 0.0
+    timestamp: Any = None
+    period_start: Any = None
+    period_end: Any = None
+    partition: Any = None
+    cluster: Any = None
+    extra: Dict[str, Any] = field(default_factory=dict)
+
+    @classmethod
+    def from_dict(cls, data: Mapping[str, Any]) -> "UsageRow":
+        """Return *data* as row, converting the usage columns to floats."""
+        if isinstance(data, cls):
+            return data
+        values: Dict[str, Any] = {}
+        extra: Dict[str, Any] = {}
+        for key, value in data.items():
+            if key in USAGE_COLUMNS:
+                values[key] = _to_float(value)
+            elif key in _TEXT_COLUMNS:
+                values[key] = value
+            else:
+                extra[key] = value
+        return cls(**values, extra=extra)
+
+    def __getitem__(self, key: str) -> Any:
+        if key in _COLUMNS:
+            value = getattr(self, key)
+            if value is None:
+                raise KeyError(key)
+            return value
+        return self.extra[key]
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        if key in USAGE_COLUMNS:
+            setattr(self, key, _to_float(value))
+        elif key in _TEXT_COLUMNS:
+            setattr(self, key, value)
+        else:
+            self.extra[key] = value
+
+    def __delitem__(self, key: str) -> None:
+        if key in _COLUMNS:
+            if getattr(self, key) is None:
+                raise KeyError(key)
+            setattr(self, key, None)
+        else:
+            del self.extra[key]
+
+    def __iter__(self) -> Iterator[str]:
+        for key in _COLUMNS:
+            if getattr(self, key) is not None:
+                yield key
+        yield from self.extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def __or__(self, other: Mapping[str, Any]) -> "UsageRow":
+        new = self.copy()
+        new.update(other)
+        return new
+
+    def copy(self) -> "UsageRow":
+        return replace(self, extra=dict(self.extra))
+
+
+# text columns rows can be filtered on, see :func:`parse_filter`
+FILTER_COLUMNS = ("kennung", "projekt", "ai_c_group")
+
+_FILTER_OPERATORS = ("<=", ">=", "!=", "=", "<", ">")
+
+_COMPARE = {
+    "=": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+class RowFilter(NamedTuple):
+    """Condition ``column op value`` on usage rows.
+
+    Text columns are matched with glob patterns (``=`` and ``!=``), usage
+    columns are compared numerically.
+    """
+
+    column: str
+    op: str
+    value: Union[str, float]
+
+    def matches(self, row: Mapping[str, Any]) -> bool:
+        if self.column in USAGE_COLUMNS:
+            return _COMPARE[self.op](_to_float(row.get(self.column)), self.value)
+        value = row.get(self.column)
+        hit = value is not None and fnmatchcase(str(value), str(self.value))
+        return hit if self.op == "=" else not hit
+
+
+def parse_filter(spec: str) -> RowFilter:
+    """Return the :class:`RowFilter` for *spec*, e.g. ``gpu_hours>=100``.
+
+    :class:`ValueError` is raised for unknown columns or operators.
+    """
+    # the first operator in *spec* splits it, ``>=`` is not read as ``>``
+    found = [(spec.find(op), -len(op), op) for op in _FILTER_OPERATORS if op in spec]
+    if not found:
+        raise ValueError(f"expected COLUMN OP VALUE: {spec}")
+    pos, _, op = min(found)
+    column, value = spec[:pos].strip(), spec[pos + len(op):].strip()
+    if column in USAGE_COLUMNS:
+        try:
+            return RowFilter(column, op, float(value))
+        except ValueError:
+            raise ValueError(f"{column} needs a number: {spec}") from None
+    if column not in FILTER_COLUMNS:
+        choices = ", ".join(FILTER_COLUMNS + USAGE_COLUMNS)
+        raise ValueError(f"unknown column {column!r} (choose from {choices})")
+    if op not in ("=", "!="):
+        raise ValueError(f"{column} only supports = and !=: {spec}")
+    return RowFilter(column, op, value)
+
+
+def matches_all(row: Mapping[str, Any], filters: Iterable[RowFilter]) -> bool:
+    """Return whether *row* satisfies every filter of *filters*."""
+    return all(f.matches(row) for f in filters)
+
+
+def as_row(row: Any) -> Any:
+    """Return a mapping *row* as :class:`UsageRow`; other values unchanged."""
+    if isinstance(row, UsageRow) or not isinstance(row, Mapping):
+        return row
+    return UsageRow.from_dict(row)
+
+
+def as_rows(rows: Iterable[Any]) -> List[Any]:
+    """Return :func:`as_row` applied to all *rows*."""
+    return [as_row(row) for row in rows]
+
+
+def to_dicts(rows: Iterable[Any]) -> List[Any]:
+    """Return *rows* as plain dictionaries for JSON output."""
+    return [dict(row) if isinstance(row, Mapping) else row for row in rows]
+
+
+__all__ = [
+    "UsageRow",
+    "USAGE_COLUMNS",
+    "RowFilter",
+    "parse_filter",
+    "matches_all",
+    "as_row",
+    "as_rows",
+    "to_dicts",
+]
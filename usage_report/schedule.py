@@ -0,0 +1,310 @@
+"""Periodic collection of monthly usage driven by a schedule file.
+
+A schedule file is a JSON document listing collection jobs::
+
+    {
+        "jobs": [
+            {"name": "month-to-date", "month": "current", "every": "daily",
+             "at": "02:00", "jitter": 600},
+            {"name": "close-previous", "month": "previous",
+             "after_close": true, "close_delay": 21600},
+            {"name": "gpu-hourly", "month": "current", "every": 3600,
+             "partitions": ["lrz*"], "clusters": ["cm4", "lrz-ai"]}
+        ]
+    }
+
+``every`` is ``"hourly"``, ``"daily"`` or a number of seconds; daily jobs
+may set ``at`` (``HH:MM``) to run once per day after that time.  Jobs with
+``after_close`` run exactly once per target month, ``close_delay`` seconds
+after the month has ended.  ``clusters`` are queried in parallel and
+kept apart in the stored rows.  Before a job starts the runner waits a random
+delay of up to ``jitter`` seconds.  A job whose previous run is still active
+(in this or another process) is skipped.  The state of every run is recorded
+in the ``schedule_runs`` table of the usage database.
+"""
+from __future__ import annotations
+
+import fcntl
+import json
+import logging
+import random
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Callable, Iterable
+
+from .database import DEFAULT_DB_PATH, list_schedule_runs, record_schedule_run, store_month
+from .dates import expand_month
+
+logger = logging.getLogger(__name__)
+
+_INTERVALS = {"hourly": 3600.0, "daily": 86400.0}
+
+
+@dataclass
+class ScheduledJob:
+    """A collection job parsed from a schedule file."""
+
+    name: str
+    month: str = "current"
+    every: float | None = None
+    at: str | None = None
+    jitter: float = 0.0
+    after_close: bool = False
+    close_delay: float = 0.0
+    partitions: list[str] | None = None
+    clusters: list[str] | None = None
+
+
+def _parse_every(value: object) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, str) and value in _INTERVALS:
+        return _INTERVALS[value]
+    seconds = float(value)  # type: ignore[arg-type]
+    if seconds <= 0:
+        raise ValueError(f"interval must be positive: {value}")
+    return seconds
+
+
+def load_schedule(path: str | Path) -> list[ScheduledJob]:
+    """Return the jobs declared in the schedule file *path*."""
+    data = json.loads(Path(path).read_text())
+    jobs: list[ScheduledJob] = []
+    for entry in data.get("jobs", []):
+        entry = dict(entry)
+        name = entry.pop("name")
+        job = ScheduledJob(
+            name=name,
+            month=entry.pop("month", "current"),
+            every=_parse_every(entry.pop("every", None)),
+            at=entry.pop("at", None),
+            jitter=float(entry.pop("jitter", 0.0)),
+            after_close=bool(entry.pop("after_close", False)),
+            close_delay=float(entry.pop("close_delay", 0.0)),
+            partitions=entry.pop("partitions", None),
+            clusters=entry.pop("clusters", None),
+        )
+        if entry:
+            raise ValueError(f"unknown options for job {name}: {', '.join(entry)}")
+        if job.every is None and not job.after_close:
+            raise ValueError(f"job {name} needs 'every' or 'after_close'")
+        jobs.append(job)
+    names = [j.name for j in jobs]
+    if len(names) != len(set(names)):
+        raise ValueError("job names must be unique")
+    return jobs
+
+
+def _month_start(dt: datetime) -> datetime:
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def resolve_month(spec: str, now: datetime) -> str:
+    """Return the ``YYYY-MM`` month described by *spec* relative to *now*."""
+    if spec == "current":
+        return now.strftime("%Y-%m")
+    if spec == "previous":
+        return (_month_start(now) - timedelta(days=1)).strftime("%Y-%m")
+    datetime.strptime(spec, "%Y-%m")
+    return spec
+
+
+def _month_end(month: str) -> datetime:
+    dt = datetime.strptime(month, "%Y-%m")
+    return _month_start(dt + timedelta(days=32))
+
+
+def due_target(
+    job: ScheduledJob, now: datetime, runs: Iterable[dict[str, object]]
+) -> str | None:
+    """Return the month *job* should collect at *now* or ``None``.
+
+    *runs* are the recorded runs of *job*, most recent first.
+    """
+    target = resolve_month(job.month, now)
+    runs = list(runs)
+    if job.after_close:
+        if now < _month_end(target) + timedelta(seconds=job.close_delay):
+            return None
+        done = any(r["target"] == target and r["status"] == "ok" for r in runs)
+        return None if done else target
+    last = max((str(r["started"]) for r in runs), default=None)
+    if last is None:
+        return target
+    last_dt = datetime.fromisoformat(last)
+    if job.at and job.every == _INTERVALS["daily"]:
+        hour, minute = (int(p) for p in job.at.split(":"))
+        slot = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+        if now < slot:
+            slot -= timedelta(days=1)
+        return target if last_dt < slot else None
+    assert job.every is not None
+    if (now - last_dt).total_seconds() >= job.every:
+        return target
+    return None
+
+
+def collect_month(
+    month: str,
+    *,
+    partitions: Iterable[str] | None = None,
+    netrc_file: str | Path | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    clusters: Iterable[str] | None = None,
+) -> None:
+    """Collect active user reports for *month* and store them."""
+    from .api import record_cache
+    from .report import create_active_reports
+    from .sreport import sreport_cache
+
+    start, end = expand_month(month)
+    with record_cache(db_path), sreport_cache(db_path):
+        rows = create_active_reports(
+            start,
+            end,
+            partitions=partitions,
+            netrc_file=netrc_file,
+            checkpoint_db=db_path,
+            clusters=clusters,
+        )
+    store_month(month, start, end, rows, partitions=partitions, db_path=db_path)
+
+
+class _JobLock:
+    """Non-blocking exclusive lock file shared between processes."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self._fh = None
+
+    def acquire(self) -> bool:
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fh = self.path.open("w")
+        try:
+            fcntl.flock(fh, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            fh.close()
+            return False
+        self._fh = fh
+        return True
+
+    def release(self) -> None:
+        if self._fh is not None:
+            fcntl.flock(self._fh, fcntl.LOCK_UN)
+            self._fh.close()
+            self._fh = None
+
+
+def run_job(
+    job: ScheduledJob,
+    target: str,
+    *,
+    netrc_file: str | Path | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    collect: Callable[..., None] = collect_month,
+    sleep: Callable[[float], None] = time.sleep,
+) -> str:
+    """Run *job* for *target* and return its final status.
+
+    The status is ``"skipped"`` if a previous run of the job still holds its
+    lock, otherwise ``"ok"`` or ``"error"``.
+    """
+    lock = _JobLock(Path(db_path).parent / f"schedule-{job.name}.lock")
+    if not lock.acquire():
+        logger.warning("Skipping %s: previous run still active", job.name)
+        return "skipped"
+    try:
+        if job.jitter:
+            delay = random.uniform(0, job.jitter)
+            logger.debug("Delaying %s by %.0fs", job.name, delay)
+            sleep(delay)
+        started = datetime.now()
+        record_schedule_run(
+            job.name,
+            target,
+            started=started.isoformat(timespec="seconds"),
+            status="running",
+            db_path=db_path,
+        )
+        logger.info("Running %s for %s", job.name, target)
+        status, error = "ok", None
+        begin = time.monotonic()
+        options = {"clusters": job.clusters} if job.clusters else {}
+        try:
+            collect(
+                target,
+                partitions=job.partitions,
+                netrc_file=netrc_file,
+                db_path=db_path,
+                **options,
+            )
+        except Exception as exc:  # a failing job must not stop the runner
+            logger.exception("Job %s failed", job.name)
+            status, error = "error", str(exc)
+        duration = time.monotonic() - begin
+        record_schedule_run(
+            job.name,
+            target,
+            started=started.isoformat(timespec="seconds"),
+            finished=datetime.now().isoformat(timespec="seconds"),
+            status=status,
+            duration=duration,
+            error=error,
+            db_path=db_path,
+        )
+        return status
+    finally:
+        lock.release()
+
+
+def run_pending(
+    jobs: Iterable[ScheduledJob],
+    *,
+    now: datetime | None = None,
+    netrc_file: str | Path | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+    collect: Callable[..., None] = collect_month,
+    sleep: Callable[[float], None] = time.sleep,
+) -> dict[str, str]:
+    """Run all due *jobs* one after another and return their statuses."""
+    results: dict[str, str] = {}
+    for job in jobs:
+        current = now or datetime.now()
+        target = due_target(job, current, list_schedule_runs(job.name, db_path=db_path))
+        if target is None:
+            continue
+        results[job.name] = run_job(
+            job,
+            target,
+            netrc_file=netrc_file,
+            db_path=db_path,
+            collect=collect,
+            sleep=sleep,
+        )
+    return results
+
+
+def run_forever(
+    jobs: list[ScheduledJob],
+    *,
+    poll: float = 60.0,
+    netrc_file: str | Path | None = None,
+    db_path: Path = DEFAULT_DB_PATH,
+) -> None:
+    """Check for due jobs every *poll* seconds until interrupted."""
+    logger.info("Scheduler started with %d jobs", len(jobs))
+    while True:
+        run_pending(jobs, netrc_file=netrc_file, db_path=db_path)
+        time.sleep(poll)
+
+
+__all__ = [
+    "ScheduledJob",
+    "load_schedule",
+    "due_target",
+    "run_job",
+    "run_pending",
+    "run_forever",
+]
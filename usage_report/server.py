@@ -0,0 +1,300 @@
+"""Long running daemon serving report queries over a Unix domain socket.
+
+The daemon keeps database connections, looked up user information and
+aggregated results in memory so repeated ``report show`` and
+``report active --aggregate`` queries are answered without touching SIM or
+re-reading unchanged months.  Requests and responses are single JSON objects
+terminated by a newline.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import sqlite3
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+
+from .api import record_cache
+from .database import (
+    DEFAULT_DB_PATH,
+    close_connection_pool,
+    enable_connection_pool,
+    init_db,
+    load_month,
+)
+from .dates import expand_month
+from .report import (
+    aggregate_clusters,
+    aggregate_rows,
+    enrich_stored_month,
+    load_stored_tables,
+    select_clusters,
+    sum_rows,
+)
+from .rows import RowFilter, to_dicts
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = Path("output/usage.sock")
+SOCKET_ENV = "USAGE_SOCKET"
+
+
+def socket_path(path: str | Path | None = None) -> Path:
+    """Return the daemon socket path (*path*, ``$USAGE_SOCKET`` or default)."""
+    return Path(path or os.environ.get(SOCKET_ENV) or DEFAULT_SOCKET_PATH)
+
+
+class DaemonState:
+    """Warm caches shared by all requests of one daemon process.
+
+    Users are looked up with the *netrc_file* the daemon was started with;
+    requests cannot choose the credentials.
+    """
+
+    def __init__(
+        self,
+        *,
+        db_path: Path = DEFAULT_DB_PATH,
+        netrc_file: str | Path | None = None,
+    ) -> None:
+        self.db_path = Path(db_path)
+        self.netrc_file = netrc_file
+        # kennung -> enriched user fields (SIM data and ai-c group)
+        self.user_cache: dict[str, dict[str, object]] = {}
+        # serialized request -> response payload
+        self.rollups: dict[str, dict[str, Any]] = {}
+        self._version: int | None = None
+        self._version_conn: sqlite3.Connection | None = None
+        self._version_lock = threading.Lock()
+
+    def _check_version(self) -> None:
+        """Drop rollups when another connection committed to the database."""
+        with self._version_lock:
+            if self._version_conn is None:
+                init_db(self.db_path)
+                self._version_conn = sqlite3.connect(
+                    self.db_path, check_same_thread=False
+                )
+            version = self._version_conn.execute("PRAGMA data_version").fetchone()[0]
+            if version != self._version:
+                if self._version is not None:
+                    logger.debug(
+                        "Database changed, dropping %d rollups", len(self.rollups)
+                    )
+                self.rollups.clear()
+                self._version = version
+
+    def handle(self, request: dict[str, Any]) -> dict[str, Any]:
+        """Return the response for *request*."""
+        command = request.get("command")
+        if command == "ping":
+            return {"ok": True}
+        if command not in ("show", "aggregate"):
+            return {"ok": False, "error": f"unknown command: {command}"}
+        self._check_version()
+        key = json.dumps(request, sort_keys=True)
+        cached = self.rollups.get(key)
+        if cached is not None:
+            return cached
+        if command == "show":
+            response = {"ok": True, "tables": self.show(request)}
+        else:
+            rows = self.aggregate(request)
+            if rows is None:
+                return {"ok": False, "error": "month not stored"}
+            response = {"ok": True, "rows": rows}
+        self.rollups[key] = response
+        return response
+
+    def show(self, request: dict[str, Any]) -> list[dict[str, object]]:
+        tables = load_stored_tables(
+            request["month"],
+            partitions=request.get("partitions"),
+            sort_key=request.get("sort_key"),
+            reverse=bool(request.get("reverse")),
+            top=request.get("top"),
+            netrc_file=self.netrc_file,
+            cache=self.user_cache,
+            db_path=self.db_path,
+            where=[RowFilter(*f) for f in request.get("where") or []],
+            clusters=request.get("clusters"),
+        )
+        return [{**table, "rows": to_dicts(table["rows"])} for table in tables]
+
+    def aggregate(self, request: dict[str, Any]) -> list[dict[str, object]] | None:
+        """Return aggregated rows or ``None`` if a month is not stored.
+
+        Months not collected for all requested ``clusters`` count as not
+        stored, as do months collected with clusters if none are requested.
+        """
+        mode = request.get("aggregate") or "user"
+        partitions = request.get("partitions")
+        ignore_users = request.get("ignore_users")
+        clusters = request.get("clusters")
+        collected: list[dict[str, object]] = []
+        for month in request.get("months") or []:
+            rows = load_month(month, partitions=partitions, db_path=self.db_path)
+            if rows is None:
+                return None
+            sample = rows[0] if rows else {}
+            if not isinstance(sample, Mapping) or "kennung" not in sample:
+                return None
+            if clusters or mode != "clusters":
+                rows = select_clusters(rows, clusters, partitions=partitions)
+                if rows is None:
+                    return None
+            rows = enrich_stored_month(
+                month,
+                rows,
+                netrc_file=self.netrc_file,
+                cache=self.user_cache,
+                db_path=self.db_path,
+            )
+            if mode == "all":
+                start, end = expand_month(month)
+                total = sum_rows(rows, partitions=partitions, ignore_users=ignore_users)
+                total["month"] = month
+                total["period_start"] = start
+                total["period_end"] = end
+                collected.append(total)
+            else:
+                collected.extend(rows)
+        if mode == "all":
+            return to_dicts(collected)
+        if mode == "clusters":
+            return to_dicts(
+                aggregate_clusters(
+                    collected, partitions=partitions, ignore_users=ignore_users
+                )
+            )
+        return to_dicts(
+            aggregate_rows(
+                collected,
+                by_group=(mode == "groups"),
+                partitions=partitions,
+                ignore_users=ignore_users,
+            )
+        )
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        state: DaemonState = self.server.state  # type: ignore[attr-defined]
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                response = state.handle(request)
+            except Exception as exc:  # keep serving on bad requests
+                logger.exception("Failed to handle request")
+                response = {"ok": False, "error": str(exc)}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+
+
+class UsageServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server answering requests with a shared :class:`DaemonState`.
+
+    Every client is served in its own thread, so an idle connection does not
+    hold up other queries.  The socket is only accessible to its owner.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path: str | Path, state: DaemonState) -> None:
+        self.state = state
+        super().__init__(str(path), _RequestHandler)
+
+    def server_bind(self) -> None:
+        # create the socket file with mode 0600 instead of changing it later
+        umask = os.umask(0o177)
+        try:
+            super().server_bind()
+        finally:
+            os.umask(umask)
+
+
+def _raise_interrupt(signum: int, frame: object) -> None:
+    raise KeyboardInterrupt
+
+
+def serve(
+    path: str | Path | None = None,
+    *,
+    db_path: Path = DEFAULT_DB_PATH,
+    netrc_file: str | Path | None = None,
+) -> None:
+    """Serve requests on the Unix socket *path* until interrupted."""
+    sock_path = socket_path(path)
+    sock_path.parent.mkdir(parents=True, exist_ok=True)
+    if sock_path.exists():
+        sock_path.unlink()
+    enable_connection_pool()
+    state = DaemonState(db_path=db_path, netrc_file=netrc_file)
+    server = UsageServer(sock_path, state)
+    signal.signal(signal.SIGTERM, _raise_interrupt)
+    logger.info("Serving usage queries on %s", sock_path)
+    print(f"Listening on {sock_path}")
+    try:
+        with record_cache(db_path):
+            server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        close_connection_pool()
+        if sock_path.exists():
+            sock_path.unlink()
+
+
+def query_daemon(
+    request: dict[str, Any],
+    *,
+    path: str | Path | None = None,
+    timeout: float = 60.0,
+) -> dict[str, Any] | None:
+    """Send *request* to a running daemon and return its response.
+
+    ``None`` is returned if no daemon is listening or it could not answer the
+    request, in which case callers compute the result themselves.
+    """
+    sock_path = socket_path(path)
+    if not sock_path.exists():
+        return None
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(timeout)
+            sock.connect(str(sock_path))
+            sock.sendall(json.dumps(request).encode() + b"\n")
+            chunks: list[bytes] = []
+            while True:
+                chunk = sock.recv(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+                if chunk.endswith(b"\n"):
+                    break
+    except OSError as exc:
+        logger.debug("Usage daemon at %s not available: %s", sock_path, exc)
+        return None
+    buf = b"".join(chunks)
+    try:
+        response = json.loads(buf)
+    except json.JSONDecodeError:
+        logger.debug("Invalid response from usage daemon: %r", buf[:200])
+        return None
+    if not response.get("ok"):
+        logger.debug("Usage daemon could not answer: %s", response.get("error"))
+        return None
+    logger.debug("Answered %s request via daemon", request.get("command"))
+    return response
+
+
+__all__ = ["DaemonState", "UsageServer", "serve", "query_daemon", "socket_path"]
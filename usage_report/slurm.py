@@ -3,9 +3,30 @@ from __future__ import annotations
 
 import subprocess
 import sys
-from typing import Iterable, Dict
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Iterable, Dict, List, NamedTuple, TypeVar
 import fnmatch
 
+logger = logging.getLogger(__name__)
+
+# Fields requested from sacct, in output order (``--noheader``)
+SACCT_FIELDS = [
+    "JobID",
+    "Partition",
+    "ElapsedRaw",
+    "NCPUS",
+    "AllocTRES",
+    "Start",
+    "End",
+]
+
+_WILDCARDS = set("*?[")
+
+_T = TypeVar("_T")
+
 
 def parse_elapsed(elapsed: str) -> float:
     """Convert an elapsed time string to hours."""
@@ -52,36 +73,199 @@ def parse_sacct_output(text: str) -> Iterable[Dict[str, str]]:
         yield dict(zip(header, values))
 
 
-def fetch_usage(
+def parse_sacct_records(text: str, fields: List[str]) -> Iterable[Dict[str, str]]:
+    """Yield dictionaries for ``sacct --noheader --parsable2`` output.
+
+    *fields* are the names passed via ``--format`` in the same order.
+    """
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        values = line.split("|")
+        if values[0] == fields[0]:
+            # tolerate a header line
+            continue
+        yield dict(zip(fields, values))
+
+
+class JobRecord(NamedTuple):
+    """Typed fields of one job (or job step) line of ``sacct`` output.
+
+    Records are tuples, so a record costs a fixed few pointers instead of a
+    dictionary of strings per line.
+    """
+
+    job_id: str
+    user: str
+    partition: str
+    elapsed: int
+    ncpus: int
+    gpus: int
+    mem_gb: float
+    start: datetime | None = None
+    end: datetime | None = None
+
+    @property
+    def is_step(self) -> bool:
+        return "." in self.job_id
+
+
+def _int(value: str) -> int:
+    try:
+        return int(value)
+    except ValueError:
+        return 0
+
+
+def parse_job_records(
+    text: str, fields: List[str] | None = None, *, user: str = ""
+) -> Iterable[JobRecord]:
+    """Yield a :class:`JobRecord` for each line of ``sacct --parsable2`` output.
+
+    *fields* are the names passed via ``--format`` in output order; without
+    them the first line is read as header.  The position of every record
+    field is looked up once and repeated partition and user names share one
+    string.  Output without a ``User`` column gets *user*.
+    """
+    lines = (ln for ln in text.splitlines() if ln.strip())
+    if fields is None:
+        first = next(lines, None)
+        if first is None:
+            return
+        fields = first.split("|")
+    pos = {name: i for i, name in enumerate(fields)}
+    i_job, i_user, i_part, i_elapsed, i_cpus, i_tres, i_start, i_end = (
+        pos.get(name, -1)
+        for name in (
+            "JobID", "User", "Partition", "ElapsedRaw", "NCPUS", "AllocTRES", "Start", "End"
+        )
+    )
+    width = len(fields)
+    names: Dict[str, str] = {}
+    for line in lines:
+        values = line.split("|")
+        if values[0] == fields[0]:
+            # tolerate a header line
+            continue
+        if len(values) < width:
+            values += [""] * (width - len(values))
+        tres = parse_tres(values[i_tres]) if i_tres >= 0 else {}
+        yield JobRecord(
+            values[i_job] if i_job >= 0 else "",
+            names.setdefault(values[i_user], values[i_user]) if i_user >= 0 else user,
+            names.setdefault(values[i_part], values[i_part]) if i_part >= 0 else "",
+            _int(values[i_elapsed]) if i_elapsed >= 0 else 0,
+            _int(values[i_cpus]) if i_cpus >= 0 else 0,
+            _int(tres.get("gres/gpu", tres.get("gpu", "0")).split("(")[0] or "0"),
+            parse_mem(tres.get("mem", "0")),
+            _parse_time(values[i_start]) if i_start >= 0 else None,
+            _parse_time(values[i_end]) if i_end >= 0 else None,
+        )
+
+
+@lru_cache(maxsize=None)
+def list_partitions(cluster: str | None = None) -> tuple[str, ...]:
+    """Return the partitions known to Slurm, cached for the process lifetime.
+
+    The partitions of *cluster* are listed with ``sinfo -M``, those of the
+    local cluster otherwise.  An empty tuple is returned if ``sinfo`` is not
+    available.
+    """
+    cmd = ["sinfo", "--noheader", "--format=%R"]
+    if cluster:
+        cmd.extend(["-M", cluster])
+    try:
+        proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    except (subprocess.CalledProcessError, OSError) as exc:
+        logger.debug("Could not list partitions with sinfo: %s", exc)
+        return ()
+    names = {ln.strip() for ln in proc.stdout.splitlines() if ln.strip()}
+    # with -M sinfo prints a "CLUSTER: name" line before the partitions
+    return tuple(sorted(n for n in names if not n.startswith("CLUSTER:")))
+
+
+def expand_partitions(
+    patterns: Iterable[str],
+    known: Iterable[str] | None = None,
+    *,
+    cluster: str | None = None,
+) -> List[str] | None:
+    """Return the partition names matching *patterns*.
+
+    Names without wildcards are kept as given so partitions that no longer
+    exist can still be queried.  Wildcard patterns are expanded against
+    *known* (default: :func:`list_partitions` of *cluster*).  ``None`` is
+    returned if a wildcard pattern cannot be expanded because the partition
+    list is unknown, in which case filtering has to happen client side.
+    """
+    patterns = list(patterns)
+    if any(_WILDCARDS & set(p) for p in patterns):
+        known = list(known) if known is not None else list(list_partitions(cluster))
+        if not known:
+            return None
+    names: List[str] = []
+    for pattern in patterns:
+        if _WILDCARDS & set(pattern):
+            matches = [p for p in known or [] if fnmatch.fnmatch(p, pattern)]
+        else:
+            matches = [pattern]
+        for name in matches:
+            if name not in names:
+                names.append(name)
+    return names
+
+
+def plan_sacct_command(
     user: str,
     start: str,
     end: str | None = None,
     *,
     partitions: Iterable[str] | None = None,
-) -> dict[str, float]:
-    """Return aggregated GPU/CPU/RAM hours for *user* between *start* and *end*.
+    cluster: str | None = None,
+    truncate: bool = False,
+) -> List[str] | None:
+    """Return the cheapest ``sacct`` command for the given query.
 
-    Parameters
-    ----------
-    user:
-        User identifier to query.
-    start:
-        Start date in ``YYYY-MM-DD`` format.
-    end:
-        Optional end date in ``YYYY-MM-DD`` format.
+    Only job allocations are requested (``-X``) with integer elapsed seconds
+    and no header.  With *truncate* job times are truncated to the queried
+    period (``-T``) and an end given as a plain date includes that whole day,
+    as needed for daily buckets; plain queries pass *end* as given.
+    Partition filters are expanded to exact names and passed via ``-r`` so
+    slurmdbd filters server side.  ``None`` is returned if the partition
+    filter matches no known partition, i.e. the usage is zero.  A *cluster*
+    is queried with ``-M`` instead of the default cluster.
     """
     cmd = [
         "sacct",
+        "-X",
+        "--noheader",
+        "--parsable2",
+        *(["-T"] if truncate else []),
         "-u",
         user,
-        "--format=JobID,Partition,Elapsed,NCPUS,AllocTRES",
-        "--parsable2",
+        f"--format={','.join(SACCT_FIELDS)}",
         "-S",
         start,
     ]
     if end:
+        if truncate and _is_date(end):
+            end = f"{end}T23:59:59"
         cmd.extend(["-E", end])
+    if partitions:
+        names = expand_partitions(partitions, cluster=cluster)
+        if names is not None:
+            if not names:
+                logger.debug("Partition filter %s matches no partition", list(partitions))
+                return None
+            cmd.extend(["-r", ",".join(names)])
+    if cluster:
+        cmd.extend(["-M", cluster])
+    logger.debug("Planned sacct command: %s", " ".join(cmd))
+    return cmd
 
+
+def _run_sacct(cmd: List[str]) -> str | None:
+    """Return the output of *cmd* or ``None`` if ``sacct`` failed."""
     try:
         proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
     except subprocess.CalledProcessError as exc:
@@ -89,23 +273,251 @@ def fetch_usage(
         print(f"Error running '{msg}': {exc}", file=sys.stderr)
         if exc.stderr:
             print(exc.stderr, file=sys.stderr)
+        return None
+    return proc.stdout
+
+
+def _is_date(value: str) -> bool:
+    return len(value) == 10 and _parse_time(value) is not None
+
+
+def _parse_time(value: str | None) -> datetime | None:
+    """Return *value* as datetime or ``None`` for ``Unknown`` and the like."""
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def _period_bounds(
+    start: str, end: str | None
+) -> tuple[datetime | None, datetime | None]:
+    """Return the half open interval covered by the ``-S``/``-E`` arguments."""
+    lower = _parse_time(start)
+    upper = _parse_time(end)
+    if upper is not None and end is not None and _is_date(end):
+        upper += timedelta(days=1)
+    return lower, upper
+
+
+def _split_days(begin: datetime, finish: datetime) -> Iterable[tuple[str, float]]:
+    """Yield ``(day, hours)`` for the part of ``[begin, finish)`` on each day."""
+    cur = begin
+    while cur < finish:
+        midnight = datetime.combine(cur.date() + timedelta(days=1), datetime.min.time())
+        stop = min(finish, midnight)
+        yield cur.date().isoformat(), (stop - cur).total_seconds() / 3600
+        cur = stop
+
+
+def _iter_job_usage(
+    text: str,
+    bounds: tuple[datetime | None, datetime | None] | None = None,
+) -> Iterable[tuple[str, str | None, float, float, float]]:
+    """Yield ``(partition, day, cpu_h, gpu_h, ram_gb_h)`` for each job allocation.
+
+    Without *bounds* every job is counted with its whole ``ElapsedRaw`` and
+    ``day`` ``None``.  Otherwise the run time of a job is taken from its
+    ``Start`` and ``End`` clipped to *bounds* and split at midnight, so a job
+    yields one tuple per day.  Jobs without a known start are still counted
+    by ``ElapsedRaw`` with ``day`` ``None``.
+    """
+    lower, upper = bounds or (None, None)
+    for rec in parse_job_records(text, SACCT_FIELDS):
+        if rec.is_step:
+            # skip job steps to avoid double counting
+            continue
+        cpus, gpus, mem_gb, part = rec.ncpus, rec.gpus, rec.mem_gb, rec.partition
+        began = rec.start
+        if began is None or bounds is None:
+            elapsed_h = rec.elapsed / 3600
+            yield part, None, cpus * elapsed_h, gpus * elapsed_h, mem_gb * elapsed_h
+            continue
+        # running jobs report ``Unknown`` as end
+        finished = rec.end or datetime.now()
+        if lower is not None and began < lower:
+            began = lower
+        if upper is not None and finished > upper:
+            finished = upper
+        for day, hours in _split_days(began, finished):
+            yield part, day, cpus * hours, gpus * hours, mem_gb * hours
+
+
+def for_each_cluster(
+    clusters: Iterable[str], func: Callable[[str], _T]
+) -> Dict[str, _T]:
+    """Return ``func(cluster)`` for all *clusters*, called concurrently.
+
+    Clusters are queried in parallel so the whole query takes about as long
+    as the query of the slowest cluster.
+    """
+    names = list(dict.fromkeys(clusters))
+    if len(names) <= 1:
+        return {name: func(name) for name in names}
+    with ThreadPoolExecutor(max_workers=len(names)) as pool:
+        return dict(zip(names, pool.map(func, names)))
+
+
+def fetch_usage(
+    user: str,
+    start: str,
+    end: str | None = None,
+    *,
+    partitions: Iterable[str] | None = None,
+    clusters: Iterable[str] | None = None,
+) -> dict[str, float]:
+    """Return aggregated GPU/CPU/RAM hours for *user* between *start* and *end*.
+
+    Parameters
+    ----------
+    user:
+        User identifier to query.
+    start:
+        Start date in ``YYYY-MM-DD`` format.
+    end:
+        Optional end date in ``YYYY-MM-DD`` format.
+    partitions:
+        Optional partition names or wildcard patterns to include.
+    clusters:
+        Optional clusters to query with ``-M`` and sum, by default the
+        default cluster.
+    """
+    if clusters:
+        totals = {"cpu_hours": 0.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
+        per_cluster = for_each_cluster(
+            clusters,
+            lambda c: _fetch_usage(user, start, end, partitions, c),
+        )
+        for usage in per_cluster.values():
+            for key in totals:
+                totals[key] += usage[key]
+        return totals
+    return _fetch_usage(user, start, end, partitions, None)
+
+
+def _fetch_usage(
+    user: str,
+    start: str,
+    end: str | None,
+    partitions: Iterable[str] | None,
+    cluster: str | None,
+) -> dict[str, float]:
+    cmd = plan_sacct_command(user, start, end, partitions=partitions, cluster=cluster)
+    if cmd is None:
+        return {"cpu_hours": 0.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
+    output = _run_sacct(cmd)
+    if output is None:
         return {"cpu_hours": 0.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
     cpu_h = gpu_h = ram_h = 0.0
-    for rec in parse_sacct_output(proc.stdout):
-        job_id = rec.get("JobID", "")
-        if "." in job_id:
-            # skip job steps to avoid double counting
+    for part, _, cpu, gpu, ram in _iter_job_usage(output):
+        if partitions and not any(fnmatch.fnmatch(part, pat) for pat in partitions):
             continue
-        if partitions:
-            part = rec.get("Partition", "")
-            if not any(fnmatch.fnmatch(part, pat) for pat in partitions):
-                continue
-        elapsed_h = parse_elapsed(rec.get("Elapsed", "0:0:0"))
-        cpus = int(rec.get("NCPUS", "0"))
-        tres = parse_tres(rec.get("AllocTRES", ""))
-        gpus = int(tres.get("gres/gpu", tres.get("gpu", "0")).split("(")[0] or 0)
-        mem_gb = parse_mem(tres.get("mem", "0"))
-        cpu_h += cpus * elapsed_h
-        gpu_h += gpus * elapsed_h
-        ram_h += mem_gb * elapsed_h
+        cpu_h += cpu
+        gpu_h += gpu
+        ram_h += ram
     return {"cpu_hours": cpu_h, "gpu_hours": gpu_h, "ram_gb_hours": ram_h}
+
+
+def fetch_usage_by_partition(
+    user: str,
+    start: str,
+    end: str | None = None,
+) -> dict[str, dict[str, float]]:
+    """Return GPU/CPU/RAM hours of *user* per partition from one ``sacct`` scan.
+
+    Any partition filter can later be answered from the result with
+    :func:`filter_partition_usage` without querying Slurm again.
+    """
+    return fetch_daily_usage(user, start, end)[0]
+
+
+def fetch_daily_usage(
+    user: str,
+    start: str,
+    end: str | None = None,
+    *,
+    cluster: str | None = None,
+) -> tuple[dict[str, dict[str, float]], dict[str, dict[str, dict[str, float]]]]:
+    """Return the usage of *user* per partition and per day and partition.
+
+    Both results come from the same ``sacct`` scan.  The second maps
+    ``YYYY-MM-DD`` days to per-partition usage, with the time of jobs
+    running over several days split at midnight.  Only the time of jobs
+    inside the period is counted and a plain *end* date includes that day.
+    """
+    cmd = plan_sacct_command(user, start, end, cluster=cluster, truncate=True)
+    output = _run_sacct(cmd) if cmd is not None else None
+    result: dict[str, dict[str, float]] = {}
+    daily: dict[str, dict[str, dict[str, float]]] = {}
+    for part, day, cpu, gpu, ram in _iter_job_usage(
+        output or "", _period_bounds(start, end)
+    ):
+        targets = [result]
+        if day is not None:
+            targets.append(daily.setdefault(day, {}))
+        for target in targets:
+            cur = target.setdefault(
+                part, {"cpu_hours": 0.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
+            )
+            cur["cpu_hours"] += cpu
+            cur["gpu_hours"] += gpu
+            cur["ram_gb_hours"] += ram
+    return result, daily
+
+
+def merge_partition_usage(
+    target: dict[str, dict[str, float]], source: Dict[str, Dict[str, float]]
+) -> None:
+    """Add the per-partition usage *source* to *target* in place."""
+    for part, usage in source.items():
+        cur = target.setdefault(
+            part, {"cpu_hours": 0.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
+        )
+        for key in cur:
+            cur[key] += usage.get(key, 0.0)
+
+
+def fetch_cluster_usage(
+    user: str,
+    start: str,
+    end: str | None,
+    clusters: Iterable[str],
+) -> tuple[
+    dict[str, dict[str, float]],
+    dict[str, dict[str, dict[str, float]]],
+    dict[str, dict[str, dict[str, float]]],
+]:
+    """Return the usage of *user* on several *clusters* queried concurrently.
+
+    The first two results are those of :func:`fetch_daily_usage` summed over
+    all clusters, the third maps every cluster to its own per-partition
+    usage.
+    """
+    per_cluster = for_each_cluster(
+        clusters, lambda c: fetch_daily_usage(user, start, end, cluster=c)
+    )
+    result: dict[str, dict[str, float]] = {}
+    daily: dict[str, dict[str, dict[str, float]]] = {}
+    for breakdown, days in per_cluster.values():
+        merge_partition_usage(result, breakdown)
+        for day, usage in days.items():
+            merge_partition_usage(daily.setdefault(day, {}), usage)
+    return result, daily, {c: b for c, (b, _) in per_cluster.items()}
+
+
+def filter_partition_usage(
+    breakdown: Dict[str, Dict[str, float]],
+    partitions: Iterable[str] | None = None,
+) -> dict[str, float]:
+    """Return the usage totals of the partitions in *breakdown* matching *partitions*.
+
+    Without *partitions* all partitions are included.
+    """
+    patterns = list(partitions or [])
+    totals = {"cpu_hours": 0.0, "gpu_hours": 0.0, "ram_gb_hours": 0.0}
+    for part, usage in breakdown.items():
+        if patterns and not any(fnmatch.fnmatch(part, pat) for pat in patterns):
+            continue
+        for key in totals:
+            totals[key] += float(usage.get(key, 0.0))
+    return totals
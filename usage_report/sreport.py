@@ -1,8 +1,51 @@
 """Utilities for fetching Slurm usage summaries via ``sreport``."""
 from __future__ import annotations
 
+import logging
 import subprocess
-from typing import Iterable, Dict, Optional
+from contextlib import contextmanager
+from datetime import date
+from pathlib import Path
+from typing import Iterable, Dict, Iterator, Optional
+
+from .database import load_sreport_result, store_sreport_result
+from .slurm import for_each_cluster
+
+logger = logging.getLogger(__name__)
+
+USER_REPORT = "cluster UserUtilizationByAccount"
+USER_FORMAT = "Login,Used"
+
+# Database storing results of closed periods, see :func:`sreport_cache`
+_result_db: Path | None = None
+_refresh = False
+
+
+@contextmanager
+def sreport_cache(db_path: str | Path | None, *, refresh: bool = False) -> Iterator[None]:
+    """Store ``sreport`` results in *db_path* for calls within the block.
+
+    Results for periods that ended before today never change and are served
+    from the database afterwards.  With *refresh* they are fetched again and
+    replaced.  ``None`` disables the cache.
+    """
+    global _result_db, _refresh
+    previous = _result_db, _refresh
+    _result_db, _refresh = (Path(db_path) if db_path else None), refresh
+    try:
+        yield
+    finally:
+        _result_db, _refresh = previous
+
+
+def _is_closed(end: str | None) -> bool:
+    """Return whether the period ending on *end* is entirely in the past."""
+    if not end:
+        return False
+    try:
+        return date.fromisoformat(end[:10]) < date.today()
+    except ValueError:
+        return False
 
 
 def parse_sreport_output(text: str) -> Dict[str, float]:
@@ -29,6 +72,9 @@ def fetch_active_usage(
     *,
     active_users: Optional[Iterable[str]] = None,
     partitions: Iterable[str] | None = None,
+    cluster: str | None = None,
+    cache_db: str | Path | None = None,
+    refresh: bool | None = None,
 ) -> Dict[str, object]:
     """Return usage hours for ``active_users`` between ``start`` and ``end``.
 
@@ -45,18 +91,37 @@ def fetch_active_usage(
         Iterable of partitions to include. Only stored in the result for
         reference. ``sreport`` does not support filtering by partitions,
         therefore the argument is ignored when building the command.
+    cluster:
+        Optional cluster to report on (``sreport -M``).
+    cache_db, refresh:
+        Database storing the results of closed periods and whether to
+        replace a stored result.  Default to the settings of
+        :func:`sreport_cache`.
+
+    The result of a closed period covers all users, so later calls for other
+    *active_users* are answered from the database as well.
     """
-    cmd = [
-        "sreport",
-        "cluster",
-        "UserUtilizationByAccount",
-        f"start={start}",
-    ]
-    if end:
-        cmd.append(f"end={end}")
-    cmd.append("format=Login,Used")
-    proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
-    usage = parse_sreport_output(proc.stdout)
+    db_path = Path(cache_db) if cache_db else _result_db
+    refresh = _refresh if refresh is None else refresh
+    key = (cluster or "", start, end or "", USER_REPORT, USER_FORMAT)
+    usage = None
+    if db_path is not None and _is_closed(end) and not refresh:
+        usage = load_sreport_result(*key, db_path=db_path)
+        if usage is not None:
+            logger.debug("Using stored sreport result for %s - %s", start, end)
+    if usage is None:
+        cmd = ["sreport"]
+        if cluster:
+            cmd.extend(["-M", cluster])
+        cmd.extend(USER_REPORT.split())
+        cmd.append(f"start={start}")
+        if end:
+            cmd.append(f"end={end}")
+        cmd.append(f"format={USER_FORMAT}")
+        proc = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        usage = parse_sreport_output(proc.stdout)
+        if db_path is not None and _is_closed(end):
+            store_sreport_result(*key, usage, db_path=db_path)
     if active_users is not None:
         usage = {u: usage.get(u, 0.0) for u in active_users}
     result: Dict[str, object] = {"partitions": list(partitions or [])}
@@ -64,4 +129,35 @@ def fetch_active_usage(
     return result
 
 
-__all__ = ["fetch_active_usage", "parse_sreport_output"]
+def fetch_cluster_active_usage(
+    start: str,
+    end: str | None,
+    clusters: Iterable[str],
+    *,
+    active_users: Optional[Iterable[str]] = None,
+    partitions: Iterable[str] | None = None,
+) -> Dict[str, object]:
+    """Return :func:`fetch_active_usage` summed over several *clusters*.
+
+    The clusters are queried concurrently.  Users are included if they are
+    active on any cluster.
+    """
+    users = list(active_users) if active_users is not None else None
+    per_cluster = for_each_cluster(
+        clusters,
+        lambda c: fetch_active_usage(start, end, active_users=users, cluster=c),
+    )
+    result: Dict[str, object] = {"partitions": list(partitions or [])}
+    for usage in per_cluster.values():
+        for user, used in usage.items():
+            if user != "partitions":
+                result[user] = float(result.get(user, 0.0)) + float(used)  # type: ignore[arg-type]
+    return result
+
+
+__all__ = [
+    "fetch_active_usage",
+    "fetch_cluster_active_usage",
+    "parse_sreport_output",
+    "sreport_cache",
+]